@@ -0,0 +1,168 @@
+import asyncio
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional, Callable
+
+import numpy as np
+import requests
+
+from controller_ext_socket import DMXSocket, KEEPALIVE_SEC
+from eye_motor_ext import CONNECT_TIMEOUT_SEC, READ_TIMEOUT_SEC, FAILURE_BACKOFF_SEC, keep_alive_session, \
+    motor_instruction_data
+from state_machine import SauronEyeTowerStateMachine
+
+DMX_RATE_HZ = 50  # payload checks - a changed payload goes out within one period
+EYE_MOTOR_RATE_HZ = 5  # the ESP answers in tens of milliseconds, the eye turns slowly anyway
+SHOW_RATE_HZ = 10
+DMX_FAILURE_BACKOFF_SEC = 0.5
+
+SHOW_TICK = 'show'
+
+
+@dataclass
+class FrameEvent:
+    frame: np.ndarray
+    done: asyncio.Event  # set by the consumer - the camera task updates the ThermalEye only after it
+
+
+class AsyncTowerRuntime:
+    """
+    do_evil as asyncio tasks - the camera, the DMX controller, the eye motor and the automated show run at their
+    own rates, a slow serial write or ESP request no longer holds up the frames.
+    SauronEyeTowerStateMachine stays the single consumer - frames and show ticks reach it through one event queue
+    and only the consumer task changes its state. The I/O tasks send snapshots of that state, the newest one and
+    one request in flight at a time. Blocking calls (camera read and detection, serial, HTTP) run in worker threads.
+    A None frame (end of stream, camera gone) or 'q' ends the run.
+    """
+
+    def __init__(self, sauron: SauronEyeTowerStateMachine, socket: Optional[DMXSocket] = None,
+                 eye_motor_address: Optional[str] = None,
+                 post_motor_instruction: Optional[Callable[[dict], None]] = None,
+                 dmx_rate_hz=DMX_RATE_HZ, eye_motor_rate_hz=EYE_MOTOR_RATE_HZ, show_rate_hz=SHOW_RATE_HZ):
+        if not sauron.non_blocking_moves:
+            raise ValueError('AsyncTowerRuntime needs non_blocking_moves - move_to blocks until the camera stops')
+
+        self.sauron = sauron
+
+        # the tasks own the controller, the state machine only decides
+        self.socket = socket if socket is not None else sauron.socket
+        sauron.socket = None
+
+        self.eye_motor_url = f'http://{eye_motor_address}/json_client' if eye_motor_address else None
+        self.session = keep_alive_session() if self.eye_motor_url and post_motor_instruction is None else None
+        self.post_motor_instruction = post_motor_instruction or (self.post_to_esp if self.eye_motor_url else None)
+
+        self.dmx_period = 1 / dmx_rate_hz
+        self.eye_motor_period = 1 / eye_motor_rate_hz
+        self.show_period = 1 / show_rate_hz
+
+        self.events: Optional[asyncio.Queue] = None
+        self.is_show_tick_pending = False
+
+        self.frames_count = 0
+        self.dmx_sent_count = 0
+        self.eye_motor_sent_count = 0
+
+    def post_to_esp(self, data: dict):
+        response = self.session.post(self.eye_motor_url, json=data, timeout=(CONNECT_TIMEOUT_SEC, READ_TIMEOUT_SEC))
+        response.raise_for_status()
+
+    async def run(self):
+        self.events = asyncio.Queue()
+        self.sauron.set_beam_speed(1)
+
+        tasks = [asyncio.create_task(self.run_camera(), name='camera'),
+                 asyncio.create_task(self.run_state_machine(), name='state_machine'),
+                 asyncio.create_task(self.run_show(), name='show')]
+        if self.socket is not None:
+            tasks.append(asyncio.create_task(self.run_dmx(), name='dmx'))
+        if self.post_motor_instruction is not None:
+            tasks.append(asyncio.create_task(self.run_eye_motor(), name='eye_motor'))
+
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        try:
+            for task in done:
+                task.result()  # re-raises what ended the run
+        finally:
+            if self.socket is not None:
+                # the last decision reaches the controller
+                await asyncio.to_thread(self.socket.send_json, self.sauron.instruction_payload(), False)
+            if self.session is not None:
+                self.session.close()
+
+    async def run_camera(self):
+        while True:
+            frame = await asyncio.to_thread(self.sauron.update_frame)
+            if frame is None:
+                return
+
+            event = FrameEvent(frame=frame, done=asyncio.Event())
+            await self.events.put(event)
+            await event.done.wait()  # backpressure - the next frame waits for the decision on this one
+
+    async def run_state_machine(self):
+        while True:
+            event = await self.events.get()
+            if event == SHOW_TICK:
+                self.is_show_tick_pending = False
+                self.sauron.maybe_start_automated_show()
+                if self.sauron.automated_show_ends_at is not None:
+                    self.sauron.advance_automated_led_show()
+                continue
+
+            if self.sauron.metrics:
+                self.sauron.metrics.loop_tick()
+            try:
+                key_pressed = self.sauron.evil_step(event.frame, advance_show=False)
+            finally:
+                event.done.set()
+
+            self.frames_count += 1
+            if key_pressed == ord('q'):
+                return
+
+    async def run_show(self):
+        while True:
+            # at most one tick queued - a busy consumer does not pile them up
+            if not self.is_show_tick_pending:
+                self.is_show_tick_pending = True
+                self.events.put_nowait(SHOW_TICK)
+            await asyncio.sleep(self.show_period)
+
+    async def run_dmx(self):
+        keepalive_sec = getattr(self.socket, 'keepalive_sec', KEEPALIVE_SEC)
+        last_sent, last_sent_at = None, None
+        while True:
+            payload = self.sauron.instruction_payload()
+            now = monotonic()
+            if payload != last_sent or now - last_sent_at >= keepalive_sec:
+                try:
+                    await asyncio.to_thread(self.socket.send_json, payload, False)
+                except OSError as e:
+                    print(f'dmx I/O error - {e}')
+                    await asyncio.sleep(DMX_FAILURE_BACKOFF_SEC)
+                    continue
+                last_sent, last_sent_at = payload, now
+                self.dmx_sent_count += 1
+
+            await asyncio.sleep(self.dmx_period)
+
+    async def run_eye_motor(self):
+        last_sent = None
+        while True:
+            data = motor_instruction_data(self.sauron.motor_on, self.sauron.deg_coordinate.x)
+            if data != last_sent:
+                try:
+                    await asyncio.to_thread(self.post_motor_instruction, data)
+                except requests.RequestException as e:
+                    print(f'eye motor instruction failed - {e}')
+                    await asyncio.sleep(FAILURE_BACKOFF_SEC)
+                    continue
+                last_sent = data
+                self.eye_motor_sent_count += 1
+
+            await asyncio.sleep(self.eye_motor_period)
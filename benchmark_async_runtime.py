@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+from time import monotonic, sleep
+
+import numpy as np
+
+from async_runtime import AsyncTowerRuntime
+from benchmark_target_tracking import TowerCapture, SCENE_MARGIN
+from display_sink import KeyboardInput, NullDisplaySink, NO_KEY
+from session_recording import ReplayDMXSocket
+from state_machine import SauronEyeTowerStateMachine
+from synthetic_thermal import SyntheticThermalClip
+from target_tracker import TargetTracker
+from thermal_camera import ThermalEye
+from utills import DegVector
+
+FRAMES = 250
+DMX_LATENCY_SEC = 0.03  # a blocking serial write + the controller's reply
+EYE_MOTOR_LATENCY_SEC = 0.12  # an ESP request over a weak Wi-Fi
+
+
+class SlowDMXSocket(ReplayDMXSocket):
+    def __init__(self, latency_sec):
+        super().__init__()
+        self.latency_sec = latency_sec
+
+    def send_json(self, instruction_payload=None, print_return_payload=True):
+        sleep(self.latency_sec)
+        return super().send_json(instruction_payload, print_return_payload)
+
+
+class SlowEyeMotor:
+    """ The eye motor posted from the loop, like send_motor_instruction - every update waits for the ESP """
+
+    def __init__(self, latency_sec):
+        self.latency_sec = latency_sec
+        self.sent_count = 0
+
+    def update(self, display_on: bool, eye_azimuth: int = 0):
+        self.post(None)
+
+    def post(self, data):
+        sleep(self.latency_sec)
+        self.sent_count += 1
+
+    def close(self):
+        pass
+
+
+class FrameAgeRecorder(KeyboardInput):
+    """ Read once per tick - how old the frame the decision was made on is, quits after `frames` ticks """
+
+    def __init__(self, thermal_eye: ThermalEye, frames):
+        self.thermal_eye = thermal_eye
+        self.frames = frames
+        self.ticks_at = []
+        self.frame_ages = []
+
+    def read_key(self) -> int:
+        if len(self.ticks_at) >= self.frames:
+            return ord('q')
+
+        now = monotonic()
+        self.ticks_at.append(now)
+        self.frame_ages.append(now - self.thermal_eye.frame_timestamp)
+        return NO_KEY
+
+
+def build_tower(frames, dmx_latency_sec, seed):
+    clip = SyntheticThermalClip(blobs=40, scene_margin=SCENE_MARGIN, warm_areas=40, background_blur=3, seed=seed)
+    capture = TowerCapture(clip)
+    thermal_eye = ThermalEye(capture, compensate_ego_motion=True)
+
+    sauron = SauronEyeTowerStateMachine(is_manual=False, socket=SlowDMXSocket(dmx_latency_sec),
+                                        thermal_eye=thermal_eye, display=NullDisplaySink(), non_blocking_moves=True,
+                                        tracker=TargetTracker())
+    sauron.deg_coordinate = DegVector(capture.origin.x, capture.origin.y)
+    sauron.goal_deg_coordinate = DegVector(capture.origin.x, capture.origin.y)
+    capture.sauron = sauron
+
+    recorder = FrameAgeRecorder(thermal_eye, frames)
+    sauron.keyboard = recorder
+    return sauron, recorder
+
+
+def run_sync(frames, dmx_latency_sec, eye_motor_latency_sec, seed):
+    sauron, recorder = build_tower(frames, dmx_latency_sec, seed)
+    eye_motor = SlowEyeMotor(eye_motor_latency_sec)
+    sauron.eye_motor = eye_motor
+    sauron.do_evil()
+    return recorder, len(sauron.socket.sent_payloads), eye_motor.sent_count
+
+
+def run_async(frames, dmx_latency_sec, eye_motor_latency_sec, seed):
+    sauron, recorder = build_tower(frames, dmx_latency_sec, seed)
+    eye_motor = SlowEyeMotor(eye_motor_latency_sec)
+    socket = sauron.socket
+    runtime = AsyncTowerRuntime(sauron, post_motor_instruction=eye_motor.post)
+    asyncio.run(runtime.run())
+    return recorder, len(socket.sent_payloads), eye_motor.sent_count
+
+
+def run_benchmark(frames, dmx_latency_sec, eye_motor_latency_sec, seed=0):
+    print(f'{frames} frames, camera at 25 fps, DMX {dmx_latency_sec * 1e3:.0f} ms, '
+          f'eye motor {eye_motor_latency_sec * 1e3:.0f} ms per request')
+    for name, run in [('do_evil', run_sync), ('asyncio runtime', run_async)]:
+        recorder, dmx_sent, eye_motor_sent = run(frames, dmx_latency_sec, eye_motor_latency_sec, seed)
+        ticks_at = np.array(recorder.ticks_at)
+        gaps_ms = np.diff(ticks_at) * 1e3
+        ages_ms = np.array(recorder.frame_ages) * 1e3
+        print(f'{name:<16} | {(len(ticks_at) - 1) / (ticks_at[-1] - ticks_at[0]):5.1f} fps | '
+              f'frame age p50 {np.percentile(ages_ms, 50):6.1f} ms, p95 {np.percentile(ages_ms, 95):6.1f} ms | '
+              f'longest tick gap {gaps_ms.max():6.1f} ms | DMX sent {dmx_sent}, eye motor sent {eye_motor_sent}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='do_evil vs the asyncio runtime with a slow controller and eye '
+                                                 'motor - frame rate and how stale the decisions are')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--dmx-latency', type=float, default=DMX_LATENCY_SEC)
+    parser.add_argument('--eye-motor-latency', type=float, default=EYE_MOTOR_LATENCY_SEC)
+    args = parser.parse_args()
+
+    run_benchmark(args.frames, args.dmx_latency, args.eye_motor_latency)
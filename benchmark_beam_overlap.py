@@ -0,0 +1,67 @@
+import timeit
+
+import cv2
+import numpy as np
+
+from utills import BEAM_RADIUS, COLOR_WHITE, COLOR_BLACK, FULL_SHAPE_THICKNESS, rects_circle_overlap
+
+RESOLUTIONS = [(640, 480), (1280, 1024)]
+CONTOURS_PER_FRAME = [1, 3, 100]
+REPEATS = 20
+
+
+def mask_is_target_in_circle(frame, rect):
+    # The original full-frame mask implementation of utills.is_target_in_circle
+    x, y, w, h = rect
+    mask_frame = np.zeros(frame.shape)
+    center_of_circle = (frame.shape[1] // 2, frame.shape[0] // 2)
+
+    cv2.circle(mask_frame, center_of_circle, BEAM_RADIUS, COLOR_WHITE, FULL_SHAPE_THICKNESS)
+    beam_mask_frame_sum = mask_frame.sum()
+
+    cv2.rectangle(mask_frame, (x, y), (x + w, y + h), COLOR_BLACK, FULL_SHAPE_THICKNESS)
+    beam_and_target_frame_sum = mask_frame.sum()
+
+    return beam_mask_frame_sum != beam_and_target_frame_sum
+
+
+def random_rects(frame_w, frame_h, count, rng):
+    x = rng.integers(frame_w // 2 - 100, frame_w // 2 + 100, count)
+    y = rng.integers(frame_h // 2 - 100, frame_h // 2 + 100, count)
+    w = rng.integers(2, 30, count)
+    h = rng.integers(2, 30, count)
+    return np.stack([x, y, w, h], axis=1)
+
+
+def run_benchmark():
+    rng = np.random.default_rng(42)
+
+    for frame_w, frame_h in RESOLUTIONS:
+        frame = np.zeros((frame_h, frame_w, 3), dtype=np.uint8)
+        center = (frame_w // 2, frame_h // 2)
+
+        for count in CONTOURS_PER_FRAME:
+            rects = random_rects(frame_w, frame_h, count, rng)
+            rect_tuples = [tuple(int(v) for v in r) for r in rects]
+
+            mask_results = [mask_is_target_in_circle(frame, r) for r in rect_tuples]
+            analytic_results = rects_circle_overlap(rects, center, BEAM_RADIUS, frame.shape)
+            assert mask_results == analytic_results.tolist(), 'analytic result differs from mask result'
+
+            mask_sec = timeit.timeit(lambda: [mask_is_target_in_circle(frame, r) for r in rect_tuples],
+                                     number=REPEATS) / REPEATS
+            analytic_sec = timeit.timeit(lambda: rects_circle_overlap(rects, center, BEAM_RADIUS, frame.shape),
+                                         number=REPEATS) / REPEATS
+            area_sec = timeit.timeit(lambda: rects_circle_overlap(rects, center, BEAM_RADIUS, frame.shape,
+                                                                  return_area=True),
+                                     number=REPEATS) / REPEATS
+
+            print(f'{frame_w}x{frame_h} {count:>3} contours: '
+                  f'mask {mask_sec * 1000:9.3f} ms | '
+                  f'analytic {analytic_sec * 1000:7.3f} ms | '
+                  f'analytic+area {area_sec * 1000:7.3f} ms | '
+                  f'x{mask_sec / analytic_sec:,.0f}')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,126 @@
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from camera_pool import CameraPool, CameraSpec, PooledThermalEye, open_capture, camera_detections
+from synthetic_thermal import SyntheticThermalClip
+from thermal_camera import ThermalEye
+from utills import DegVector
+
+FRAMES = 300
+CAMERA_COUNTS = (1, 2, 4)
+BLOBS = 40
+FPS = 25
+
+
+def write_clip(path: Path, frames, seed):
+    # file-backed camera - MJPEG like the thermal USB cameras deliver
+    clip = SyntheticThermalClip(blobs=BLOBS, noise=2.0, seed=seed)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), FPS, (clip.width, clip.height))
+    for frame in clip.frames(frames):
+        writer.write(frame)
+    writer.release()
+
+
+def run_single_process(specs):
+    # every camera on the control loop's core, one frame of each in turn
+    eyes = [ThermalEye(open_capture(spec), **spec.eye_kwargs) for spec in specs]
+    frames, detections = [0] * len(specs), [0] * len(specs)
+    is_ended = [False] * len(specs)
+
+    start = time.perf_counter()
+    while not all(is_ended):
+        for camera_index, (eye, spec) in enumerate(zip(eyes, specs)):
+            if is_ended[camera_index]:
+                continue
+            eye.update_frame()
+            if eye.frame is None:
+                is_ended[camera_index] = True
+                continue
+            frames[camera_index] += 1
+            detections[camera_index] += len(camera_detections(eye, spec, camera_index, frames[camera_index],
+                                                              DegVector()).degrees)
+    elapsed = time.perf_counter() - start
+
+    for eye in eyes:
+        eye.cap.release()
+    return sum(frames), sum(detections), elapsed, elapsed
+
+
+def run_pool(specs, frames_per_camera):
+    # a queue large enough for every message - nothing is dropped, the detections can be compared
+    pool = CameraPool(specs, queue_size=(frames_per_camera + 1) * len(specs))
+    frames, detections = [0] * len(specs), [0] * len(specs)
+
+    start = time.perf_counter()
+    pool.start()
+    first_at = None
+    while True:
+        received = pool.poll()
+        if not received and not pool.is_running:
+            break
+        first_at = first_at or time.perf_counter()
+        for d in received:
+            frames[d.camera_index] = max(frames[d.camera_index], d.seq)
+            detections[d.camera_index] += len(d.degrees)
+    end = time.perf_counter()
+    pool.close()
+
+    # wall time with the process start up, and from the first detections on
+    return sum(frames), sum(detections), end - start, end - (first_at or start)
+
+
+def merged_candidates(specs):
+    thermal_eye = PooledThermalEye(CameraPool(specs).start())
+    counts = []
+    try:
+        while True:
+            thermal_eye.update_frame()
+            if thermal_eye.frame is None:
+                break
+            counts.append(len(thermal_eye.moving_contours))
+    finally:
+        thermal_eye.close_eye()
+    return float(np.mean(counts)) if counts else 0.0
+
+
+def run_benchmark(frames, camera_counts):
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f'{frames} frames per camera, {BLOBS} blobs, {cores} cores available')
+
+    with tempfile.TemporaryDirectory() as clips_dir:
+        paths = [Path(clips_dir) / f'camera_{i}.avi' for i in range(max(camera_counts))]
+        for seed, path in enumerate(paths):
+            write_clip(path, frames, seed)
+
+        for cameras in camera_counts:
+            specs = [CameraSpec(path, name=path.stem) for path in paths[:cameras]]
+            single = run_single_process(specs)
+            pooled = run_pool(specs, frames)
+
+            (single_frames, single_detections, single_sec, _) = single
+            (pool_frames, pool_detections, pool_sec, pool_steady_sec) = pooled
+            print(f'{cameras} cameras | single process {single_frames / single_sec:7.1f} fps | '
+                  f'pool {pool_frames / pool_sec:7.1f} fps, {pool_frames / pool_steady_sec:7.1f} fps after start up '
+                  f'(x{single_sec / pool_steady_sec:4.2f}) | '
+                  f'same detections: {single_frames == pool_frames and single_detections == pool_detections}')
+
+        # two cameras on the same view - every target is seen twice and merged once
+        one = merged_candidates([CameraSpec(paths[0])])
+        two = merged_candidates([CameraSpec(paths[0]), CameraSpec(paths[0])])
+        print(f'merged candidates per frame | one camera {one:5.1f}, two overlapping cameras {two:5.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Camera pool - a worker process per camera vs every camera '
+                                                 'on one process, file-backed synthetic cameras')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--cameras', type=int, nargs='+', default=list(CAMERA_COUNTS))
+    args = parser.parse_args()
+
+    run_benchmark(args.frames, args.cameras)
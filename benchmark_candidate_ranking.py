@@ -0,0 +1,115 @@
+import argparse
+import time
+
+import numpy as np
+
+from degree_lut import PixelDegreeLUT
+from session_recording import ReplayThermalEye
+from synthetic_thermal import SyntheticThermalClip, SyntheticCapture
+from thermal_camera import ThermalEye, MIN_AREA_TO_CONSIDER, MAX_AREA_TO_CONSIDER, BEAM_RADIUS
+from utills import DegVector, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+from utills import DEGREES_X_MIN, DEGREES_X_MAX, DEGREES_Y_MIN, DEGREES_Y_MAX
+
+FRAMES = 150
+SEARCH_RADII = (BEAM_RADIUS, 3 * BEAM_RADIUS, 42_000)  # locked, locked for a while, searching
+SCALE_JITTER = 0.3  # calibrated pixels per degree vary this much around the constants
+CACHED_PROPERTIES = ('center_point', 'distance_from_center', 'direction_vector')
+
+
+def jittered_degree_lut(frame_w, frame_h, seed=0):
+    # LUT of a made-up calibration, the pixels per degree of every point vary around the constants
+    rng = np.random.default_rng(seed)
+    mapper = {}
+    for x_degree in range(DEGREES_X_MIN, DEGREES_X_MAX + 1):
+        for y_degree in range(DEGREES_Y_MIN, DEGREES_Y_MAX + 1):
+            x_pixels, y_pixels = rng.uniform(1 - SCALE_JITTER, 1 + SCALE_JITTER, 2) * \
+                                 (X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST)
+            mapper[(x_degree, y_degree)] = {(1, 0): x_pixels, (-1, 0): x_pixels, (0, 1): y_pixels, (0, -1): y_pixels}
+    return PixelDegreeLUT.from_mapper(mapper, frame_w, frame_h)
+
+
+def legacy_rank(thermal_eye: ThermalEye, frame_deg_coordinate, search_radius, degree_lut=None):
+    # The calculate_state filter before the array stage - Contour by Contour, then find_closest_target on the top 3
+    filtered = [c for c in thermal_eye.moving_contours
+                if c.get_abs_degree_location(frame_deg_coordinate, degree_lut).is_inside_border
+                and (MIN_AREA_TO_CONSIDER < c.area < MAX_AREA_TO_CONSIDER)
+                and c.distance_from_center < search_radius]
+    top = filtered[:3]
+    return filtered, top[0] if top else None, thermal_eye.find_closest_target(top)
+
+
+def array_rank(thermal_eye: ThermalEye, frame_deg_coordinate, search_radius, degree_lut=None):
+    indices, largest, closest = thermal_eye.rank_candidates(frame_deg_coordinate, search_radius, degree_lut)
+    contours = thermal_eye.moving_contours
+    return ([contours[i] for i in indices], contours[largest] if largest is not None else None,
+            contours[closest] if closest is not None else None)
+
+
+def forget_frame_caches(thermal_eye: ThermalEye):
+    # every rank runs as on a fresh frame - no cached Contour properties, no contour arrays or grid
+    thermal_eye.contour_arrays, thermal_eye.contour_grid = None, None
+    for c in thermal_eye.moving_contours:
+        for name in CACHED_PROPERTIES:
+            c.__dict__.pop(name, None)
+
+
+def is_same_result(expected, found):
+    (expected_filtered, expected_largest, expected_closest), (filtered, largest, closest) = expected, found
+    return (len(expected_filtered) == len(filtered) and all(a is b for a, b in zip(expected_filtered, filtered))
+            and expected_largest is largest and expected_closest is closest)
+
+
+def synthetic_eye(frames, use_contour_batch, seed=0):
+    clip = SyntheticThermalClip(blobs=300, noise=2.0, seed=seed)
+    thermal_eye = ThermalEye(SyntheticCapture(clip, frames_count=frames), use_contour_batch=use_contour_batch)
+    # the camera walks over the degree range, the beam limits cut the frame differently every frame
+    deg_coordinates = (DegVector(35 + (i // 4) % 110, -25 + (i // 10) % 34) for i in range(frames))
+    return thermal_eye, lambda: next(deg_coordinates)
+
+
+def run_benchmark(frames, use_contour_batch, recording=None):
+    if recording:
+        thermal_eye = ReplayThermalEye(recording, use_contour_batch=use_contour_batch)
+        next_deg_coordinate = lambda: thermal_eye.recorded_deg_coordinate
+    else:
+        thermal_eye, next_deg_coordinate = synthetic_eye(frames, use_contour_batch)
+
+    degree_luts = {'constants': None, 'calibrated LUT': jittered_degree_lut(thermal_eye.FRAME_W, thermal_eye.FRAME_H)}
+    timings = {(lut, radius): [0.0, 0.0] for lut in degree_luts for radius in SEARCH_RADII}
+    mismatches, contours_count, frames_count = 0, 0, 0
+
+    while frames_count < frames:
+        thermal_eye.update_frame()
+        if thermal_eye.frame is None:
+            break
+        frames_count += 1
+        contours_count += len(thermal_eye.moving_contours)
+        frame_deg_coordinate = next_deg_coordinate()
+
+        for (lut_name, radius), timing in timings.items():
+            degree_lut = degree_luts[lut_name]
+            results = []
+            for i, rank in enumerate([legacy_rank, array_rank]):
+                forget_frame_caches(thermal_eye)
+                start = time.perf_counter()
+                results.append(rank(thermal_eye, frame_deg_coordinate, radius, degree_lut))
+                timing[i] += time.perf_counter() - start
+
+            mismatches += not is_same_result(*results)
+
+    mode = 'ContourBatch' if use_contour_batch else 'findContours'
+    print(f'{frames_count} frames, {contours_count / frames_count:.0f} contours per frame ({mode}), '
+          f'{mismatches} results differ')
+    for (lut_name, radius), (legacy_sec, array_sec) in timings.items():
+        print(f'{lut_name:<15} radius {radius:>5} px | per contour {legacy_sec / frames_count * 1e3:7.3f} ms, '
+              f'arrays {array_sec / frames_count * 1e3:7.3f} ms (x{legacy_sec / array_sec:5.1f})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='calculate_state candidate filter - per contour vs array stage')
+    parser.add_argument('--recording', help='session recording, a synthetic crowd otherwise')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--contour-batch', action='store_true')
+    args = parser.parse_args()
+
+    run_benchmark(args.frames, args.contour_batch, args.recording)
@@ -0,0 +1,185 @@
+import argparse
+import timeit
+
+import cv2
+import numpy as np
+
+from calibration_scheduler import CalibrationScheduler, COARSE_STRIDE
+from degree_lut import PixelDegreeLUT
+from frame_utills import find_displacement, expected_pixel_shift, calc_pixel_shift_between_frames, \
+    DISPLACEMENT_MIN_CONFIDENCE
+from session_recording import read_chunks, decode_frame_chunk, CHUNK_FRAME
+from synthetic_thermal import SyntheticThermalClip
+from utills import DegVector, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+
+FRAME_W, FRAME_H = 640, 480
+SCALE_JITTER = 0.3  # true pixels per degree vary this much around the constants, like the real lens
+PAIRS = 40
+REPEATS = 3
+
+
+def legacy_change_in_pixels(frame_origin_point, frame_post_move):
+    # The original calc_change_in_pixels search, without the imshow calls - (dx, dy) or None
+    h, w = frame_origin_point.shape[:2]
+    third_y, third_x = h // 3, w // 3
+    crop_img = frame_origin_point[third_y: 2 * third_y, third_x: 2 * third_x]
+
+    res = cv2.matchTemplate(frame_post_move, crop_img, cv2.TM_CCOEFF_NORMED)
+    loc = np.where(res >= 0.95)
+    for pt in zip(*loc[::-1]):
+        return pt[0] - third_x, pt[1] - third_y
+    return None
+
+
+def synthetic_scene(seed=0):
+    clip = SyntheticThermalClip(width=FRAME_W * 2, height=FRAME_H * 2, blobs=60, blob_radius=12, noise=0, seed=seed)
+    return clip.next_frame()
+
+
+def shifted_pair(scene, shift_x, shift_y, x0=FRAME_W // 2, y0=FRAME_H // 2):
+    # origin window and the window after the content moved by (shift_x, shift_y)
+    origin = scene[y0:y0 + FRAME_H, x0:x0 + FRAME_W].copy()
+    post = scene[y0 - shift_y:y0 - shift_y + FRAME_H, x0 - shift_x:x0 - shift_x + FRAME_W].copy()
+    return origin, post
+
+
+def check_mapper_units(scene):
+    # A mapper measured on a lens that matches the constants must aim exactly like no mapper at all
+    x_shift = calc_pixel_shift_between_frames(*shifted_pair(scene, X_PIXEL_TO_DEGREE_NORM_CONST, 0), DegVector(1, 0))
+    y_shift = calc_pixel_shift_between_frames(*shifted_pair(scene, 0, Y_PIXEL_TO_DEGREE_NORM_CONST), DegVector(0, 1))
+    assert abs(x_shift - X_PIXEL_TO_DEGREE_NORM_CONST) < 0.5, f'{x_shift} px measured for a 13 px shift'
+    assert abs(y_shift - Y_PIXEL_TO_DEGREE_NORM_CONST) < 0.5, f'{y_shift} px measured for an 11 px shift'
+
+    def mapper(x_value, y_value):
+        return {(x_degree, y_degree): {(1, 0): x_value, (-1, 0): x_value, (0, 1): y_value, (0, -1): y_value}
+                for x_degree in range(60, 120, 5) for y_degree in range(-5, 15, 5)}
+
+    constants = PixelDegreeLUT.from_mapper(None, FRAME_W, FRAME_H)
+    columns = np.arange(0, FRAME_W, 8)
+    rows = np.linspace(0, FRAME_H - 1, len(columns)).astype(int)
+
+    # halved values of calibration files recorded before are out of the plausible range - the constants are used
+    for name, mapper_dict in [('measured', mapper(x_shift, y_shift)), ('legacy halved', mapper(6, 5))]:
+        lut = PixelDegreeLUT.from_mapper(mapper_dict, FRAME_W, FRAME_H)
+        for frame_degree in [DegVector(70, 0), DegVector(90, 5), DegVector(110, 10)]:
+            difference = np.abs(lut.get_abs_degree_locations(frame_degree, columns, rows, truncate=False) -
+                                constants.get_abs_degree_locations(frame_degree, columns, rows, truncate=False))
+            assert difference.max() < 0.1, f'{name} mapper aims {difference.max():.2f} degrees off the constants'
+    print(f'mapper units: {x_shift:.2f} / {y_shift:.2f} px per degree measured, LUT matches the constants')
+
+
+def check_coarse_steps(scene):
+    # Coarse scheduler steps are several degrees long - they must still come out per one degree
+    scheduler = CalibrationScheduler(sauron=None, mapper_dict={}, show_debug_frames=False)
+    steps = [((1, 0), X_PIXEL_TO_DEGREE_NORM_CONST), ((0, 1), Y_PIXEL_TO_DEGREE_NORM_CONST)]
+    for direction, pixels_per_degree in steps:
+        origin, post = shifted_pair(scene, direction[0] * pixels_per_degree * COARSE_STRIDE,
+                                    direction[1] * pixels_per_degree * COARSE_STRIDE)
+        origin_point, point = (90, 0), (90 + direction[0] * COARSE_STRIDE, direction[1] * COARSE_STRIDE)
+        scheduler._frames[origin_point] = origin
+        scheduler.measure(origin_point, point, direction, COARSE_STRIDE, post)
+
+        measured = scheduler.mapper_dict[origin_point][direction]
+        assert abs(measured - pixels_per_degree) < 0.5, f'{measured} px per degree for {pixels_per_degree}'
+
+    # a failed match leaves the measurement missing instead of storing 0
+    scheduler = CalibrationScheduler(sauron=None, mapper_dict={}, show_debug_frames=False)
+    origin, _ = shifted_pair(scene, 0, 0)
+    scheduler._frames[(90, 0)] = origin
+    scheduler.measure((90, 0), (94, 0), (1, 0), COARSE_STRIDE, np.zeros_like(origin))
+    assert not scheduler.mapper_dict, f'failed match stored {scheduler.mapper_dict}'
+    print(f'coarse calibration steps: {COARSE_STRIDE} degree steps measure the px per degree, failures are not stored')
+
+
+def synthetic_pairs(count, seed=0):
+    # (origin, post, direction, true shift) - windows of a large textured scene, shifted by a degree step
+    rng = np.random.default_rng(seed)
+    scene = synthetic_scene(seed)
+
+    pairs = []
+    for i in range(count):
+        direction = [DegVector(1, 0), DegVector(0, 1), DegVector(-1, 0), DegVector(0, -1)][i % 4]
+        expected_x, expected_y = expected_pixel_shift(direction)
+        true_x = int(round(expected_x * (1 + rng.uniform(-SCALE_JITTER, SCALE_JITTER))))
+        true_y = int(round(expected_y * (1 + rng.uniform(-SCALE_JITTER, SCALE_JITTER))))
+
+        x0, y0 = int(rng.integers(40, FRAME_W - 40)), int(rng.integers(40, FRAME_H - 40))
+        origin = scene[y0:y0 + FRAME_H, x0:x0 + FRAME_W]
+        # content moves by +true shift - the post window starts -true shift away
+        post = scene[y0 - true_y:y0 - true_y + FRAME_H, x0 - true_x:x0 - true_x + FRAME_W]
+
+        noise = rng.normal(0, 2, post.shape)
+        post = np.clip(post + noise, 0, 255).astype(np.uint8)
+        pairs.append((origin.copy(), post, direction, (true_x, true_y)))
+    return pairs
+
+
+def recorded_pairs(file_path):
+    # Last frame at a degree coordinate and the last frame at the next one, for single degree steps
+    settled = []
+    for _, _, payload in read_chunks(file_path, tags={CHUNK_FRAME}):
+        frame, deg_coordinate = decode_frame_chunk(payload)
+        if settled and settled[-1][1] == deg_coordinate:
+            settled[-1] = (frame, deg_coordinate)
+        else:
+            settled.append((frame, deg_coordinate))
+
+    pairs = []
+    for (origin, origin_deg), (post, post_deg) in zip(settled, settled[1:]):
+        direction = post_deg - origin_deg
+        if abs(direction.x) + abs(direction.y) == 1:
+            pairs.append((origin, post, direction, None))
+    return pairs
+
+
+def run_benchmark(pairs):
+    legacy_errors, pyramid_errors = [], []
+    legacy_misses = pyramid_misses = 0
+    legacy_sec = pyramid_sec = 0.0
+    agreement = []
+
+    for origin, post, direction, true_shift in pairs:
+        expected = expected_pixel_shift(direction)
+
+        legacy_sec += timeit.timeit(lambda: legacy_change_in_pixels(origin, post), number=REPEATS) / REPEATS
+        pyramid_sec += timeit.timeit(lambda: find_displacement(origin, post, expected), number=REPEATS) / REPEATS
+
+        legacy = legacy_change_in_pixels(origin, post)
+        displacement = find_displacement(origin, post, expected)
+        if displacement is not None and displacement.confidence < DISPLACEMENT_MIN_CONFIDENCE:
+            displacement = None
+
+        legacy_misses += legacy is None
+        pyramid_misses += displacement is None
+
+        if legacy is not None and displacement is not None:
+            agreement.append(np.hypot(legacy[0] - displacement.dx, legacy[1] - displacement.dy))
+
+        if true_shift is not None:
+            if legacy is not None:
+                legacy_errors.append(np.hypot(legacy[0] - true_shift[0], legacy[1] - true_shift[1]))
+            if displacement is not None:
+                pyramid_errors.append(np.hypot(displacement.dx - true_shift[0], displacement.dy - true_shift[1]))
+
+    count = len(pairs)
+    print(f'{count} pairs')
+    print(f'legacy full frame matchTemplate: {legacy_sec / count * 1000:7.2f} ms per pair, '
+          f'{legacy_misses} not found' +
+          (f', mean error {np.mean(legacy_errors):.2f} px' if legacy_errors else ''))
+    print(f'pyramid window search:           {pyramid_sec / count * 1000:7.2f} ms per pair, '
+          f'{pyramid_misses} not found' +
+          (f', mean error {np.mean(pyramid_errors):.2f} px' if pyramid_errors else '') +
+          f', x{legacy_sec / pyramid_sec:.1f}')
+    if agreement:
+        print(f'mean difference where both found a match: {np.mean(agreement):.2f} px')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pyramid displacement search vs the legacy calc_change_in_pixels')
+    parser.add_argument('--recording', help='session recording of a calibration run, synthetic pairs otherwise')
+    parser.add_argument('--pairs', type=int, default=PAIRS)
+    args = parser.parse_args()
+
+    check_mapper_units(synthetic_scene())
+    check_coarse_steps(synthetic_scene())
+    run_benchmark(recorded_pairs(args.recording) if args.recording else synthetic_pairs(args.pairs))
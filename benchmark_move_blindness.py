@@ -0,0 +1,72 @@
+import argparse
+
+import numpy as np
+
+from synthetic_thermal import SyntheticThermalClip, SyntheticCapture
+from thermal_camera import ThermalEye
+
+SCENE_MARGIN = 240
+MOVES = 12
+MOVE_FRAMES = 6  # frames the camera pans for
+PAN_SPEED_PX = 12  # pixels per frame while panning
+STILL_FRAMES = 15  # frames between moves
+BLIND_AREA_FRACTION = 0.01  # a still scene with a few people never has this much foreground
+
+CONFIGURATIONS = {
+    'contour area movement': dict(),
+    'ego-motion movement': dict(use_ego_motion=True),
+    'ego-motion compensated': dict(compensate_ego_motion=True),
+    'ego-motion compensated 1/2': dict(compensate_ego_motion=True, detection_scale=2),
+}
+
+
+def foreground_area(thermal_eye: ThermalEye):
+    return sum(c.area for c in thermal_eye.moving_contours)
+
+
+def run_configuration(thermal_eye_kwargs, moves=MOVES, seed=0):
+    rng = np.random.default_rng(seed)
+    clip = SyntheticThermalClip(blobs=15, scene_margin=SCENE_MARGIN, warm_areas=12,
+                                background_blur=3, seed=seed)
+    thermal_eye = ThermalEye(SyntheticCapture(clip), **thermal_eye_kwargs)
+    blind_area = thermal_eye.FRAME_TOTAL_AREA * BLIND_AREA_FRACTION
+
+    for _ in range(STILL_FRAMES):
+        thermal_eye.update_frame()
+
+    blind_while_moving, blind_after_stop, dirty_while_moving = [], [], []
+    for _ in range(moves):
+        direction = rng.choice([-1, 1], 2) * rng.integers(0, 2, 2)
+        direction = direction if direction.any() else np.array([1, 0])
+
+        move_blind = move_dirty = 0
+        for _ in range(MOVE_FRAMES):
+            clip.pan(*(direction * PAN_SPEED_PX))
+            thermal_eye.update_frame()
+            is_dirty = foreground_area(thermal_eye) > blind_area
+            move_dirty += is_dirty
+            move_blind += is_dirty or thermal_eye.is_blind()
+
+        after_blind = 0
+        for _ in range(STILL_FRAMES):
+            thermal_eye.update_frame()
+            after_blind += foreground_area(thermal_eye) > blind_area or thermal_eye.is_blind()
+
+        blind_while_moving.append(move_blind)
+        dirty_while_moving.append(move_dirty)
+        blind_after_stop.append(after_blind)
+
+    return np.mean(blind_while_moving), np.mean(blind_after_stop), np.mean(dirty_while_moving)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Frames of blindness per camera move, synthetic pans')
+    parser.add_argument('--moves', type=int, default=MOVES)
+    args = parser.parse_args()
+
+    print(f'{MOVE_FRAMES} frames pans of {PAN_SPEED_PX} px per frame, {STILL_FRAMES} still frames between moves')
+    for name, kwargs in CONFIGURATIONS.items():
+        while_moving, after_stop, dirty = run_configuration(kwargs, args.moves)
+        print(f'{name:<28} blind frames per move: {while_moving + after_stop:5.1f} '
+              f'({while_moving:.1f} while moving + {after_stop:.1f} after the stop), '
+              f'foreground unusable in {dirty:.1f}/{MOVE_FRAMES} moving frames')
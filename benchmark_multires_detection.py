@@ -0,0 +1,109 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from synthetic_thermal import SyntheticThermalClip, SyntheticCapture
+from thermal_camera import ThermalEye, DETECTION_SCALES, MIN_AREA_TO_CONSIDER, MAX_AREA_TO_CONSIDER
+
+WARMUP_FRAMES = 5
+MATCH_DISTANCE_PX = 4  # a detection matches the full resolution one if their centers are this close
+
+SCENARIOS = [
+    (640, 480, 5),
+    (640, 480, 50),
+    (1280, 1024, 5),
+    (1280, 1024, 50),
+]
+
+
+def run_detection(width, height, blobs, frames, scale, seed=0, use_contour_batch=False):
+    clip = SyntheticThermalClip(width=width, height=height, blobs=blobs, seed=seed)
+    # decoded up front, only update_frame is timed
+    capture = SyntheticCapture(clip, frames_count=frames)
+    decoded = [capture.read()[1] for _ in range(frames)]
+
+    thermal_eye = ThermalEye(FramesCapture(decoded), use_contour_batch=use_contour_batch, detection_scale=scale)
+
+    detections, elapsed = [], 0.0
+    for i in range(frames):
+        start = time.perf_counter()
+        thermal_eye.update_frame()
+        if i >= WARMUP_FRAMES:
+            elapsed += time.perf_counter() - start
+
+        targets = [c.center_point.as_tuple() for c in thermal_eye.moving_contours
+                   if MIN_AREA_TO_CONSIDER < c.area < MAX_AREA_TO_CONSIDER]
+        if i >= WARMUP_FRAMES:
+            detections.append(np.array(targets, dtype=np.float64).reshape(-1, 2))
+
+    return detections, (frames - WARMUP_FRAMES) / elapsed
+
+
+class FramesCapture:
+    """ cv2.VideoCapture look-alike over already decoded frames """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def read(self, image=None):
+        if self.index >= len(self.frames):
+            return False, None
+        self.index += 1
+        return True, self.frames[self.index - 1]
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frames[0].shape[1]
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frames[0].shape[0]
+        return 0
+
+    def release(self):
+        pass
+
+
+def match_detections(reference, detections, max_distance=MATCH_DISTANCE_PX):
+    # (matched, missed, extra) target counts, greedy nearest center matching per frame
+    matched = missed = extra = 0
+    for expected, found in zip(reference, detections):
+        unmatched = list(range(len(found)))
+        for point in expected:
+            if unmatched:
+                distances = np.hypot(*(found[unmatched] - point).T)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= max_distance:
+                    matched += 1
+                    unmatched.pop(nearest)
+                    continue
+            missed += 1
+        extra += len(unmatched)
+    return matched, missed, extra
+
+
+def run_benchmark(frames, use_contour_batch):
+    for width, height, blobs in SCENARIOS:
+        reference, reference_fps = None, None
+        for scale in DETECTION_SCALES:
+            detections, fps = run_detection(width, height, blobs, frames, scale, use_contour_batch=use_contour_batch)
+            if reference is None:
+                reference, reference_fps = detections, fps
+
+            matched, missed, extra = match_detections(reference, detections)
+            expected_count = matched + missed
+            recall = matched / expected_count if expected_count else 1.0
+
+            print(f'{width}x{height} {blobs:>2} blobs 1/{scale}: {fps:7.1f} fps (x{fps / reference_fps:4.1f}) | '
+                  f'{expected_count / len(reference):5.1f} targets per frame at full resolution, '
+                  f'recall {recall:6.1%}, {missed} missed, {extra} extra')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Downscaled MOG2 + full resolution refinement vs full resolution')
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--contour-batch', action='store_true')
+    args = parser.parse_args()
+
+    run_benchmark(args.frames, args.contour_batch)
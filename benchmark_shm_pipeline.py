@@ -0,0 +1,119 @@
+import argparse
+import os
+import tempfile
+from pathlib import Path
+from time import monotonic, sleep
+
+import numpy as np
+
+from benchmark_camera_pool import write_clip
+from camera_pool import CameraSpec, open_capture
+from display_sink import NullDisplaySink, KeyboardInput
+from session_recording import ReplayDMXSocket
+from shm_pipeline import ShmPipeline, PipelineThermalEye
+from state_machine import SauronEyeTowerStateMachine
+from target_tracker import TargetTracker
+from thermal_camera import ThermalEye
+
+FRAMES = 300
+FPS = 25
+
+
+class PacedCapture:
+    """ A live camera out of a file - frame i is there fps after frame i - 1, frames the reader was late for are gone """
+
+    def __init__(self, cap, fps):
+        self.cap = cap
+        self.frame_interval = 1 / fps
+        self.started_at = None
+        self.next_index = 0
+
+    def read(self, image=None):
+        now = monotonic()
+        self.started_at = self.started_at if self.started_at is not None else now
+        due = int((now - self.started_at) / self.frame_interval)
+        if due < self.next_index:
+            sleep(self.started_at + self.next_index * self.frame_interval - now)
+            due = self.next_index
+
+        for _ in range(due - self.next_index):
+            self.cap.grab()
+        self.next_index = due + 1
+        return self.cap.read(image)
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def release(self):
+        self.cap.release()
+
+
+class OverlaySink(NullDisplaySink):
+    """ Wants every frame - the control loop draws its overlays like with a window open, nothing is shown """
+
+    def wants_frame(self) -> bool:
+        return True
+
+
+def control_loop(thermal_eye: ThermalEye):
+    # the per frame work of do_evil - detection results, state, overlays, controller instruction
+    sauron = SauronEyeTowerStateMachine(is_manual=False, socket=ReplayDMXSocket(), thermal_eye=thermal_eye,
+                                        display=OverlaySink(), keyboard=KeyboardInput(), tracker=TargetTracker())
+    latencies, started_at = [], None
+    while True:
+        frame = sauron.update_frame()
+        if frame is None:
+            break
+        started_at = started_at or monotonic()
+
+        sauron.calculate_state(frame)
+        sauron.present_debug_frame(frame)
+        sauron.send_updated_state_signals(print_return_payload=False)
+        latencies.append(monotonic() - thermal_eye.frame_timestamp)
+
+    elapsed = monotonic() - started_at
+    return len(latencies) / elapsed, np.array(latencies) * 1e3
+
+
+def run_single_process(path, fps):
+    cap = open_capture(CameraSpec(path))
+    capture = PacedCapture(cap, fps) if fps else cap
+    thermal_eye = ThermalEye(capture)
+    try:
+        return control_loop(thermal_eye)
+    finally:
+        thermal_eye.cap.release()
+
+
+def run_pipeline(path, fps):
+    thermal_eye = PipelineThermalEye(ShmPipeline(CameraSpec(path), fps=fps).start())
+    try:
+        return control_loop(thermal_eye)
+    finally:
+        thermal_eye.close_eye()
+
+
+def run_benchmark(frames, fps):
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f'{frames} frames, {cores} cores available')
+
+    with tempfile.TemporaryDirectory() as clips_dir:
+        path = Path(clips_dir) / 'camera.avi'
+        write_clip(path, frames, seed=0)
+
+        for pace in [None, fps]:
+            for name, run in [('single process', run_single_process), ('shm pipeline', run_pipeline)]:
+                frames_per_sec, latencies_ms = run(path, pace)
+                print(f'{"as fast as decoded" if pace is None else f"camera at {pace} fps":<18} | {name:<14} | '
+                      f'{frames_per_sec:6.1f} fps, {len(latencies_ms)} frames analyzed | latency p50 '
+                      f'{np.percentile(latencies_ms, 50):6.1f} ms, p95 {np.percentile(latencies_ms, 95):6.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Capture / vision / control in separate processes over shared '
+                                                 'memory vs the single process loop - end to end fps and latency')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--fps', type=float, default=FPS)
+    args = parser.parse_args()
+
+    run_benchmark(args.frames, args.fps)
@@ -0,0 +1,97 @@
+import argparse
+import time
+
+import numpy as np
+
+from spatial_index import CentroidGrid
+from thermal_camera import BEAM_RADIUS
+from utills import Contour, PixelVector
+
+FRAME_W, FRAME_H = 640, 480
+BLOB_COUNTS = (10, 100, 1000)
+RADII = (BEAM_RADIUS, 3 * BEAM_RADIUS)
+FRAMES = 200
+
+
+def random_frames(blobs, frames, seed=0):
+    # (x, y, w, h, area) boxes of every frame, a crowd spread over the whole frame
+    rng = np.random.default_rng(seed)
+    boxes = []
+    for _ in range(frames):
+        w, h = rng.integers(3, 20, (2, blobs))
+        x, y = rng.integers(0, FRAME_W - w), rng.integers(0, FRAME_H - h)
+        boxes.append(np.stack([x, y, w, h, w * h], axis=1))
+    return boxes
+
+
+def as_contours(frame_boxes, middle):
+    # fresh Contour objects - cached properties start empty every frame, like in the tracking loop
+    return [Contour.from_stats(*(int(v) for v in box), frame_middle_point=middle) for box in frame_boxes]
+
+
+def linear_within(contours, radius):
+    return [c for c in contours if c.distance_from_center < radius]
+
+
+def linear_closest(contours, middle):
+    closest, closest_distance = None, None
+    for c in contours:
+        distance = middle.distance(c.center_point)
+        if closest_distance is None or distance < closest_distance:
+            closest, closest_distance = c, distance
+    return closest
+
+
+def timed(function, frames_contours):
+    start = time.perf_counter()
+    results = [function(contours) for contours in frames_contours]
+    return (time.perf_counter() - start) / len(frames_contours) * 1e6, results
+
+
+def run_benchmark(frames):
+    middle = PixelVector(FRAME_W // 2, FRAME_H // 2)
+    center = np.array(middle.as_tuple())
+
+    def grid_of(contours):
+        return CentroidGrid([c.center_point.as_tuple() for c in contours], FRAME_W, FRAME_H)
+
+    for blobs in BLOB_COUNTS:
+        boxes = random_frames(blobs, frames)
+
+        # center points computed up front - the build cost is timed separately from the queries
+        frames_contours = [as_contours(frame_boxes, middle) for frame_boxes in boxes]
+        for contours in frames_contours:
+            for c in contours:
+                _ = c.center_point
+        build_us, grids = timed(grid_of, frames_contours)
+        print(f'{blobs:>4} blobs | grid build {build_us:7.1f} us')
+
+        for radius in RADII:
+            linear_us, expected = timed(lambda cs: linear_within(cs, radius),
+                                        [as_contours(frame_boxes, middle) for frame_boxes in boxes])
+            grid_iter = iter(grids)
+            query_us, found = timed(lambda cs: next(grid_iter).query_radius(center, radius), frames_contours)
+
+            is_same = all([c.center_point for c in e] == [cs[i].center_point for i in f]
+                          for e, f, cs in zip(expected, found, frames_contours))
+            print(f'     radius {radius:>3} px | linear {linear_us:8.1f} us, grid query {query_us:7.1f} us '
+                  f'(x{linear_us / query_us:5.1f}), with build x{linear_us / (query_us + build_us):5.1f} | '
+                  f'{np.mean([len(f) for f in found]):6.1f} found, same result: {is_same}')
+
+        linear_us, expected = timed(lambda cs: linear_closest(cs, middle),
+                                    [as_contours(frame_boxes, middle) for frame_boxes in boxes])
+        grid_iter = iter(grids)
+        query_us, found = timed(lambda cs: next(grid_iter).nearest(center), frames_contours)
+
+        is_same = all(e.center_point == cs[f].center_point for e, f, cs in zip(expected, found, frames_contours))
+        print(f'     nearest       | linear {linear_us:8.1f} us, grid query {query_us:7.1f} us '
+              f'(x{linear_us / query_us:5.1f}), with build x{linear_us / (query_us + build_us):5.1f} | '
+              f'same result: {is_same}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Uniform grid radius / nearest queries vs linear contour scans')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    args = parser.parse_args()
+
+    run_benchmark(args.frames)
@@ -0,0 +1,168 @@
+import argparse
+from time import monotonic, sleep
+
+import numpy as np
+
+from display_sink import KeyboardInput, NullDisplaySink, NO_KEY
+from state_machine import SauronEyeTowerStateMachine, States
+from synthetic_thermal import SyntheticThermalClip, SyntheticCapture
+from motion import ACTUATION_LATENCY_SEC
+from target_tracker import TargetTracker
+from thermal_camera import ThermalEye
+from utills import DegVector, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+
+FPS = 25
+FRAMES = 500
+SCENE_MARGIN = 600
+PAN_SPEED_PX = 24  # pixels per frame the simulated tower pans at
+TARGET_SPEED_PX = 2.0  # max pixels per frame the people walk at
+TARGET_MATCH_PX = 12  # a target contour belongs to the closest blob within this distance
+
+CONFIGURATIONS = {
+    'closest of the largest': None,
+    'tracker, no lead': dict(),
+    'tracker, lead aim': dict(lead_time_sec=ACTUATION_LATENCY_SEC),
+}
+
+
+class TowerCapture(SyntheticCapture):
+    """
+    Synthetic clip seen by a camera on the tower - every instruction reaches the motors after latency_sec,
+    then the camera pans towards it. Frames are paced to `fps` so the tracker sees real frame times.
+    """
+
+    def __init__(self, clip: SyntheticThermalClip, latency_sec=ACTUATION_LATENCY_SEC, fps=FPS,
+                 pan_speed=PAN_SPEED_PX):
+        super().__init__(clip)
+        self.latency_sec = latency_sec
+        self.frame_interval = 1 / fps
+        self.pan_speed = pan_speed
+
+        self.sauron = None
+        self.origin = DegVector(90, 0)
+        self.instructions = []  # (sent at, goal degrees)
+        self.next_frame_at = None
+
+        self.rendered_positions = None
+        self.rendered_camera = None
+
+    def camera_goal(self, now):
+        goal = self.origin
+        for sent_at, instruction in self.instructions:
+            if sent_at > now - self.latency_sec:
+                break
+            goal = instruction
+        return goal
+
+    def read(self, image=None):
+        now = monotonic()
+        if self.next_frame_at is not None and now < self.next_frame_at:
+            sleep(self.next_frame_at - now)
+            now = monotonic()
+        self.next_frame_at = now + self.frame_interval
+
+        goal = self.sauron.goal_deg_coordinate
+        if not self.instructions or self.instructions[-1][1] != goal:
+            self.instructions.append((now, DegVector(goal.x, goal.y)))
+
+        # larger degrees look left and up - the camera window moves towards the scene origin
+        goal = self.camera_goal(now)
+        goal_x = SCENE_MARGIN - (goal.x - self.origin.x) * X_PIXEL_TO_DEGREE_NORM_CONST
+        goal_y = SCENE_MARGIN - (goal.y - self.origin.y) * Y_PIXEL_TO_DEGREE_NORM_CONST
+        self.clip.pan(*np.clip([goal_x - self.clip.camera_x, goal_y - self.clip.camera_y],
+                               -self.pan_speed, self.pan_speed))
+
+        self.rendered_positions = self.clip.positions.copy()
+        self.rendered_camera = np.array([self.clip.camera_x, self.clip.camera_y])
+        return super().read(image)
+
+
+class TickRecorder(KeyboardInput):
+    """ Read once per do_evil tick - records what the tower is doing and quits after `frames` ticks """
+
+    def __init__(self, sauron: SauronEyeTowerStateMachine, capture: TowerCapture, frames):
+        self.sauron = sauron
+        self.capture = capture
+        self.frames = frames
+
+        self.states = []
+        self.target_blobs = []  # blob index the target contour belongs to, -1 when there is none
+        self.aim_errors = []  # pixels from the targeted blob to the beam (frame center)
+
+    def read_key(self) -> int:
+        if len(self.states) >= self.frames:
+            return ord('q')
+
+        self.states.append(self.sauron.state)
+
+        target, blob = self.sauron.target, -1
+        if target is not None and self.capture.rendered_positions is not None:
+            scene_point = np.array(target.center_point.as_tuple()) + self.capture.rendered_camera
+            distances = np.hypot(*(self.capture.rendered_positions - scene_point).T)
+            if distances.min() <= TARGET_MATCH_PX:
+                blob = int(np.argmin(distances))
+                beam = self.capture.rendered_camera + self.sauron.thermal_eye.BEAM_CENTER_POINT.as_tuple()
+                self.aim_errors.append(float(np.hypot(*(self.capture.rendered_positions[blob] - beam))))
+        self.target_blobs.append(blob)
+
+        return NO_KEY
+
+
+def run_configuration(tracker_kwargs, frames, seed=0, target_speed=TARGET_SPEED_PX):
+    clip = SyntheticThermalClip(blobs=40, scene_margin=SCENE_MARGIN, warm_areas=40, background_blur=3,
+                                max_speed=target_speed, seed=seed)
+    capture = TowerCapture(clip)
+    thermal_eye = ThermalEye(capture, compensate_ego_motion=True)
+
+    sauron = SauronEyeTowerStateMachine(is_manual=False, thermal_eye=thermal_eye, display=NullDisplaySink(),
+                                        non_blocking_moves=True,
+                                        tracker=TargetTracker(**tracker_kwargs) if tracker_kwargs is not None else None)
+    sauron.deg_coordinate = DegVector(capture.origin.x, capture.origin.y)
+    sauron.goal_deg_coordinate = DegVector(capture.origin.x, capture.origin.y)
+    capture.sauron = sauron
+
+    recorder = TickRecorder(sauron, capture, frames)
+    sauron.keyboard = recorder
+    sauron.do_evil()
+
+    states = recorder.states
+    first_locked = states.index(States.LOCKED) if States.LOCKED in states else None
+    relocking_episodes = sum(1 for previous, state in zip(states, states[1:])
+                             if state == States.RE_LOCKING and previous != States.RE_LOCKING)
+    targeted = [blob for blob in recorder.target_blobs if blob >= 0]
+    switches = sum(1 for previous, blob in zip(targeted, targeted[1:]) if blob != previous)
+
+    return dict(
+        seconds_to_locked=first_locked / FPS if first_locked is not None else None,
+        locked_fraction=states.count(States.LOCKED) / len(states),
+        relocking_episodes=relocking_episodes,
+        target_switches=switches,
+        aim_error_px=float(np.mean(recorder.aim_errors)) if recorder.aim_errors else None,
+    )
+
+
+def run_benchmark(frames, seeds, target_speed):
+    print(f'{frames} frames at {FPS} fps per run, {ACTUATION_LATENCY_SEC} sec actuation latency, '
+          f'{PAN_SPEED_PX} px per frame pans, targets up to {target_speed} px per frame')
+    for name, tracker_kwargs in CONFIGURATIONS.items():
+        runs = [run_configuration(tracker_kwargs, frames, seed, target_speed) for seed in range(seeds)]
+        to_locked = [run['seconds_to_locked'] for run in runs if run['seconds_to_locked'] is not None]
+        aim_errors = [run['aim_error_px'] for run in runs if run['aim_error_px'] is not None]
+
+        print(f'{name:<24} to LOCKED {np.mean(to_locked) if to_locked else float("nan"):5.1f} sec '
+              f'({len(to_locked)}/{seeds} runs locked), '
+              f'LOCKED {np.mean([run["locked_fraction"] for run in runs]):6.1%} of frames, '
+              f'RE_LOCKING episodes {np.mean([run["relocking_episodes"] for run in runs]):5.1f}, '
+              f'target switches {np.mean([run["target_switches"] for run in runs]):5.1f}, '
+              f'aim error {np.mean(aim_errors) if aim_errors else float("nan"):5.1f} px')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Closed loop targeting on a simulated tower - '
+                                                 'closest contour every frame vs Kalman tracks with lead aim')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--seeds', type=int, default=3)
+    parser.add_argument('--target-speed', type=float, default=TARGET_SPEED_PX)
+    args = parser.parse_args()
+
+    run_benchmark(args.frames, args.seeds, args.target_speed)
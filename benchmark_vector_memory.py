@@ -0,0 +1,153 @@
+import argparse
+import math
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+import utills
+from benchmark_candidate_ranking import synthetic_eye, legacy_rank, array_rank, forget_frame_caches
+from thermal_camera import BEAM_RADIUS
+from utills import DegVector, PixelVector
+
+FRAMES = 200
+INSTANCES = 100_000
+
+
+@dataclass
+class LegacyDegVector:
+    # the vectors before they were frozen and slotted - mutable, a __dict__ per instance
+    x: int = 90
+    y: int = 0
+
+    def distance(self, other):
+        return int(math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2))
+
+    def as_tuple(self):
+        return self.x, self.y
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __sub__(self, other):
+        return LegacyDegVector(self.x - other.x, self.y - other.y)
+
+    def __add__(self, other):
+        return LegacyDegVector(self.x + other.x, self.y + other.y)
+
+    @property
+    def is_inside_border(self):
+        return utills.DEGREES_X_MIN < self.x < utills.DEGREES_X_MAX and \
+            utills.DEGREES_Y_MIN < self.y < utills.DEGREES_Y_MAX
+
+
+@dataclass
+class LegacyPixelVector:
+    x: int
+    y: int
+
+    perspective_point: Optional[DegVector] = None
+
+    def distance(self, other):
+        return int(math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2))
+
+    def as_tuple(self):
+        return self.x, self.y
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __sub__(self, other):
+        return LegacyPixelVector(self.x - other.x, self.y - other.y)
+
+    def __add__(self, other):
+        return LegacyPixelVector(self.x + other.x, self.y + other.y)
+
+
+@contextmanager
+def legacy_vectors():
+    # Contour builds its vectors through the utills globals - swap the types in for the legacy runs
+    pixel_vector, deg_vector = utills.PixelVector, utills.DegVector
+    utills.PixelVector, utills.DegVector = LegacyPixelVector, LegacyDegVector
+    try:
+        yield
+    finally:
+        utills.PixelVector, utills.DegVector = pixel_vector, deg_vector
+
+
+def instance_cost(vector_type, count):
+    # construction timed without tracing - tracemalloc slows every allocation
+    start = time.perf_counter()
+    vectors = [vector_type(i, -i) for i in range(count)]
+    elapsed = time.perf_counter() - start
+    del vectors
+
+    tracemalloc.start()
+    vectors = [vector_type(i, -i) for i in range(count)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    list_bytes = vectors.__sizeof__()
+    return (allocated - list_bytes) / count, elapsed / count * 1e9
+
+
+def run_instances(count):
+    for name, vector_type in [('DegVector', LegacyDegVector), ('DegVector', DegVector),
+                              ('PixelVector', LegacyPixelVector), ('PixelVector', PixelVector)]:
+        kind = 'legacy' if vector_type.__name__.startswith('Legacy') else 'frozen, slotted'
+        bytes_per_vector, ns_per_vector = instance_cost(vector_type, count)
+        print(f'{name:<11} {kind:<15} | {bytes_per_vector:6.1f} bytes, {ns_per_vector:6.1f} ns per instance')
+
+
+def run_frames(frames):
+    thermal_eye, next_deg_coordinate = synthetic_eye(frames, use_contour_batch=False)
+    stages = {
+        'per contour, legacy vectors': lambda d: legacy_rank(thermal_eye, d, 3 * BEAM_RADIUS),
+        'per contour, slotted vectors': lambda d: legacy_rank(thermal_eye, d, 3 * BEAM_RADIUS),
+        'vector arrays (rank_candidates)': lambda d: array_rank(thermal_eye, d, 3 * BEAM_RADIUS),
+    }
+    peaks = {name: [] for name in stages}
+    retained = {name: [] for name in stages}
+    contours_count, frames_count = 0, 0
+
+    tracemalloc.start()
+    while frames_count < frames:
+        thermal_eye.update_frame()
+        if thermal_eye.frame is None:
+            break
+        frames_count += 1
+        contours_count += len(thermal_eye.moving_contours)
+        frame_deg_coordinate = next_deg_coordinate()
+
+        for name, stage in stages.items():
+            forget_frame_caches(thermal_eye)
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            with legacy_vectors() if 'legacy' in name else nullcontext():
+                result = stage(frame_deg_coordinate)
+            current, peak = tracemalloc.get_traced_memory()
+            # the cached center / direction vectors stay on the contours until the next frame
+            peaks[name].append(peak - baseline)
+            retained[name].append(current - baseline)
+            del result
+    tracemalloc.stop()
+
+    print(f'{frames_count} frames, {contours_count / frames_count:.0f} contours per frame')
+    for name in stages:
+        print(f'{name:<32} | peak {np.mean(peaks[name]) / 1024:8.1f} KiB per frame '
+              f'(max {np.max(peaks[name]) / 1024:8.1f}), '
+              f'still allocated after the stage {np.mean(retained[name]) / 1024:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vector memory - legacy dataclasses vs frozen slotted vectors '
+                                                 'vs vector arrays, tracemalloc per frame')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--instances', type=int, default=INSTANCES)
+    args = parser.parse_args()
+
+    run_instances(args.instances)
+    run_frames(args.frames)
@@ -0,0 +1,215 @@
+import argparse
+import json
+import platform
+import subprocess
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from contour_batch import ContourBatch
+from synthetic_thermal import SyntheticThermalClip, SyntheticCapture
+from thermal_camera import ThermalEye, MIN_AREA_TO_CONSIDER, MAX_AREA_TO_CONSIDER
+from utills import Contour, DegVector, is_target_in_circle, draw_moving_contours, mark_target_contour, \
+    draw_light_beam, draw_search_radius_circle, plant_state_name_in_frame
+
+RESULTS_DIR = Path('./benchmark_results')
+
+WARMUP_FRAMES = 5  # MOG2 sees the whole first frames as foreground
+JPEG_QUALITY = 90  # thermal USB cameras deliver MJPEG
+FRAME_DEG_COORDINATE = DegVector(90, -10)
+SEARCH_RADIUS = 42_000
+TOP_TARGETS = 3
+
+REGRESSION_THRESHOLD = 0.2  # relative slowdown of a stage median
+REGRESSION_MIN_MS = 0.02  # ignore slowdowns below timer noise, some stages take microseconds
+
+
+@dataclass
+class Scenario:
+    name: str
+    width: int = 640
+    height: int = 480
+    blobs: int = 5
+    noise: float = 1.0
+    frames: int = 200
+    seed: int = 0
+
+
+SCENARIOS = {s.name: s for s in [
+    Scenario('vga_few', blobs=5),
+    Scenario('vga_crowd', blobs=50),
+    Scenario('vga_noisy', blobs=5, noise=2.5),
+    Scenario('sxga_few', width=1280, height=1024, blobs=5, frames=100),
+]}
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.is_recording = True
+
+    def __call__(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        if self.is_recording:
+            self.samples[stage].append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            stages[stage] = {
+                'mean_ms': float(ms.mean()),
+                'median_ms': float(np.median(ms)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'count': len(samples),
+            }
+        return stages
+
+
+def encode_clip(scenario: Scenario):
+    clip = SyntheticThermalClip(width=scenario.width, height=scenario.height, blobs=scenario.blobs,
+                                noise=scenario.noise, seed=scenario.seed)
+    return [cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1]
+            for frame in clip.frames(scenario.frames)]
+
+
+def filter_contours(contours):
+    # the calculate_state filter
+    return [c for c in contours
+            if c.get_abs_degree_location(FRAME_DEG_COORDINATE).is_inside_border
+            and (MIN_AREA_TO_CONSIDER < c.area < MAX_AREA_TO_CONSIDER)
+            and c.distance_from_center < SEARCH_RADIUS]
+
+
+def run_scenario(scenario: Scenario):
+    encoded_frames = encode_clip(scenario)
+    clip = SyntheticThermalClip(width=scenario.width, height=scenario.height, seed=scenario.seed)
+    thermal_eye = ThermalEye(SyntheticCapture(clip))
+    fg_backgorund = thermal_eye.fg_backgorund
+    center = thermal_eye.BEAM_CENTER_POINT
+
+    timer = StageTimer()
+    contours_per_frame = []
+
+    for i, encoded in enumerate(encoded_frames):
+        timer.is_recording = i >= WARMUP_FRAMES
+
+        frame = timer('capture_decode', cv2.imdecode, encoded, cv2.IMREAD_COLOR)
+        fg_mask = timer('mog2_apply', fg_backgorund.apply, frame)
+        th = timer('threshold', cv2.threshold, fg_mask, 0, 100, cv2.THRESH_BINARY)[1]
+
+        raw_contours, _ = timer('find_contours', cv2.findContours, th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        contours = timer('contour_construction', lambda: [Contour(c, center) for c in raw_contours])
+        contours = timer('sort', sorted, contours, key=lambda c: -c.area)
+        timer('contour_batch', ContourBatch.from_mask, th, center)
+
+        filtered = timer('border_area_filter', filter_contours, contours)
+        targets = filtered[:TOP_TARGETS]
+        target = timer('find_closest_target', thermal_eye.find_closest_target, targets)
+        timer('is_target_in_circle', is_target_in_circle, frame, target)
+
+        timer('draw_moving_contours', draw_moving_contours, frame, contours)
+        timer('mark_target_contour', mark_target_contour, frame, center, target)
+        timer('draw_light_beam', draw_light_beam, frame)
+        timer('draw_search_radius_circle', draw_search_radius_circle, frame, 100)
+        timer('plant_state_name_in_frame', plant_state_name_in_frame, frame, 'LOCKED')
+
+        if timer.is_recording:
+            contours_per_frame.append(len(contours))
+
+    stages = timer.summary()
+    return {
+        'scenario': asdict(scenario),
+        'contours_per_frame': float(np.mean(contours_per_frame)) if contours_per_frame else 0.0,
+        'frame_total_ms': sum(s['mean_ms'] for s in stages.values()),
+        'stages': stages,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(scenarios):
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': {s.name: run_scenario(s) for s in scenarios},
+    }
+
+
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD, min_ms=REGRESSION_MIN_MS):
+    # (scenario, stage, baseline median, current median) of every stage slower than the baseline by more than threshold
+    regressions = []
+    for name, result in results['results'].items():
+        baseline_stages = baseline['results'].get(name, {}).get('stages', {})
+        for stage, stats in result['stages'].items():
+            if stage not in baseline_stages:
+                continue
+            baseline_ms, current_ms = baseline_stages[stage]['median_ms'], stats['median_ms']
+            if current_ms > baseline_ms * (1 + threshold) and current_ms - baseline_ms > min_ms:
+                regressions.append((name, stage, baseline_ms, current_ms))
+    return regressions
+
+
+def print_results(results):
+    for name, result in results['results'].items():
+        scenario = result['scenario']
+        print(f"{name}: {scenario['width']}x{scenario['height']}, {scenario['blobs']} blobs, "
+              f"noise {scenario['noise']}, {result['contours_per_frame']:.1f} contours per frame, "
+              f"{result['frame_total_ms']:.2f} ms per frame")
+        for stage, stats in result['stages'].items():
+            print(f"  {stage:<28} median {stats['median_ms']:8.3f} ms | "
+                  f"mean {stats['mean_ms']:8.3f} ms | p95 {stats['p95_ms']:8.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-stage timing of the vision pipeline on synthetic thermal clips')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='preset scenario, can be repeated (default - all presets)')
+    parser.add_argument('--width', type=int, help='custom scenario instead of the presets')
+    parser.add_argument('--height', type=int)
+    parser.add_argument('--blobs', type=int)
+    parser.add_argument('--noise', type=float)
+    parser.add_argument('--frames', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help=f'results json (default - {RESULTS_DIR}/vision_<time>.json)')
+    parser.add_argument('--compare', help='baseline results json, exit 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    custom = {k: v for k, v in vars(args).items()
+              if k in ('width', 'height', 'blobs', 'noise', 'frames', 'seed') and v is not None}
+    if custom:
+        selected = [Scenario('custom', **custom)]
+    else:
+        selected = [SCENARIOS[name] for name in args.scenario or SCENARIOS]
+
+    benchmark_results = run_benchmark(selected)
+    print_results(benchmark_results)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"vision_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(benchmark_results, indent=2))
+    print(f'results saved to {output}')
+
+    if args.compare:
+        found = find_regressions(benchmark_results, json.loads(Path(args.compare).read_text()), args.threshold)
+        for scenario_name, stage_name, before_ms, after_ms in found:
+            print(f'REGRESSION {scenario_name}/{stage_name}: {before_ms:.3f} ms -> {after_ms:.3f} ms')
+        print(f'{len(found)} regressions over {args.threshold:.0%}')
+        raise SystemExit(1 if found else 0)
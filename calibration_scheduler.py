@@ -0,0 +1,243 @@
+import datetime
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Optional, Dict, List, Tuple
+
+import numpy as np
+
+from degree_lut import is_plausible_pixels_per_degree
+from ego_motion import EgoMotionEstimator
+from file_utills import CalibrationStore
+from frame_utills import calc_pixel_shift_between_frames
+from utills import DegVector, get_value_within_limits, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+from utills import DEGREES_X_MIN, DEGREES_X_MAX, DEGREES_Y_MIN, DEGREES_Y_MAX
+
+COARSE_STRIDE = 4
+DISAGREEMENT_TH = 0.25  # relative difference between neighbouring measurements that triggers refinement
+
+MIN_MOVE_WAIT_SEC = 0.3  # controller latency - stable frames before that may be from before the move started
+MAX_MOVE_WAIT_SEC = 5
+STABLE_FRAMES_TO_SETTLE = 3
+
+PROGRESS_EMA_WEIGHT = 0.2
+
+Point = Tuple[int, int]
+
+
+def serpentine_points(points) -> List[Point]:
+    # Row by row, every other row reversed - consecutive points are always neighbours
+    rows: Dict[int, List[int]] = {}
+    for x_degree, y_degree in points:
+        rows.setdefault(y_degree, []).append(x_degree)
+
+    ordered = []
+    for row_index, y_degree in enumerate(sorted(rows)):
+        row = sorted(rows[y_degree], reverse=row_index % 2 == 1)
+        ordered += [(x_degree, y_degree) for x_degree in row]
+    return ordered
+
+
+def grid_points(stride=1):
+    # Always includes the far borders so the coarse grid spans the whole range
+    x_degrees = sorted(set(range(DEGREES_X_MIN, DEGREES_X_MAX, stride)) | {DEGREES_X_MAX - 1})
+    y_degrees = sorted(set(range(DEGREES_Y_MIN, DEGREES_Y_MAX, stride)) | {DEGREES_Y_MAX - 1})
+    return [(x_degree, y_degree) for y_degree in y_degrees for x_degree in x_degrees]
+
+
+@dataclass
+class CalibrationScheduler:
+    """
+    Calibrates the pixel/degree mapper visiting every point once in a serpentine order.
+    Each point frame is the origin frame of its row neighbour and of the point in the next row, so a point costs
+    a single move. A coarse pass at `stride` runs first, then only cells whose neighbouring measurements
+    disagree are refined at stride 1.
+    """
+    sauron: object  # SauronEyeTowerStateMachine
+    mapper_dict: dict
+    calibration_store: Optional[CalibrationStore] = None
+
+    stride: int = COARSE_STRIDE
+    disagreement_th: float = DISAGREEMENT_TH
+    show_debug_frames: bool = True
+
+    _frames: Dict[Point, np.ndarray] = field(default_factory=dict)
+    _seconds_per_point: Optional[float] = None
+
+    def run(self):
+        coarse_points = grid_points(self.stride)
+        self.calibrate_points(coarse_points, self.stride)
+
+        refine_points = self.points_to_refine(self.stride)
+        print(f'refining {len(refine_points)} points where coarse measurements disagree')
+
+        # coarse measurements inside refined cells are replaced by the one degree ones
+        refined_coarse_points = set(refine_points) & set(coarse_points)
+        for point in refined_coarse_points:
+            self.mapper_dict.pop(point, None)
+
+        self.calibrate_points(refine_points, 1)
+
+        return self.mapper_dict
+
+    def calibrate_points(self, points: List[Point], stride: int):
+        self._frames = {}
+        ordered_points = serpentine_points(points)
+        visit_order = {point: i for i, point in enumerate(ordered_points)}
+
+        for done, point in enumerate(ordered_points):
+            point_start = monotonic()
+
+            measurements = self.missing_measurements(point, visit_order, stride)
+            if not measurements:
+                continue
+
+            frame = self.get_point_frame(point)
+            for neighbour, direction, degrees_apart in measurements:
+                self.measure(neighbour, point, direction, degrees_apart, frame)
+
+            self.save_points([point] + [neighbour for neighbour, _, _ in measurements])
+            self.forget_old_frames(point, stride)
+            self.report_progress(monotonic() - point_start, len(ordered_points) - done - 1)
+
+    def missing_measurements(self, point: Point, visit_order: Dict[Point, int], stride: int):
+        """
+        Measurements between the point and its closest neighbours (up to `stride` degrees away) that were visited
+        before it - (neighbour, unit direction from the neighbour to the point, degrees apart).
+        """
+        x_degree, y_degree = point
+        missing = []
+
+        for direction in [(1, 0), (-1, 0), (0, 1)]:
+            for degrees_apart in range(1, stride + 1):
+                neighbour = (x_degree - direction[0] * degrees_apart, y_degree - direction[1] * degrees_apart)
+                if neighbour in visit_order:
+                    break
+            else:
+                continue
+
+            if visit_order[neighbour] > visit_order[point]:
+                continue
+
+            opposite_direction = (-direction[0], -direction[1])
+            if self.mapper_dict.get(point, {}).get(opposite_direction) is None:
+                missing.append((neighbour, direction, degrees_apart))
+
+        return missing
+
+    def get_point_frame(self, point: Point):
+        frame = self._frames.get(point)
+        if frame is None:
+            frame = self.move_and_wait_for_stable_frame(point).copy()
+            self._frames[point] = frame
+        return frame
+
+    def measure(self, origin_point: Point, point: Point, direction: Point, degrees_apart: int, frame):
+        # resumed run - the neighbour was calibrated before this run, go back for its frame once
+        origin_frame = self.get_point_frame(origin_point)
+
+        # the commanded move - the match is searched around its expected shift, not around a single degree
+        direction_vector = DegVector(direction[0] * degrees_apart, direction[1] * degrees_apart)
+        pixel_shift = calc_pixel_shift_between_frames(origin_frame, frame.copy(), direction_vector)
+        pixels_per_degree = pixel_shift / degrees_apart if pixel_shift is not None else None
+
+        # failed measurements stay missing - a resumed run measures them again, the LUT interpolates over them
+        default_value = X_PIXEL_TO_DEGREE_NORM_CONST if direction[0] else Y_PIXEL_TO_DEGREE_NORM_CONST
+        if not is_plausible_pixels_per_degree(pixels_per_degree, default_value):
+            print(f'no trusted measurement {origin_point} -> {point} ({pixels_per_degree} pixels per degree)')
+            return
+
+        opposite_direction = (-direction[0], -direction[1])
+        self.mapper_dict.setdefault(origin_point, {})[direction] = pixels_per_degree
+        self.mapper_dict.setdefault(point, {})[opposite_direction] = pixels_per_degree
+
+        print(f'calculated {origin_point} -> {point} = {pixels_per_degree} Pixels per degree')
+
+    def move_and_wait_for_stable_frame(self, point: Point):
+        sauron = self.sauron
+        x_degree = get_value_within_limits(point[0], bottom=DEGREES_X_MIN, top=DEGREES_X_MAX)
+        y_degree = get_value_within_limits(point[1], bottom=DEGREES_Y_MIN, top=DEGREES_Y_MAX)
+        sauron.goal_deg_coordinate = DegVector(x_degree, y_degree)
+
+        beginning = monotonic()
+        ego_motion = EgoMotionEstimator()
+        stable_frames, saw_movement = 0, False
+
+        frame = None
+        while monotonic() - beginning < MAX_MOVE_WAIT_SEC:
+            sauron.send_updated_state_signals(print_return_payload=False)
+            frame = sauron.update_frame()
+            if frame is None:
+                continue
+
+            if ego_motion.update(frame) is not None:
+                if ego_motion.is_moving:
+                    saw_movement, stable_frames = True, 0
+                else:
+                    stable_frames += 1
+
+            if self.show_debug_frames:
+                sauron.present_debug_frame(frame.copy(), state='CALIBRATING')
+
+            waited_enough = saw_movement or monotonic() - beginning > MIN_MOVE_WAIT_SEC
+            if stable_frames >= STABLE_FRAMES_TO_SETTLE and waited_enough:
+                break
+
+        sauron.set_deg_coordinate(DegVector(x_degree, y_degree))
+        return frame
+
+    def forget_old_frames(self, point: Point, stride: int):
+        # Only the current and the previous row are origin frames for what comes next
+        oldest_row = point[1] - stride
+        self._frames = {p: f for p, f in self._frames.items() if p[1] >= oldest_row}
+
+    def points_to_refine(self, stride: int) -> List[Point]:
+        coarse_points = grid_points(stride)
+        x_degrees = sorted({x_degree for x_degree, _ in coarse_points})
+        y_degrees = sorted({y_degree for _, y_degree in coarse_points})
+
+        refine_points = set()
+        for xi, x_degree in enumerate(x_degrees):
+            for yi, y_degree in enumerate(y_degrees):
+                point = (x_degree, y_degree)
+                neighbours = []
+                if xi + 1 < len(x_degrees):
+                    neighbours.append(((x_degrees[xi + 1], y_degree), (1, 0)))
+                if yi + 1 < len(y_degrees):
+                    neighbours.append(((x_degree, y_degrees[yi + 1]), (0, 1)))
+
+                for neighbour, direction in neighbours:
+                    value = self.mapper_dict.get(point, {}).get(direction)
+                    neighbour_value = self.mapper_dict.get(neighbour, {}).get(direction)
+                    if not value or not neighbour_value:
+                        continue
+
+                    if abs(value - neighbour_value) / max(value, neighbour_value) > self.disagreement_th:
+                        refine_points |= self.cell_points(point, neighbour)
+
+        return sorted(refine_points)
+
+    @staticmethod
+    def cell_points(point: Point, neighbour: Point):
+        x_from, x_to = sorted([point[0], neighbour[0]])
+        y_from, y_to = sorted([point[1], neighbour[1]])
+        return {(x_degree, y_degree)
+                for x_degree in range(x_from, x_to + 1)
+                for y_degree in range(y_from, y_to + 1)}
+
+    def save_points(self, points: List[Point]):
+        if self.calibration_store is None:
+            return
+
+        for point in points:
+            self.calibration_store.set_point(point, self.mapper_dict.get(point, {}))
+        self.calibration_store.save()
+
+    def report_progress(self, point_seconds: float, points_left: int):
+        if self._seconds_per_point is None:
+            self._seconds_per_point = point_seconds
+        else:
+            self._seconds_per_point += PROGRESS_EMA_WEIGHT * (point_seconds - self._seconds_per_point)
+
+        remaining = datetime.timedelta(seconds=int(self._seconds_per_point * points_left))
+        print(f'{points_left} points left in this pass, ~{remaining} remaining '
+              f'({self._seconds_per_point:.2f} sec per point)')
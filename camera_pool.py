@@ -0,0 +1,334 @@
+import multiprocessing
+import queue
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import monotonic
+from typing import Union, Optional, List, Dict, Sequence
+
+import cv2
+import numpy as np
+
+from contour_batch import ContourBatch
+from session_recording import RecordingCapture
+from thermal_camera import ThermalEye, MIN_AREA_TO_CONSIDER, MAX_AREA_TO_CONSIDER
+from utills import Contour, DegVector, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+
+BEAM_PIXELS_PER_DEGREE = (X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST)
+
+DETECTIONS_PER_CAMERA = 4  # queued messages per camera before the workers start dropping them
+MERGE_DISTANCE_DEG = 1.0  # detections of overlapping cameras closer than this are the same target
+MAX_DETECTIONS_AGE_SEC = 0.5  # a slow camera's latest detections are merged until they are this old
+WAIT_FOR_DETECTIONS_TIMEOUT_SEC = 1.0
+WORKER_JOIN_TIMEOUT_SEC = 2.0
+
+
+@dataclass
+class CameraSpec:
+    """
+    One thermal camera of the tower.
+    source - camera index, video file or session recording (.rec), or a capture object (see SyntheticCapture).
+    File-backed sources run the whole pool without hardware.
+    mount_offset - degrees from the beam to the camera center, or the absolute degrees the camera looks at
+    when it does not move with the beam (a fixed sector camera).
+    pixels_per_degree - the lens, a narrow camera has more pixels per degree than the beam camera.
+    """
+    source: Union[int, str, Path, object]
+    name: str = ''
+    mount_offset: DegVector = DegVector(0, 0)
+    moves_with_beam: bool = True
+    pixels_per_degree: tuple = BEAM_PIXELS_PER_DEGREE
+    loop: bool = False  # file sources start over at their end
+    eye_kwargs: dict = field(default_factory=dict)  # ThermalEye options - use_contour_batch, detection_scale, ...
+
+    @property
+    def resolution(self):
+        return self.pixels_per_degree[0] * self.pixels_per_degree[1]
+
+
+@dataclass
+class CameraDetections:
+    """ The target candidates of one camera frame, in the degree space shared by all the cameras """
+    camera_index: int
+    seq: int  # frames analyzed by the camera worker
+    timestamp: float  # time.monotonic() of the capture, the same clock in every process
+    is_blind: bool
+    is_moving: bool
+    degrees: np.ndarray  # (N, 2) float absolute degrees of the candidate centers
+    sizes: np.ndarray  # (N, 3) w, h, area in beam camera pixels
+    dropped: int = 0  # detections of this camera dropped on a full queue since the previous message
+
+
+class LoopingCapture:
+    """ Opens the source again at its end - an endless camera out of a file """
+
+    def __init__(self, spec: CameraSpec):
+        self.spec = spec
+        self.cap = open_capture(spec)
+
+    def read(self, image=None):
+        ret, frame = self.cap.read(image)
+        if not ret or frame is None:
+            self.cap.release()
+            self.cap = open_capture(self.spec)
+            ret, frame = self.cap.read(image)
+        return ret, frame
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def release(self):
+        self.cap.release()
+
+
+def open_capture(spec: CameraSpec):
+    source = spec.source
+    if hasattr(source, 'read'):
+        return source
+    if isinstance(source, (str, Path)) and Path(source).suffix == '.rec':
+        return RecordingCapture(source)
+    return cv2.VideoCapture(str(source) if isinstance(source, Path) else source)
+
+
+def contour_boxes(moving_contours) -> np.ndarray:
+    # (N, 5) x, y, w, h, area of the moving contours
+    if isinstance(moving_contours, ContourBatch):
+        return np.stack([moving_contours.x, moving_contours.y, moving_contours.w, moving_contours.h,
+                         moving_contours.area], axis=1).astype(np.int64).reshape(-1, 5)
+    return np.array([(c.x, c.y, c.w, c.h, c.area) for c in moving_contours or []], dtype=np.int64).reshape(-1, 5)
+
+
+def camera_detections(thermal_eye: ThermalEye, spec: CameraSpec, camera_index: int, seq: int,
+                      tower_deg_coordinate: DegVector) -> CameraDetections:
+    """
+    Candidates of the current thermal_eye frame - contours within the target area range once scaled to the beam
+    camera, at float absolute degrees (the tower coordinate, the camera mount and the camera shift since the last
+    known coordinate, like target_tracker.degree_locations).
+    """
+    is_blind = thermal_eye.is_blind()
+    boxes = contour_boxes(thermal_eye.moving_contours) if not is_blind else np.empty((0, 5), np.int64)
+
+    # camera pixels to beam camera pixels
+    scale = np.divide(BEAM_PIXELS_PER_DEGREE, spec.pixels_per_degree)
+    x, y, w, h, area = boxes.T
+    beam_area = area * scale[0] * scale[1]
+    is_candidate = (MIN_AREA_TO_CONSIDER < beam_area) & (beam_area < MAX_AREA_TO_CONSIDER)
+
+    centers = np.stack([x + w // 2, y + h // 2], axis=1)[is_candidate] - thermal_eye.camera_shift
+    direction = np.array(thermal_eye.BEAM_CENTER_POINT.as_tuple(), dtype=np.float64) - centers
+
+    origin = spec.mount_offset + tower_deg_coordinate if spec.moves_with_beam else spec.mount_offset
+    degrees = np.array(origin.as_tuple(), dtype=np.float64) + direction / spec.pixels_per_degree
+
+    sizes = np.stack([w * scale[0], h * scale[1], beam_area], axis=1)[is_candidate]
+    return CameraDetections(camera_index=camera_index, seq=seq, timestamp=thermal_eye.frame_timestamp or monotonic(),
+                            is_blind=is_blind, is_moving=thermal_eye.is_cam_in_movement(),
+                            degrees=degrees.reshape(-1, 2), sizes=sizes.reshape(-1, 3))
+
+
+def camera_worker(camera_index: int, spec: CameraSpec, tower_state, detections_queue, stop_event):
+    """
+    Process main of one camera - capture, background model and contours, the candidates are published
+    on detections_queue. tower_state - shared (x, y, version) of the beam coordinate, a new version means a move
+    ended and the camera shift starts over.
+    """
+    thermal_eye = ThermalEye(LoopingCapture(spec) if spec.loop else open_capture(spec), **spec.eye_kwargs)
+    seen_version, seq, dropped = None, 0, 0
+    try:
+        while not stop_event.is_set():
+            with tower_state.get_lock():
+                x, y, version = tower_state[:]
+            if version != seen_version:
+                thermal_eye.reset_camera_shift()
+                seen_version = version
+
+            thermal_eye.update_frame()
+            if thermal_eye.frame is None:
+                break
+            seq += 1
+
+            detections = camera_detections(thermal_eye, spec, camera_index, seq, DegVector(int(x), int(y)))
+            detections.dropped = dropped
+            try:
+                # never wait on the consumer - it only wants the latest detections anyway
+                detections_queue.put_nowait(detections)
+                dropped = 0
+            except queue.Full:
+                dropped += 1
+    finally:
+        detections_queue.put((camera_index, None))  # end of stream
+        thermal_eye.cap.release()  # no windows in a worker
+
+
+def merge_detections(detections: Sequence[CameraDetections], specs: Sequence[CameraSpec],
+                     merge_distance=MERGE_DISTANCE_DEG):
+    """
+    (degrees, sizes) of the candidates of all the cameras, a target seen by overlapping cameras once -
+    from the camera with the most pixels per degree.
+    """
+    degrees, sizes = np.empty((0, 2)), np.empty((0, 3))
+    for d in sorted(detections, key=lambda d: -specs[d.camera_index].resolution):
+        is_new = np.ones(len(d.degrees), dtype=bool)
+        if len(degrees) and len(d.degrees):
+            distances = np.linalg.norm(d.degrees[:, None, :] - degrees[None, :, :], axis=-1)
+            is_new = distances.min(axis=1) > merge_distance
+
+        degrees = np.concatenate([degrees, d.degrees[is_new]])
+        sizes = np.concatenate([sizes, d.sizes[is_new]])
+    return degrees, sizes
+
+
+class CameraPool:
+    """
+    A worker process per camera (spawned - the same on Windows), capture and detection of every camera run
+    on their own core. The control loop polls the merged candidates and tells the workers where the beam is.
+    """
+
+    def __init__(self, specs: Sequence[CameraSpec], queue_size: Optional[int] = None):
+        self.specs = list(specs)
+        context = multiprocessing.get_context('spawn')
+        self._context = context
+
+        self.tower_state = context.Array('d', [DegVector().x, DegVector().y, 0])
+        self.detections_queue = context.Queue(queue_size or DETECTIONS_PER_CAMERA * len(self.specs))
+        self.stop_event = context.Event()
+        self.processes: List[multiprocessing.Process] = []
+
+        self.latest: Dict[int, CameraDetections] = {}
+        self.ended = set()
+        self.dropped_detections = 0
+
+    def start(self):
+        for camera_index, spec in enumerate(self.specs):
+            process = self._context.Process(
+                target=camera_worker, name=f'camera-{spec.name or camera_index}', daemon=True,
+                args=(camera_index, spec, self.tower_state, self.detections_queue, self.stop_event))
+            process.start()
+            self.processes.append(process)
+        return self
+
+    @property
+    def is_running(self):
+        return len(self.ended) < len(self.specs)
+
+    def set_tower_coordinate(self, deg_coordinate: DegVector):
+        with self.tower_state.get_lock():
+            self.tower_state[:] = [deg_coordinate.x, deg_coordinate.y, self.tower_state[2] + 1]
+
+    def _receive(self, message, received: List[CameraDetections]):
+        if isinstance(message, tuple):
+            camera_index, _ = message
+            self.ended.add(camera_index)
+            return
+
+        self.dropped_detections += message.dropped
+        self.latest[message.camera_index] = message
+        received.append(message)
+
+    def poll(self, timeout=WAIT_FOR_DETECTIONS_TIMEOUT_SEC) -> List[CameraDetections]:
+        # Detections that arrived since the previous poll, waiting up to `timeout` for the first one
+        received = []
+        if not self.is_running and self.detections_queue.empty():
+            return received
+
+        try:
+            self._receive(self.detections_queue.get(timeout=timeout), received)
+            while True:
+                self._receive(self.detections_queue.get_nowait(), received)
+        except queue.Empty:
+            pass
+        return received
+
+    def fresh_detections(self, now: Optional[float] = None, max_age=MAX_DETECTIONS_AGE_SEC) -> List[CameraDetections]:
+        now = monotonic() if now is None else now
+        return [d for d in self.latest.values() if now - d.timestamp <= max_age]
+
+    def close(self):
+        self.stop_event.set()
+        deadline = monotonic() + WORKER_JOIN_TIMEOUT_SEC
+        # a worker exits only once its queued messages are taken
+        while any(p.is_alive() for p in self.processes) and monotonic() < deadline:
+            try:
+                self.detections_queue.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=WORKER_JOIN_TIMEOUT_SEC)
+        self.processes = []
+
+
+class PooledThermalEye(ThermalEye):
+    """
+    ThermalEye over a CameraPool - the merged candidates of all the cameras, projected into the pixels of the beam
+    camera (frame_w x frame_h, BEAM_PIXELS_PER_DEGREE) so the state machine consumes them like a single camera.
+    Contours may lie outside the frame - targets seen only by a wider camera.
+    frame is a blank canvas to draw the debug overlays on, the camera frames stay in the workers.
+    The projection uses the pixel to degree constants, the calibrated degree LUT is for a single camera -
+    uses_degree_lut keeps the state machine from compiling one, pixels outside the frame map back with the constants.
+    """
+    uses_degree_lut = False
+
+    def __init__(self, pool: CameraPool, frame_w=640, frame_h=480, deg_coordinate: DegVector = DegVector()):
+        self.pool = pool
+        self.cap = None
+
+        # the workers dead reckon mid move, the merged detections are already where they are - camera_shift stays 0
+        self._init_state(frame_w, frame_h)
+        self.moving_contours = []
+
+        self.deg_coordinate = deg_coordinate
+        self.detections: List[CameraDetections] = []
+        self.pool.set_tower_coordinate(deg_coordinate)
+
+    def reset_camera_shift(self, deg_coordinate: Optional[DegVector] = None):
+        if deg_coordinate is not None:
+            self.deg_coordinate = deg_coordinate
+            self.pool.set_tower_coordinate(deg_coordinate)
+
+    def is_cam_in_movement(self, update_frame=False):
+        if update_frame:
+            self.update_frame()
+        return any(d.is_moving for d in self.detections if self.pool.specs[d.camera_index].moves_with_beam)
+
+    def is_blind(self):
+        # blind only when no camera can see - fixed sector cameras keep looking while the tower moves
+        return not any(not d.is_blind for d in self.detections)
+
+    def foreground_area(self):
+        return 0
+
+    def close_eye(self):
+        self.pool.close()
+
+    def update_frame(self):
+        self.contour_grid = None
+        self.contour_arrays = None
+
+        dropped_before = self.pool.dropped_detections
+        received = self.pool.poll()
+        if not received and not self.pool.is_running:
+            # every camera reached its end
+            self.frame, self.moving_contours, self.detections = None, [], []
+            return
+
+        self.frame = np.zeros((self.FRAME_H, self.FRAME_W, 3), np.uint8)
+        self.frame_timestamp = max((d.timestamp for d in received), default=monotonic())
+        self.dropped_frames = self.pool.dropped_detections - dropped_before
+
+        self.detections = self.pool.fresh_detections(self.frame_timestamp)
+        degrees, sizes = merge_detections([d for d in self.detections if not d.is_blind], self.pool.specs)
+        self.moving_contours = self.project(degrees, sizes)
+
+    def project(self, degrees: np.ndarray, sizes: np.ndarray) -> List[Contour]:
+        # Contours in beam camera pixels around deg_coordinate, largest first
+        offsets = (degrees - self.deg_coordinate.as_tuple()) * BEAM_PIXELS_PER_DEGREE
+        centers = np.rint(np.array(self.BEAM_CENTER_POINT.as_tuple()) - offsets).astype(np.int64)
+        w, h = np.maximum(np.rint(sizes[:, :2]).astype(np.int64), 1).T
+        areas = np.rint(sizes[:, 2]).astype(np.int64)
+
+        contours = [Contour.from_stats(int(cx - bw // 2), int(cy - bh // 2), int(bw), int(bh), int(area),
+                                       frame_middle_point=self.BEAM_CENTER_POINT)
+                    for (cx, cy), bw, bh, area in zip(centers.tolist(), w.tolist(), h.tolist(), areas.tolist())]
+        return sorted(contours, key=lambda c: -c.area)
@@ -0,0 +1,108 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterator
+
+import cv2
+import numpy as np
+
+from utills import Contour, PixelVector, DegVector, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+from utills import DegVectorArray, PixelVectorArray
+
+
+def abs_degree_locations(center_points, frame_middle_point: PixelVector, frame_degree: DegVector, degree_lut=None):
+    # Vectorized Contour.get_abs_degree_location of (N, 2) integer centers - (N, 2) array of (x, y) degrees
+    if degree_lut is not None:
+        return degree_lut.get_abs_degree_locations(frame_degree, center_points[:, 0], center_points[:, 1])
+
+    direction_vectors = np.array(frame_middle_point.as_tuple()) - center_points
+
+    x_degree = frame_degree.x + direction_vectors[:, 0] / X_PIXEL_TO_DEGREE_NORM_CONST
+    y_degree = frame_degree.y + direction_vectors[:, 1] / Y_PIXEL_TO_DEGREE_NORM_CONST
+
+    return np.stack([np.trunc(x_degree), np.trunc(y_degree)], axis=1).astype(np.int64)
+
+
+def degrees_inside_border(degree_locations):
+    # Vectorized DegVector.is_inside_border
+    return DegVectorArray(degree_locations).is_inside_border
+
+
+@dataclass
+class ContourBatch:
+    """
+    Struct of arrays of all the moving blobs in a frame, sorted by area (largest first).
+    Built with a single cv2.connectedComponentsWithStats call instead of a Contour object per blob.
+    Note - area is the blob pixel count, while Contour.area is the contour polygon area (cv2.contourArea).
+    """
+    frame_middle_point: PixelVector  # Beam center
+
+    x: np.ndarray
+    y: np.ndarray
+    w: np.ndarray
+    h: np.ndarray
+
+    area: np.ndarray  # pixels area
+    centroid: np.ndarray  # (N, 2) float mass center of every blob
+
+    _views: Dict[int, Contour] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_mask(cls, mask, frame_middle_point: PixelVector):
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        # label 0 is the background
+        stats, centroids = stats[1:], centroids[1:]
+        order = np.argsort(-stats[:, cv2.CC_STAT_AREA], kind='stable')
+        stats, centroids = stats[order], centroids[order]
+
+        return cls(frame_middle_point=frame_middle_point,
+                   x=stats[:, cv2.CC_STAT_LEFT],
+                   y=stats[:, cv2.CC_STAT_TOP],
+                   w=stats[:, cv2.CC_STAT_WIDTH],
+                   h=stats[:, cv2.CC_STAT_HEIGHT],
+                   area=stats[:, cv2.CC_STAT_AREA],
+                   centroid=centroids)
+
+    def __len__(self):
+        return len(self.area)
+
+    def __iter__(self) -> Iterator[Contour]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i) -> Contour:
+        # Lazy Contour views - for the drawing code and anything that still works per contour.
+        i = int(i)
+        if i < 0:
+            i += len(self)
+
+        view = self._views.get(i)
+        if view is None:
+            view = Contour.from_stats(int(self.x[i]), int(self.y[i]), int(self.w[i]), int(self.h[i]),
+                                      int(self.area[i]), self.frame_middle_point)
+            self._views[i] = view
+        return view
+
+    @property
+    def total_area(self):
+        return int(self.area.sum())
+
+    @property
+    def center_points(self):
+        # Same integer center as Contour.center_point
+        return np.stack([self.x + self.w // 2, self.y + self.h // 2], axis=1)
+
+    @property
+    def direction_vectors(self):
+        middle = np.array(self.frame_middle_point.as_tuple())
+        return middle - self.center_points
+
+    @property
+    def distances_from_center(self):
+        return PixelVectorArray(self.center_points).distances(self.frame_middle_point)
+
+    def get_abs_degree_locations(self, frame_degree: DegVector, degree_lut=None):
+        # Vectorized Contour.get_abs_degree_location - (N, 2) array of (x, y) degrees
+        return abs_degree_locations(self.center_points, self.frame_middle_point, frame_degree, degree_lut)
+
+    def is_inside_border(self, frame_degree: DegVector, degree_lut=None):
+        return degrees_inside_border(self.get_abs_degree_locations(frame_degree, degree_lut))
@@ -1,12 +1,32 @@
 import datetime
 import glob
 import json
+import queue
 import sys
-from time import sleep
+import threading
+from collections import deque
+from time import sleep, monotonic, perf_counter
 from typing import Optional
 
 import serial
 
+from controller_protocol import FrameParser, encode_command, JSON_HELLO_PAYLOAD, FRAME_TYPE_HELLO_ACK, \
+    FRAME_TYPE_COMMAND_ACK
+
+DMX_PORT = 'COM5'
+DMX_BAUDRATE = 256_000
+
+KEEPALIVE_SEC = 1.0  # identical payloads are re-sent only this often
+IO_POLL_SEC = 0.005  # how often the I/O thread checks for controller replies when there is nothing to send
+REPLIES_QUEUE_SIZE = 256
+
+PROTOCOL_JSON = 'json'
+PROTOCOL_BINARY = 'binary'
+PROTOCOL_AUTO = 'auto'  # binary if the firmware answers the hello, json otherwise
+NEGOTIATION_TIMEOUT_SEC = 0.3
+
+RTT_HISTORY_SIZE = 1000
+
 def serial_ports():
     """ Lists serial port names
 
@@ -42,22 +62,108 @@ class DMXSocket:
 
     instruction_payload: Optional[dict] = None
 
-    def __init__(self):
+    recorder = None  # SessionRecorder - every payload written and every reply read is recorded
+    metrics = None  # TrackerMetrics - serial write/read latency and command round trips
+
+    def __init__(self, port=DMX_PORT, async_io=False, keepalive_sec=KEEPALIVE_SEC, protocol=PROTOCOL_JSON,
+                 recorder=None, metrics=None):
+        self.recorder = recorder
+        self.metrics = metrics
+
         print(serial_ports())
         try:
-            self.ser = serial.Serial('COM5', baudrate=256_000)
+            self.ser = serial.Serial(port, baudrate=DMX_BAUDRATE)
             print(self.ser.name)  # check which port was really used
         except Exception as e:
-            print('no connection to dmx - cam only mode. {e}')  # check which port was really used
+            print(f'no connection to dmx - cam only mode. {e}')  # check which port was really used
             self.ser = None
 
+        self.async_io = async_io
+        self.keepalive_sec = keepalive_sec
+
+        # binary protocol - sequence numbers match controller acks to commands for round trip times
+        self.frame_parser = FrameParser()
+        self._seq = 0
+        self._sent_times = {}
+        self.command_rtts = deque(maxlen=RTT_HISTORY_SIZE)  # seconds
+
+        self.is_binary_protocol = protocol == PROTOCOL_BINARY
+        if protocol == PROTOCOL_AUTO and self.ser is not None:
+            self.is_binary_protocol = self.negotiate_binary_protocol()
+
+        # async mode - the I/O thread owns the port, send_json only posts the newest payload
+        self.replies: queue.Queue = queue.Queue(maxsize=REPLIES_QUEUE_SIZE)
+        self._io_cond = threading.Condition()
+        self._posted_payload: Optional[dict] = None
+        self._posted_print = False
+        self._is_closing = False
+        self._io_thread: Optional[threading.Thread] = None
+
+        if self.async_io and self.ser is not None:
+            self._io_thread = threading.Thread(target=self._io_loop, name='DMXSocketIO', daemon=True)
+            self._io_thread.start()
+
     def terminate_connection(self):
         if self.ser is None:
             print('no connection to dmx - cam only mode.')
             return
 
+        if self._io_thread is not None:
+            with self._io_cond:
+                self._is_closing = True
+                self._io_cond.notify_all()
+            self._io_thread.join(timeout=1)
+            self._io_thread = None
+
         self.ser.close()  # close port
 
+    def negotiate_binary_protocol(self) -> bool:
+        self.ser.write(self.encode_json(JSON_HELLO_PAYLOAD))
+
+        beginning = monotonic()
+        while monotonic() - beginning < NEGOTIATION_TIMEOUT_SEC:
+            bytes_to_read = self.ser.inWaiting()
+            if not bytes_to_read:
+                sleep(IO_POLL_SEC)
+                continue
+
+            frames = self.frame_parser.feed(self.ser.read(bytes_to_read))
+            if any(frame.frame_type == FRAME_TYPE_HELLO_ACK for frame in frames):
+                print('controller supports the binary protocol')
+                return True
+
+        print('no binary protocol hello from the controller - using json')
+        return False
+
+    @staticmethod
+    def encode_json(instruction_payload: dict) -> bytes:
+        json_str = json.dumps(instruction_payload).replace(': ', ':').replace(', ', ',')
+        return json_str.encode('utf-8')
+
+    def encode_payload(self, instruction_payload: dict) -> bytes:
+        if not self.is_binary_protocol:
+            return self.encode_json(instruction_payload)
+
+        self._seq = (self._seq + 1) & 0xFFFF
+        self._sent_times[self._seq] = monotonic()
+        if len(self._sent_times) > RTT_HISTORY_SIZE:
+            self._sent_times.pop(next(iter(self._sent_times)))  # never acked
+
+        return encode_command(self._seq, instruction_payload)
+
+    def handle_received_frames(self, received_bytes: bytes):
+        frames = self.frame_parser.feed(received_bytes)
+        now = monotonic()
+
+        for frame in frames:
+            sent_time = self._sent_times.pop(frame.seq, None)
+            if frame.frame_type == FRAME_TYPE_COMMAND_ACK and sent_time is not None:
+                self.command_rtts.append(now - sent_time)
+                if self.metrics:
+                    self.metrics.command_rtt_seconds.observe(now - sent_time)
+
+        return frames
+
     def send_json(self, instruction_payload: Optional[dict] = None, print_return_payload=True):
         if self.ser is None:
             print('no connection to dmx - cam only mode.')
@@ -67,22 +173,115 @@ class DMXSocket:
         if instruction_payload is None:
             return
 
-        json_str = json.dumps(instruction_payload).replace(': ', ':').replace(', ', ',')
-        bytes_str = json_str.encode('utf-8')
+        if self.async_io:
+            return self.post_json(instruction_payload, print_return_payload)
+
+        bytes_str = self.encode_payload(instruction_payload)
         if print_return_payload:
             print(bytes_str)
 
+        write_started = perf_counter()
         self.ser.write(bytes_str)  # write a string
+        if self.metrics:
+            self.metrics.serial_write_seconds.observe(perf_counter() - write_started)
+        if self.recorder:
+            self.recorder.record_sent(bytes_str)
         # self.ser.flush()
 
         return self.read_controller_ext_msg(print_return_payload=print_return_payload)
 
+    def post_json(self, instruction_payload: dict, print_return_payload=False):
+        # Latest wins - a payload that was not written yet is replaced, the caller never waits on the port
+        with self._io_cond:
+            self._posted_payload = dict(instruction_payload)
+            self._posted_print = print_return_payload
+            self._io_cond.notify()
+
+    def get_replies(self):
+        replies = []
+        while True:
+            try:
+                replies.append(self.replies.get_nowait())
+            except queue.Empty:
+                return replies
+
+    def _push_reply(self, reply):
+        if self.replies.full():
+            try:
+                self.replies.get_nowait()  # drop the oldest reply
+            except queue.Empty:
+                pass
+        self.replies.put_nowait(reply)
+
+    def _io_loop(self):
+        last_sent_payload, last_sent_time = None, None
+        reply_buffer = ''
+
+        while True:
+            with self._io_cond:
+                if self._posted_payload is None and not self._is_closing:
+                    self._io_cond.wait(timeout=IO_POLL_SEC)
+
+                if self._is_closing:
+                    return
+
+                payload, print_payload = self._posted_payload, self._posted_print
+                self._posted_payload = None
+
+            payload = payload or last_sent_payload
+            now = monotonic()
+            is_keepalive_due = last_sent_time is not None and now - last_sent_time >= self.keepalive_sec
+
+            try:
+                if payload is not None and (payload != last_sent_payload or is_keepalive_due):
+                    bytes_str = self.encode_payload(payload)
+                    if print_payload:
+                        print(bytes_str)
+
+                    write_started = perf_counter()
+                    self.ser.write(bytes_str)
+                    if self.metrics:
+                        self.metrics.serial_write_seconds.observe(perf_counter() - write_started)
+                    last_sent_payload, last_sent_time = payload, now
+                    if self.recorder:
+                        self.recorder.record_sent(bytes_str)
+
+                bytes_to_read = self.ser.inWaiting()
+                if bytes_to_read:
+                    read_started = perf_counter()
+                    received_bytes = self.ser.read(bytes_to_read)
+                    if self.metrics:
+                        self.metrics.serial_read_seconds.observe(perf_counter() - read_started)
+                else:
+                    received_bytes = b''
+                if received_bytes and self.recorder:
+                    self.recorder.record_received(received_bytes)
+            except (OSError, serial.SerialException) as e:
+                print(f'dmx I/O error - {e}')
+                if self.metrics:
+                    self.metrics.serial_errors.inc()
+                sleep(IO_POLL_SEC)
+                continue
+
+            if self.is_binary_protocol:
+                for frame in self.handle_received_frames(received_bytes):
+                    self._push_reply(frame)
+                continue
+
+            reply_buffer += received_bytes.decode(errors='replace')
+
+            *lines, reply_buffer = reply_buffer.split('\n')
+            for line in lines:
+                if line.strip():
+                    self._push_reply(line.strip())
+
     def read_controller_ext_msg(self, print_return_payload=True):
         if self.ser is None:
             print('no connection to dmx - cam only mode.')
             return
 
         controller_ext_msg = ''
+        read_started = perf_counter()
 
         # Arduino response time
         # sleep(0.01)
@@ -90,14 +289,25 @@ class DMXSocket:
         while True:
             bytes_to_read = self.ser.inWaiting()
 
-            if bytes_to_read:
-                received_bytes = self.ser.read(bytes_to_read).decode()
+            received_raw_bytes = self.ser.read(bytes_to_read) if bytes_to_read else b''
+            if received_raw_bytes and self.recorder:
+                self.recorder.record_received(received_raw_bytes)
+
+            if bytes_to_read and self.is_binary_protocol:
+                frames = self.handle_received_frames(received_raw_bytes)
+                if print_return_payload:
+                    print(frames)
+                controller_ext_msg += ''.join(f'{frame}\n' for frame in frames)
+            elif bytes_to_read:
+                received_bytes = received_raw_bytes.decode()
                 if print_return_payload:
                     print(received_bytes)
                 controller_ext_msg += received_bytes
 
             if bytes_to_read == 0:
                 break
+        if self.metrics:
+            self.metrics.serial_read_seconds.observe(perf_counter() - read_started)
         if print_return_payload:
             print(f"{controller_ext_msg=}")
 
@@ -0,0 +1,113 @@
+import struct
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Frame: sync(2) | type(1) | seq(2) | payload length(1) | payload | crc16(2), little endian.
+# The CRC (CRC-16/CCITT-FALSE) covers type, seq, length and payload.
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_HEADER_FORMAT = '<BHB'
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_HEADER_FORMAT)
+FRAME_CRC_FORMAT = '<H'
+FRAME_CRC_SIZE = struct.calcsize(FRAME_CRC_FORMAT)
+MAX_PAYLOAD_SIZE = 255
+
+FRAME_TYPE_HELLO = 0x01
+FRAME_TYPE_COMMAND = 0x02
+FRAME_TYPE_HELLO_ACK = 0x81
+FRAME_TYPE_COMMAND_ACK = 0x82
+
+PROTOCOL_VERSION = 1
+
+# beam brightness, x degree, y degree, speed
+COMMAND_PAYLOAD_FORMAT = '<BhhB'
+ACK_PAYLOAD_FORMAT = '<B'  # status, 0 - ok
+
+# Sent as JSON so old firmware just ignores it - new firmware answers with a binary HELLO_ACK frame
+JSON_HELLO_PAYLOAD = {'hello': PROTOCOL_VERSION}
+
+
+def crc16_ccitt(data: bytes, crc: int = 0xFFFF) -> int:
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+            crc &= 0xFFFF
+    return crc
+
+
+@dataclass
+class Frame:
+    frame_type: int
+    seq: int
+    payload: bytes = b''
+
+
+def encode_frame(frame_type: int, seq: int, payload: bytes = b'') -> bytes:
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ValueError(f'payload too long - {len(payload)} bytes')
+
+    body = struct.pack(FRAME_HEADER_FORMAT, frame_type, seq & 0xFFFF, len(payload)) + payload
+    return FRAME_SYNC + body + struct.pack(FRAME_CRC_FORMAT, crc16_ccitt(body))
+
+
+def encode_command(seq: int, instruction_payload: dict) -> bytes:
+    payload = struct.pack(COMMAND_PAYLOAD_FORMAT,
+                          int(instruction_payload.get('b', 0)),
+                          int(instruction_payload.get('x', 0)),
+                          int(instruction_payload.get('y', 0)),
+                          int(instruction_payload.get('v', 0)))
+    return encode_frame(FRAME_TYPE_COMMAND, seq, payload)
+
+
+def decode_command(payload: bytes) -> dict:
+    b, x, y, v = struct.unpack(COMMAND_PAYLOAD_FORMAT, payload)
+    return {'b': b, 'x': x, 'y': y, 'v': v}
+
+
+class FrameParser:
+    """
+    Incremental frame parser - feed it whatever bytes arrived, get back the complete valid frames.
+    Garbage and frames with a bad CRC are skipped by re-syncing on the next sync bytes.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.crc_errors = 0
+
+    def feed(self, data: bytes) -> List[Frame]:
+        self._buffer += data
+        frames = []
+
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def _next_frame(self) -> Optional[Frame]:
+        while True:
+            sync_index = self._buffer.find(FRAME_SYNC)
+            if sync_index < 0:
+                # keep a trailing half sync
+                del self._buffer[:max(len(self._buffer) - 1, 0)]
+                return None
+            del self._buffer[:sync_index]
+
+            if len(self._buffer) < len(FRAME_SYNC) + FRAME_HEADER_SIZE:
+                return None
+
+            frame_type, seq, length = struct.unpack_from(FRAME_HEADER_FORMAT, self._buffer, len(FRAME_SYNC))
+            frame_size = len(FRAME_SYNC) + FRAME_HEADER_SIZE + length + FRAME_CRC_SIZE
+            if len(self._buffer) < frame_size:
+                return None
+
+            body = bytes(self._buffer[len(FRAME_SYNC):frame_size - FRAME_CRC_SIZE])
+            crc, = struct.unpack_from(FRAME_CRC_FORMAT, self._buffer, frame_size - FRAME_CRC_SIZE)
+
+            if crc != crc16_ccitt(body):
+                self.crc_errors += 1
+                del self._buffer[:1]  # not a real frame start, look for the next sync
+                continue
+
+            del self._buffer[:frame_size]
+            return Frame(frame_type=frame_type, seq=seq, payload=body[FRAME_HEADER_SIZE:])
@@ -0,0 +1,129 @@
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from utills import DegVector, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+from utills import DEGREES_X_MIN, DEGREES_X_MAX, DEGREES_Y_MIN, DEGREES_Y_MAX
+
+X_DIRECTIONS = [(1, 0), (-1, 0)]
+Y_DIRECTIONS = [(0, 1), (0, -1)]
+
+# measurements this far from the lens constants are failed matches (or halved legacy values), not lens distortion
+MIN_SCALE_RATIO = 0.5
+MAX_SCALE_RATIO = 2.0
+
+
+def is_plausible_pixels_per_degree(value, default_value) -> bool:
+    return value is not None and MIN_SCALE_RATIO * default_value <= value <= MAX_SCALE_RATIO * default_value
+
+
+def _fill_missing_along_axis(grid, axis):
+    # Linear interpolation between calibrated points along one axis, edges take the nearest calibrated value.
+    grid = np.moveaxis(grid, axis, -1).copy()
+    positions = np.arange(grid.shape[-1])
+
+    for line in grid.reshape(-1, grid.shape[-1]):
+        is_valid = ~np.isnan(line)
+        if is_valid.any() and not is_valid.all():
+            line[~is_valid] = np.interp(positions[~is_valid], positions[is_valid], line[is_valid])
+
+    return np.moveaxis(grid, -1, axis)
+
+
+def pixels_per_degree_grid(mapper_dict: dict, directions, default_value):
+    """
+    (Y degrees, X degrees) grid of pixels moved per one degree, built from the calibration mapper.
+    Points that were not calibrated, or whose values are implausible, are interpolated from their neighbours.
+    """
+    grid = np.full((DEGREES_Y_MAX - DEGREES_Y_MIN + 1, DEGREES_X_MAX - DEGREES_X_MIN + 1), np.nan)
+
+    for (x_degree, y_degree), point_mapping_dict in (mapper_dict or {}).items():
+        if not (DEGREES_X_MIN <= x_degree <= DEGREES_X_MAX and DEGREES_Y_MIN <= y_degree <= DEGREES_Y_MAX):
+            continue
+
+        values = [point_mapping_dict.get(d) for d in directions]
+        values = [v for v in values if is_plausible_pixels_per_degree(v, default_value)]
+        if values:
+            grid[y_degree - DEGREES_Y_MIN, x_degree - DEGREES_X_MIN] = sum(values) / len(values)
+
+    grid = _fill_missing_along_axis(grid, axis=1)
+    grid = _fill_missing_along_axis(grid, axis=0)
+
+    grid[np.isnan(grid)] = default_value
+    return grid
+
+
+def _degrees_per_pixel_offset(pixels_per_degree_line, pixel_offsets):
+    """
+    For every frame degree on a line of the degrees grid, the absolute degree of every pixel offset from center.
+    Integrates the pixel scale along the way, so far pixels use the scale of the degrees they actually lie on.
+    """
+    edge_pad = int(math.ceil(np.abs(pixel_offsets).max() / pixels_per_degree_line.min())) + 1
+    padded_scale = np.pad(pixels_per_degree_line, edge_pad, mode='edge')
+
+    degrees = np.arange(len(padded_scale), dtype=np.float64) - edge_pad
+    step_pixels = (padded_scale[:-1] + padded_scale[1:]) / 2
+    cumulative_pixels = np.concatenate([[0], np.cumsum(step_pixels)])
+
+    line_degrees = np.empty((len(pixels_per_degree_line), len(pixel_offsets)), dtype=np.float32)
+    for i in range(len(pixels_per_degree_line)):
+        origin_pixels = cumulative_pixels[i + edge_pad]
+        line_degrees[i] = np.interp(origin_pixels + pixel_offsets, cumulative_pixels, degrees)
+
+    # snap float noise so whole degrees truncate like the constant division did
+    return np.round(line_degrees, 5)
+
+
+@dataclass
+class PixelDegreeLUT:
+    """
+    Dense lookup from (frame degree, pixel column/row) to the absolute degree of that pixel.
+    x_lut[y_degree, x_degree, column] and y_lut[y_degree, x_degree, row] hold degree offsets from the grid origin.
+    """
+    frame_w: int
+    frame_h: int
+
+    x_lut: np.ndarray
+    y_lut: np.ndarray
+
+    @classmethod
+    def from_mapper(cls, mapper_dict: Optional[dict], frame_w: int, frame_h: int):
+        x_scale = pixels_per_degree_grid(mapper_dict, X_DIRECTIONS, X_PIXEL_TO_DEGREE_NORM_CONST)
+        y_scale = pixels_per_degree_grid(mapper_dict, Y_DIRECTIONS, Y_PIXEL_TO_DEGREE_NORM_CONST)
+
+        # direction vector is frame middle - pixel, positive direction means a larger degree
+        column_offsets = (frame_w // 2 - np.arange(frame_w)).astype(np.float64)
+        row_offsets = (frame_h // 2 - np.arange(frame_h)).astype(np.float64)
+
+        x_lut = np.stack([_degrees_per_pixel_offset(x_scale[iy], column_offsets) for iy in range(x_scale.shape[0])])
+        y_lut = np.stack([_degrees_per_pixel_offset(y_scale[:, ix], row_offsets) for ix in range(y_scale.shape[1])],
+                         axis=1)
+
+        return cls(frame_w=frame_w, frame_h=frame_h, x_lut=x_lut, y_lut=y_lut)
+
+    def get_abs_degree_locations(self, frame_degree: DegVector, center_x, center_y, truncate=True):
+        # One gather for all the given pixel centers - (N, 2) int array of absolute (x, y) degrees,
+        # float degrees with truncate=False
+        ix = min(max(frame_degree.x, DEGREES_X_MIN), DEGREES_X_MAX) - DEGREES_X_MIN
+        iy = min(max(frame_degree.y, DEGREES_Y_MIN), DEGREES_Y_MAX) - DEGREES_Y_MIN
+
+        columns = np.clip(center_x, 0, self.frame_w - 1)
+        rows = np.clip(center_y, 0, self.frame_h - 1)
+
+        x_degrees = DEGREES_X_MIN + self.x_lut[iy, ix, columns]
+        y_degrees = DEGREES_Y_MIN + self.y_lut[iy, ix, rows]
+
+        # origin grid offset of the frame degree itself (frame degree may be out of the calibrated grid)
+        x_degrees += frame_degree.x - (DEGREES_X_MIN + ix)
+        y_degrees += frame_degree.y - (DEGREES_Y_MIN + iy)
+
+        if not truncate:
+            return np.stack([x_degrees, y_degrees], axis=-1).astype(np.float64)
+
+        return np.stack([np.trunc(x_degrees), np.trunc(y_degrees)], axis=-1).astype(np.int64)
+
+    def get_abs_degree_location(self, frame_degree: DegVector, center_point) -> DegVector:
+        x_degree, y_degree = self.get_abs_degree_locations(frame_degree, center_point.x, center_point.y).tolist()
+        return DegVector(x=x_degree, y=y_degree)
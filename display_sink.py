@@ -0,0 +1,232 @@
+import queue
+import sys
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+from typing import Optional
+
+import cv2
+
+NO_KEY = -1
+
+DISPLAY_NONE = 'none'
+DISPLAY_SCREEN = 'screen'
+DISPLAY_MJPEG = 'mjpeg'
+
+DEFAULT_MAX_FPS = 15
+MJPEG_PORT = 8080
+MJPEG_QUALITY = 80
+MJPEG_BOUNDARY = b'frame'
+
+WINDOW_NAME = 'frame'
+
+
+class KeyboardInput:
+    """ Pluggable key source - read_key returns the next pressed key code or NO_KEY, never blocks """
+
+    def read_key(self) -> int:
+        return NO_KEY
+
+    def close(self):
+        pass
+
+
+class QueueKeyboardInput(KeyboardInput):
+    def __init__(self):
+        self.keys = queue.Queue()
+
+    def push_key(self, key):
+        if key != NO_KEY:
+            self.keys.put(key)
+
+    def read_key(self) -> int:
+        try:
+            return self.keys.get_nowait()
+        except queue.Empty:
+            return NO_KEY
+
+
+class StdinKeyboardInput(QueueKeyboardInput):
+    """ Headless key source - every character typed in the terminal (followed by enter) is a key press """
+
+    def __init__(self):
+        super().__init__()
+        self._thread = threading.Thread(target=self._run, name='StdinKeyboardInput', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for line in sys.stdin:
+            for char in line.strip():
+                self.push_key(ord(char))
+
+
+class DisplaySink(ABC):
+    """
+    Where debug frames go. The hot loop asks wants_frame() first and only draws overlays when it says yes,
+    show() hands the frame over without waiting for the rendering.
+    """
+
+    def __init__(self, max_fps=DEFAULT_MAX_FPS):
+        self.min_frame_interval = 1 / max_fps if max_fps else 0
+        self._last_shown: Optional[float] = None
+
+        self._cond = threading.Condition()
+        self._pending_frame = None
+        self._is_closing = False
+        self._thread: Optional[threading.Thread] = None
+
+    def wants_frame(self) -> bool:
+        return self._last_shown is None or monotonic() - self._last_shown >= self.min_frame_interval
+
+    def show(self, frame):
+        self._last_shown = monotonic()
+        with self._cond:
+            self._pending_frame = frame  # latest wins, a frame not rendered yet is dropped
+            self._cond.notify()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        with self._cond:
+            self._is_closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _next_frame(self, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending_frame is not None or self._is_closing, timeout=timeout)
+            frame, self._pending_frame = self._pending_frame, None
+            return frame
+
+    def _run(self):
+        while not self._is_closing:
+            frame = self._next_frame()
+            if frame is not None:
+                self.render(frame)
+
+    @abstractmethod
+    def render(self, frame):
+        # on the sink thread - the newest frame handed to show()
+        pass
+
+
+class NullDisplaySink(DisplaySink):
+    def wants_frame(self) -> bool:
+        return False
+
+    def show(self, frame):
+        pass
+
+    def render(self, frame):
+        pass
+
+
+class ScreenDisplaySink(DisplaySink):
+    """
+    HighGUI window rendered on its own thread. The window thread also polls the keyboard,
+    pressed keys are available through `keyboard`.
+    """
+
+    def __init__(self, max_fps=DEFAULT_MAX_FPS, window_name=WINDOW_NAME):
+        super().__init__(max_fps)
+        self.window_name = window_name
+        self.keyboard = QueueKeyboardInput()
+
+    def _run(self):
+        while not self._is_closing:
+            # keep pumping window events between frames so key presses are not missed
+            frame = self._next_frame(timeout=self.min_frame_interval or 0.05)
+            if frame is not None:
+                self.render(frame)
+            self.keyboard.push_key(cv2.waitKeyEx(1))
+
+        cv2.destroyWindow(self.window_name)
+
+    def render(self, frame):
+        cv2.imshow(self.window_name, frame)
+
+
+class MJPEGDisplaySink(DisplaySink):
+    """ Serves the debug frames as an MJPEG stream on http://127.0.0.1:<port>/ """
+
+    def __init__(self, max_fps=DEFAULT_MAX_FPS, port=MJPEG_PORT, host='127.0.0.1', quality=MJPEG_QUALITY):
+        super().__init__(max_fps)
+        self.quality = quality
+
+        self.jpeg_cond = threading.Condition()
+        self.jpeg: Optional[bytes] = None
+        self.jpeg_seq = 0
+
+        self.server = ThreadingHTTPServer((host, port), MJPEGStreamHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+        self._server_thread = threading.Thread(target=self.server.serve_forever, name='MJPEGServer', daemon=True)
+
+    def start(self):
+        self._server_thread.start()
+        return super().start()
+
+    def close(self):
+        super().close()
+        with self.jpeg_cond:
+            self.jpeg_cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def render(self, frame):
+        is_encoded, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not is_encoded:
+            return
+
+        with self.jpeg_cond:
+            self.jpeg = jpeg.tobytes()
+            self.jpeg_seq += 1
+            self.jpeg_cond.notify_all()
+
+
+class MJPEGStreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        sink: MJPEGDisplaySink = self.server.sink
+
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY.decode()}')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        last_seq = None
+        while not sink._is_closing:
+            with sink.jpeg_cond:
+                sink.jpeg_cond.wait_for(lambda: sink.jpeg_seq != last_seq or sink._is_closing, timeout=1)
+                jpeg, last_seq = sink.jpeg, sink.jpeg_seq
+
+            if jpeg is None:
+                continue
+
+            try:
+                self.wfile.write(b'--' + MJPEG_BOUNDARY + b'\r\n'
+                                 b'Content-Type: image/jpeg\r\n'
+                                 b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_display(mode, max_fps=DEFAULT_MAX_FPS):
+    # (display sink, keyboard input) for the state machine
+    if mode == DISPLAY_SCREEN:
+        sink = ScreenDisplaySink(max_fps).start()
+        return sink, sink.keyboard
+
+    if mode == DISPLAY_MJPEG:
+        sink = MJPEGDisplaySink(max_fps).start()
+        print(f'debug stream on http://127.0.0.1:{sink.server.server_address[1]}/')
+        return sink, StdinKeyboardInput()
+
+    return NullDisplaySink(), StdinKeyboardInput()
@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+EGO_MOTION_WIDTH = 160  # phase correlation frame width, the height keeps the aspect ratio
+MOVING_SHIFT_TH_PX = 2.0  # full resolution pixels between consecutive frames
+MIN_CONFIDENCE = 0.1  # phaseCorrelate peak response - low on featureless or motion blurred frames
+UNRELIABLE_HOLD_FRAMES = 3  # unreliable estimates keep the last decision only this long - a flat scene is still
+HOT_CLIP_PERCENTILE = 90  # people are the hottest pixels - clipped so walking crowds do not look like a pan
+
+
+@dataclass
+class EgoMotion:
+    """ Global translation of the scene between two frames, in full resolution pixels """
+    dx: float
+    dy: float
+    confidence: float  # 0 - 1
+
+    @property
+    def magnitude(self):
+        return float(np.hypot(self.dx, self.dy))
+
+    @property
+    def is_reliable(self):
+        return self.confidence >= MIN_CONFIDENCE
+
+    def as_tuple(self):
+        return self.dx, self.dy
+
+
+def small_float_frame(frame, width=EGO_MOTION_WIDTH):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    scale = width / gray.shape[1]
+    small = cv2.resize(gray, (width, max(int(round(gray.shape[0] * scale)), 1)), interpolation=cv2.INTER_AREA)
+    small = small.astype(np.float32)
+    return np.minimum(small, np.percentile(small, HOT_CLIP_PERCENTILE), out=small)
+
+
+def phase_correlate(small_a, small_b, window=None):
+    # (dx, dy) of small_b relative to small_a in small frame pixels, and the peak response
+    if window is None:
+        window = cv2.createHanningWindow(small_a.shape[::-1], cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(small_a, small_b, window)
+    return dx, dy, float(response)
+
+
+def estimate_shift(frame_a, frame_b, width=EGO_MOTION_WIDTH) -> EgoMotion:
+    # One-off estimate between any two frames of the same size (calibration pairs)
+    small_a, small_b = small_float_frame(frame_a, width), small_float_frame(frame_b, width)
+    dx, dy, response = phase_correlate(small_a, small_b)
+    scale = frame_a.shape[1] / small_a.shape[1]
+    return EgoMotion(dx * scale, dy * scale, response)
+
+
+class EgoMotionEstimator:
+    """
+    Camera movement from consecutive frames - phase correlation of small downsampled frames.
+    A pan or tilt is seen as a global translation in the first frame it happens, unlike the MOG2 contour area
+    that also fires on crowds and keeps firing until the background model re-learns.
+    """
+
+    def __init__(self, width=EGO_MOTION_WIDTH, moving_shift_th=MOVING_SHIFT_TH_PX, min_confidence=MIN_CONFIDENCE):
+        self.width = width
+        self.moving_shift_th = moving_shift_th
+        self.min_confidence = min_confidence
+
+        self.previous: Optional[np.ndarray] = None
+        self.window: Optional[np.ndarray] = None
+        self.scale = 1.0
+
+        self.last: Optional[EgoMotion] = None
+        self.is_moving = False
+        self.unreliable_frames = 0
+
+    def reset(self):
+        self.previous, self.last = None, None
+        self.is_moving = False
+        self.unreliable_frames = 0
+
+    def update(self, frame) -> Optional[EgoMotion]:
+        small = small_float_frame(frame, self.width)
+        previous, self.previous = self.previous, small
+
+        if previous is None or previous.shape != small.shape:
+            self.last = None
+            return None
+
+        if self.window is None or self.window.shape != small.shape:
+            self.window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+            self.scale = frame.shape[1] / small.shape[1]
+
+        dx, dy, response = phase_correlate(previous, small, self.window)
+        self.last = EgoMotion(dx * self.scale, dy * self.scale, response)
+
+        # an unreliable estimate (blur mid pan, a flat scene) keeps the previous decision for a few frames
+        if response >= self.min_confidence:
+            self.is_moving = self.last.magnitude > self.moving_shift_th
+            self.unreliable_frames = 0
+        else:
+            self.unreliable_frames += 1
+            if self.unreliable_frames > UNRELIABLE_HOLD_FRAMES:
+                self.is_moving = False
+
+        return self.last
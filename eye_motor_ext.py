@@ -1,16 +1,31 @@
+import threading
+from collections import deque
+from time import monotonic
+from typing import Optional
+
 import requests
+from requests.adapters import HTTPAdapter
 
 ESP_ADDRESS = '192.168.4.1'
 
+CONNECT_TIMEOUT_SEC = 0.3
+READ_TIMEOUT_SEC = 0.5
+FAILURE_BACKOFF_SEC = 1.0  # Wi-Fi hiccup - don't hammer the ESP
+LATENCY_HISTORY_SIZE = 1000
 
-def send_motor_instruction(display_on: bool, eye_azimuth: int = 0):
-    data = {
+
+def motor_instruction_data(display_on: bool, eye_azimuth: int = 0):
+    return {
         'display_on': display_on,
         'eye_azimuth': eye_azimuth,
         'display_custom_text': False,
         'custom_text_data': "hello world"
     }
 
+
+def send_motor_instruction(display_on: bool, eye_azimuth: int = 0):
+    data = motor_instruction_data(display_on, eye_azimuth)
+
     # Step 3: Make the POST request
     response = requests.post(f"http://{ESP_ADDRESS}/json_client", json=data)
 
@@ -18,6 +33,81 @@ def send_motor_instruction(display_on: bool, eye_azimuth: int = 0):
     print(response.text)
 
 
+def keep_alive_session() -> requests.Session:
+    # one connection to the ESP, reused - no retries, the next instruction is newer anyway
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+    session.mount('http://', adapter)
+    return session
+
+
+class EyeMotorClient:
+    """
+    Sends eye motor instructions from a background thread over one keep-alive connection.
+    update() never blocks - only the latest instruction is sent, unchanged instructions are not re-sent.
+    """
+
+    def __init__(self, address=ESP_ADDRESS, timeout=(CONNECT_TIMEOUT_SEC, READ_TIMEOUT_SEC)):
+        self.url = f"http://{address}/json_client"
+        self.timeout = timeout
+
+        self.session = keep_alive_session()
+
+        self.latencies = deque(maxlen=LATENCY_HISTORY_SIZE)  # seconds of successful requests
+        self.sent_count = 0
+        self.failed_count = 0
+
+        self._cond = threading.Condition()
+        self._pending: Optional[dict] = None
+        self._last_sent: Optional[dict] = None
+        self._is_closing = False
+
+        self._thread = threading.Thread(target=self._run, name='EyeMotorClient', daemon=True)
+        self._thread.start()
+
+    def update(self, display_on: bool, eye_azimuth: int = 0):
+        data = motor_instruction_data(display_on, eye_azimuth)
+        with self._cond:
+            if data == self._last_sent and self._pending is None:
+                return
+            self._pending = data
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._is_closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout=sum(self.timeout) + FAILURE_BACKOFF_SEC)
+        self.session.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or self._is_closing)
+                if self._is_closing:
+                    return
+                data, self._pending = self._pending, None
+                self._last_sent = data
+
+            start = monotonic()
+            try:
+                response = self.session.post(self.url, json=data, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                self.failed_count += 1
+                print(f'eye motor instruction failed - {e}')
+                with self._cond:
+                    # retry the newest instruction after a pause, unless a newer one arrives first
+                    self._last_sent = None
+                    if self._pending is None:
+                        self._pending = data
+                    self._cond.wait(timeout=FAILURE_BACKOFF_SEC)
+                continue
+
+            self.latencies.append(monotonic() - start)
+            self.sent_count += 1
+
+
 if __name__ == '__main__':
     send_motor_instruction(display_on=True)
     # send_motor_instruction(display_on=False)
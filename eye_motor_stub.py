@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+
+class EyeMotorStubServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the ESP json_client endpoint - records every instruction, optionally answers slowly.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, response_delay_sec=0.0):
+        super().__init__(('127.0.0.1', port), EyeMotorStubHandler)
+        self.response_delay_sec = response_delay_sec
+        self.instructions: List[dict] = []
+        self.connections_count = 0
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return f'{host}:{port}'
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='EyeMotorStubServer', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class EyeMotorStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the ESP web server
+
+    def setup(self):
+        super().setup()
+        self.server.connections_count += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/json_client':
+            self.send_error(404)
+            return
+
+        if self.server.response_delay_sec:
+            time.sleep(self.server.response_delay_sec)
+
+        self.server.instructions.append(json.loads(body))
+
+        response = b'OK'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    import requests
+
+    from eye_motor_ext import EyeMotorClient
+
+    requests_count = 200
+    with EyeMotorStubServer() as server:
+        url = f'http://{server.address}/json_client'
+
+        start = time.perf_counter()
+        for i in range(requests_count):
+            requests.post(url, json={'eye_azimuth': i})
+        per_call = (time.perf_counter() - start) / requests_count
+        print(f'requests.post per call: {per_call * 1000:.3f} ms, {server.connections_count} connections')
+
+        server.connections_count = 0
+        client = EyeMotorClient(address=server.address)
+        try:
+            start = time.perf_counter()
+            for i in range(requests_count):
+                client.update(display_on=True, eye_azimuth=i)
+            update_sec = (time.perf_counter() - start) / requests_count
+            time.sleep(0.5)
+        finally:
+            client.close()
+
+        latencies = sorted(client.latencies)
+        print(f'EyeMotorClient.update: {update_sec * 1000:.4f} ms per call, '
+              f'{client.sent_count}/{requests_count} updates sent (latest wins), '
+              f'median request {latencies[len(latencies) // 2] * 1000:.3f} ms, '
+              f'{server.connections_count} connections')
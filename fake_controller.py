@@ -0,0 +1,134 @@
+import json
+import os
+import struct
+import threading
+import time
+import tty
+from typing import List, Optional
+
+from controller_protocol import FrameParser, encode_frame, decode_command, FRAME_TYPE_COMMAND, \
+    FRAME_TYPE_COMMAND_ACK, FRAME_TYPE_HELLO_ACK, PROTOCOL_VERSION, ACK_PAYLOAD_FORMAT
+
+
+class FakeController:
+    """
+    Controller extension emulator on a Linux pty - DMXSocket(port=fake.port_name) talks to it like to the real one.
+    binary_firmware=False behaves like the old JSON-only firmware.
+    """
+
+    def __init__(self, binary_firmware=True, reply_delay_sec=0.0):
+        self.binary_firmware = binary_firmware
+        self.reply_delay_sec = reply_delay_sec
+
+        self.commands: List[dict] = []
+        self.raw_bytes_received = 0
+
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._master_fd)
+        tty.setraw(self._slave_fd)
+        self.port_name = os.ttyname(self._slave_fd)
+
+        self._parser = FrameParser()
+        self._json_buffer = ''
+        self.is_binary_mode = False  # after a hello the binary firmware only speaks frames
+        self._is_running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._is_running = True
+        self._thread = threading.Thread(target=self._run, name='FakeController', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._is_running = False
+        os.close(self._master_fd)
+        os.close(self._slave_fd)
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _write(self, data: bytes):
+        if self.reply_delay_sec:
+            time.sleep(self.reply_delay_sec)
+        os.write(self._master_fd, data)
+
+    def _run(self):
+        while self._is_running:
+            try:
+                data = os.read(self._master_fd, 4096)
+            except OSError:
+                return
+
+            self.raw_bytes_received += len(data)
+            if self.is_binary_mode:
+                self._handle_frames(data)
+            else:
+                self._handle_json(data)
+
+    def _handle_json(self, data: bytes):
+        # JSON objects arrive back to back without separators
+        self._json_buffer += data.decode(errors='ignore')
+        decoder = json.JSONDecoder()
+
+        while '{' in self._json_buffer:
+            self._json_buffer = self._json_buffer[self._json_buffer.index('{'):]
+            try:
+                payload, end = decoder.raw_decode(self._json_buffer)
+            except json.JSONDecodeError:
+                return
+            self._json_buffer = self._json_buffer[end:]
+
+            if 'hello' in payload:
+                if self.binary_firmware:
+                    self.is_binary_mode = True
+                    self._json_buffer = ''
+                    self._write(encode_frame(FRAME_TYPE_HELLO_ACK, 0, bytes([PROTOCOL_VERSION])))
+                    return
+                continue
+
+            self.commands.append(payload)
+            self._write(f'ok {json.dumps(payload)}\n'.encode())
+
+        if '{' not in self._json_buffer:
+            self._json_buffer = ''
+
+    def _handle_frames(self, data: bytes):
+        for frame in self._parser.feed(data):
+            if frame.frame_type != FRAME_TYPE_COMMAND:
+                continue
+
+            self.commands.append(decode_command(frame.payload))
+            self._write(encode_frame(FRAME_TYPE_COMMAND_ACK, frame.seq, struct.pack(ACK_PAYLOAD_FORMAT, 0)))
+
+
+if __name__ == '__main__':
+    from controller_ext_socket import DMXSocket, PROTOCOL_AUTO
+
+    commands_count = 1000
+    for binary_firmware in [False, True]:
+        with FakeController(binary_firmware=binary_firmware) as fake:
+            socket = DMXSocket(port=fake.port_name, protocol=PROTOCOL_AUTO)
+            try:
+                start = time.perf_counter()
+                for i in range(commands_count):
+                    socket.send_json({'b': 10, 'x': 30 + i % 120, 'y': 0, 'v': 1}, print_return_payload=False)
+                elapsed = time.perf_counter() - start
+            finally:
+                socket.terminate_connection()
+
+            time.sleep(0.1)
+            protocol = 'binary' if socket.is_binary_protocol else 'json'
+            print(f'{protocol}: {len(fake.commands)}/{commands_count} commands received, '
+                  f'{fake.raw_bytes_received / len(fake.commands):.1f} bytes per command, '
+                  f'{elapsed / commands_count * 1000:.3f} ms per send_json')
+
+            if socket.command_rtts:
+                rtts = sorted(socket.command_rtts)
+                print(f'{protocol}: round trip median {rtts[len(rtts) // 2] * 1000:.3f} ms, '
+                      f'p99 {rtts[int(len(rtts) * 0.99)] * 1000:.3f} ms over {len(rtts)} acked commands')
@@ -1,5 +1,13 @@
+import ast
 import os
+import struct
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from utills import DEGREES_X_MIN, DEGREES_X_MAX, DEGREES_Y_MIN, DEGREES_Y_MAX
 
 
 def stringify_vector_dict(data):
@@ -29,7 +37,7 @@ def get_json_from_file_if_exists(file_path):
     try:
         with open(file_path, 'rb') as f:
             dict_str = f.read().decode('utf-8')
-            pixel_degrees_mapper = eval(dict_str)
+            pixel_degrees_mapper = ast.literal_eval(dict_str)
     except Exception as e:
         print(e)
         pixel_degrees_mapper = {}
@@ -37,3 +45,151 @@ def get_json_from_file_if_exists(file_path):
 
 
 PIXEL_DEGREES_MAPPER_FILE_PATH = Path('./pixel_degrees_dict_file')
+
+CALIBRATION_FILE_PATH = Path('./pixel_degrees_calibration.bin')
+
+CALIBRATION_MAGIC = b'SAURCAL\0'
+CALIBRATION_VERSION = 1
+# magic, version, x_min, x_max, y_min, y_max, directions count - padded to CALIBRATION_HEADER_SIZE
+CALIBRATION_HEADER_FORMAT = '<8sH5h'
+CALIBRATION_HEADER_SIZE = 64
+
+CALIBRATION_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+
+
+@dataclass
+class CalibrationStore:
+    """
+    Fixed shape calibration grid - pixels moved per one degree for every (y degree, x degree, direction).
+    File layout: 64 bytes header, float32 values[y, x, direction], uint8 valid[y, x, direction].
+    """
+    values: np.ndarray
+    valid: np.ndarray
+
+    x_min: int = DEGREES_X_MIN
+    y_min: int = DEGREES_Y_MIN
+
+    file_path: Optional[Path] = None  # set by load / load_if_exists, save() writes back there
+
+    @classmethod
+    def empty(cls, file_path=None):
+        shape = (DEGREES_Y_MAX - DEGREES_Y_MIN + 1, DEGREES_X_MAX - DEGREES_X_MIN + 1, len(CALIBRATION_DIRECTIONS))
+        return cls(values=np.zeros(shape, dtype=np.float32), valid=np.zeros(shape, dtype=np.uint8),
+                   file_path=Path(file_path) if file_path else None)
+
+    @classmethod
+    def load(cls, file_path, mmap=True):
+        """
+        mmap=True maps the file read-only (milliseconds, no copy) - use mmap=False when the store will be updated,
+        a mapped file can not be replaced on Windows.
+        """
+        with open(file_path, 'rb') as f:
+            header = f.read(CALIBRATION_HEADER_SIZE)
+
+        magic, version, x_min, x_max, y_min, y_max, directions = struct.unpack_from(CALIBRATION_HEADER_FORMAT, header)
+        if magic != CALIBRATION_MAGIC:
+            raise ValueError(f'{file_path} is not a calibration file')
+        if version != CALIBRATION_VERSION:
+            raise ValueError(f'unsupported calibration file version {version}')
+
+        shape = (y_max - y_min + 1, x_max - x_min + 1, directions)
+        values_offset = CALIBRATION_HEADER_SIZE
+        valid_offset = values_offset + int(np.prod(shape)) * np.dtype(np.float32).itemsize
+
+        if mmap:
+            values = np.memmap(file_path, dtype=np.float32, mode='r', offset=values_offset, shape=shape)
+            valid = np.memmap(file_path, dtype=np.uint8, mode='r', offset=valid_offset, shape=shape)
+        else:
+            data = Path(file_path).read_bytes()
+            values = np.frombuffer(data, np.float32, int(np.prod(shape)), values_offset).reshape(shape).copy()
+            valid = np.frombuffer(data, np.uint8, int(np.prod(shape)), valid_offset).reshape(shape).copy()
+
+        return cls(values=values, valid=valid, x_min=x_min, y_min=y_min, file_path=Path(file_path))
+
+    @classmethod
+    def load_if_exists(cls, file_path, mmap=True):
+        if not os.path.isfile(file_path):
+            return cls.empty(file_path)
+        return cls.load(file_path, mmap=mmap)
+
+    def save(self, file_path=None):
+        # Atomic - write a temp file next to the target and replace, a crash never leaves a partial file.
+        # Without a file_path the store goes back to the file it was loaded from.
+        file_path = Path(file_path) if file_path else self.file_path
+        if file_path is None:
+            raise ValueError('calibration store was not loaded from a file - pass the file_path to save to')
+        self.file_path = file_path
+
+        y_count, x_count, directions = self.values.shape
+        header = struct.pack(CALIBRATION_HEADER_FORMAT, CALIBRATION_MAGIC, CALIBRATION_VERSION,
+                             self.x_min, self.x_min + x_count - 1, self.y_min, self.y_min + y_count - 1, directions)
+
+        tmp_path = Path(f'{file_path}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(header.ljust(CALIBRATION_HEADER_SIZE, b'\0'))
+            f.write(np.ascontiguousarray(self.values, dtype=np.float32).tobytes())
+            f.write(np.ascontiguousarray(self.valid, dtype=np.uint8).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, file_path)
+
+    def _index(self, point):
+        x_degree, y_degree = point
+        ix, iy = x_degree - self.x_min, y_degree - self.y_min
+        if not (0 <= iy < self.values.shape[0] and 0 <= ix < self.values.shape[1]):
+            return None
+        return iy, ix
+
+    def set_point(self, point, point_mapping_dict: dict):
+        index = self._index(point)
+        if index is None:
+            return
+
+        for d, direction in enumerate(CALIBRATION_DIRECTIONS):
+            value = point_mapping_dict.get(direction)
+            if value is not None:
+                self.values[index + (d,)] = value
+                self.valid[index + (d,)] = 1
+
+    def get_point(self, point) -> dict:
+        index = self._index(point)
+        if index is None:
+            return {}
+
+        return {
+            direction: self.values[index + (d,)].item()
+            for d, direction in enumerate(CALIBRATION_DIRECTIONS)
+            if self.valid[index + (d,)]
+        }
+
+    def is_point_complete(self, point) -> bool:
+        index = self._index(point)
+        return index is not None and bool(self.valid[index].all())
+
+    @classmethod
+    def from_mapper_dict(cls, mapper_dict: dict):
+        store = cls.empty()
+        for point, point_mapping_dict in (mapper_dict or {}).items():
+            store.set_point(point, point_mapping_dict or {})
+        return store
+
+    def to_mapper_dict(self) -> dict:
+        mapper_dict = {}
+        for iy, ix in zip(*np.nonzero(self.valid.any(axis=2))):
+            point = (int(ix) + self.x_min, int(iy) + self.y_min)
+            mapper_dict[point] = self.get_point(point)
+        return mapper_dict
+
+
+def convert_legacy_mapper_file(legacy_file_path=PIXEL_DEGREES_MAPPER_FILE_PATH, file_path=CALIBRATION_FILE_PATH):
+    mapper_dict = get_json_from_file_if_exists(legacy_file_path)
+    store = CalibrationStore.from_mapper_dict(mapper_dict)
+    store.save(file_path)
+
+    print(f'converted {len(mapper_dict)} points from {legacy_file_path} to {file_path}')
+    return store
+
+
+if __name__ == '__main__':
+    convert_legacy_mapper_file()
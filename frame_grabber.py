@@ -0,0 +1,136 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, List
+
+import cv2
+import numpy as np
+
+RING_SIZE = 3  # latest frame + frame held by the reader + one free slot to write into
+WAIT_FOR_FRAME_TIMEOUT_SEC = 1.0
+
+
+@dataclass
+class GrabbedFrame:
+    frame: np.ndarray
+    timestamp: float  # time.monotonic() right after the driver returned the frame
+    seq: int
+    dropped: int  # frames overwritten before being consumed since the previous read
+
+
+class FrameGrabber:
+    """
+    Keeps reading from a cv2.VideoCapture on a dedicated thread into a small preallocated ring buffer.
+    The consumer always gets the newest frame - older frames that were never read are dropped and counted.
+    """
+
+    def __init__(self, cap: cv2.VideoCapture, ring_size: int = RING_SIZE):
+        if ring_size < 3:
+            raise ValueError('ring_size must be at least 3 (latest, reading, writing)')
+
+        self.cap = cap
+        self.ring_size = ring_size
+
+        self._slots: Optional[List[np.ndarray]] = None
+        self._timestamps = [0.0] * ring_size
+        self._seqs = [0] * ring_size
+
+        self._latest_slot: Optional[int] = None
+        self._reading_slot: Optional[int] = None
+        self._write_seq = 0
+        self._last_read_seq = 0
+
+        self.total_dropped = 0
+        self.is_stream_ended = False
+
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='FrameGrabber', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout=WAIT_FOR_FRAME_TIMEOUT_SEC)
+            self._thread = None
+
+    def _allocate_slots(self, first_frame: np.ndarray):
+        self._slots = [np.empty_like(first_frame) for _ in range(self.ring_size)]
+
+    def _free_slot(self) -> int:
+        for i in range(self.ring_size):
+            if i != self._latest_slot and i != self._reading_slot:
+                return i
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._cond:
+                write_slot = self._free_slot() if self._slots is not None else None
+
+            # The driver read happens outside the lock - the slot is neither latest nor being read.
+            if write_slot is None:
+                ret, frame = self.cap.read()
+            else:
+                ret, frame = self.cap.read(self._slots[write_slot])
+            timestamp = time.monotonic()
+
+            if not ret or frame is None:
+                with self._cond:
+                    self.is_stream_ended = True
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                if self._slots is None:
+                    self._allocate_slots(frame)
+                    write_slot = self._free_slot()
+                    np.copyto(self._slots[write_slot], frame)
+                elif frame is not self._slots[write_slot]:
+                    # Driver changed resolution / could not reuse our buffer.
+                    if frame.shape != self._slots[write_slot].shape:
+                        self._allocate_slots(frame)
+                        self._latest_slot = None
+                        self._reading_slot = None
+                        write_slot = self._free_slot()
+                    np.copyto(self._slots[write_slot], frame)
+
+                self._write_seq += 1
+                self._timestamps[write_slot] = timestamp
+                self._seqs[write_slot] = self._write_seq
+                self._latest_slot = write_slot
+
+                self._cond.notify_all()
+
+    def read_latest(self, timeout: float = WAIT_FOR_FRAME_TIMEOUT_SEC) -> Optional[GrabbedFrame]:
+        """
+        Returns the newest frame that was not returned before, waiting up to `timeout` seconds for one.
+        The returned frame array stays valid until the next call to read_latest.
+        """
+        with self._cond:
+            has_new_frame = self._cond.wait_for(
+                lambda: self._write_seq > self._last_read_seq or self.is_stream_ended or self._stop_event.is_set(),
+                timeout=timeout)
+
+            if not has_new_frame or self._write_seq == self._last_read_seq:
+                return None
+
+            slot = self._latest_slot
+            self._reading_slot = slot
+
+            seq = self._seqs[slot]
+            dropped = seq - self._last_read_seq - 1
+            self._last_read_seq = seq
+            self.total_dropped += dropped
+
+            return GrabbedFrame(frame=self._slots[slot], timestamp=self._timestamps[slot], seq=seq, dropped=dropped)
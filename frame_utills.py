@@ -1,7 +1,15 @@
+from dataclasses import dataclass
+
 import cv2
 import numpy as np
 
-import utills
+from auto_cam_movement_detector import find_cam_movement_between_frames
+from utills import X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+
+DISPLACEMENT_PYRAMID_LEVELS = 3
+DISPLACEMENT_SEARCH_MARGIN_PX = 24  # full resolution pixels searched around the expected shift
+DISPLACEMENT_REFINE_RADIUS_PX = 2  # pixels re-searched on every finer pyramid level
+DISPLACEMENT_MIN_CONFIDENCE = 0.5
 
 
 def locate_image_inside_frame(frame, image_to_locate):
@@ -16,41 +24,136 @@ def locate_image_inside_frame(frame, image_to_locate):
         return pt
 
 
-def calc_change_in_pixels(frame_origin_point, frame_post_move, direction_vector):
-    h = frame_origin_point.shape[0]
-    w = frame_origin_point.shape[1]
-
-    third_y = h // 3
-    third_x = w // 3
-
-    crop_img = frame_origin_point[third_y: 2 * third_y, third_x: 2 * third_x]
-
-    cv2.imshow('base', frame_origin_point)
-    cv2.imshow('base_mid_cropped', crop_img)
-
-    pt = locate_image_inside_frame(frame_post_move, crop_img)
-
-    if pt:
-        found_x = pt[0]
-        found_y = pt[1]
-
-        pixels_per_x = found_x - third_x
-        pixels_per_y = found_y - third_y
-    else:
-        pixels_per_x = None
-        pixels_per_y = None
-
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        raise
-
-    if direction_vector.x != 0:
-        text = f"X {direction_vector.x} degrees -> moved {pixels_per_x} pixels."
-        pixels_moved = pixels_per_x
-    else:
-        text = f"Y {direction_vector.y} degrees -> moved {pixels_per_y} pixels."
-        pixels_moved = pixels_per_y
-
-    utills.plant_text_bottom(frame_post_move, text)
-    cv2.imshow('post_move_find', frame_post_move)
-
-    return abs(pixels_moved) if pixels_moved else None
+@dataclass
+class Displacement:
+    """ Shift of the scene content from the origin frame to the post move frame, in pixels """
+    dx: float
+    dy: float
+    confidence: float  # normalized correlation of the match, 0 - 1
+
+    def as_tuple(self):
+        return self.dx, self.dy
+
+
+def expected_pixel_shift(direction_vector, pixels_per_degree=None):
+    # Content moves the same way as the degrees grow - a larger x degree is to the left of the frame center.
+    x_pixels_per_degree, y_pixels_per_degree = pixels_per_degree or (X_PIXEL_TO_DEGREE_NORM_CONST,
+                                                                      Y_PIXEL_TO_DEGREE_NORM_CONST)
+    return direction_vector.x * x_pixels_per_degree, direction_vector.y * y_pixels_per_degree
+
+
+def gray_float_frame(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return gray.astype(np.float32)
+
+
+def match_in_window(frame, template, x_lo, x_hi, y_lo, y_hi):
+    # Best template top left position (x, y) within the inclusive ranges, with its 3x3 score neighbourhood
+    th, tw = template.shape[:2]
+    x_lo, y_lo = max(x_lo, 0), max(y_lo, 0)
+    x_hi, y_hi = min(x_hi, frame.shape[1] - tw), min(y_hi, frame.shape[0] - th)
+    if x_lo > x_hi or y_lo > y_hi:
+        return None
+
+    scores = cv2.matchTemplate(frame[y_lo:y_hi + th, x_lo:x_hi + tw], template, cv2.TM_CCOEFF_NORMED)
+    _, best_score, _, (best_x, best_y) = cv2.minMaxLoc(scores)
+    return x_lo + best_x, y_lo + best_y, best_score, scores, best_x, best_y
+
+
+def subpixel_offset(scores, x, y):
+    # Parabola through the peak and its neighbours, per axis
+    def parabola_peak(left, center, right):
+        denominator = left - 2 * center + right
+        return 0.0 if denominator >= 0 else float(np.clip(0.5 * (left - right) / denominator, -0.5, 0.5))
+
+    dx = parabola_peak(scores[y, x - 1], scores[y, x], scores[y, x + 1]) if 0 < x < scores.shape[1] - 1 else 0.0
+    dy = parabola_peak(scores[y - 1, x], scores[y, x], scores[y + 1, x]) if 0 < y < scores.shape[0] - 1 else 0.0
+    return dx, dy
+
+
+def find_displacement(frame_origin_point, frame_post_move, expected_shift=(0, 0),
+                      search_margin=DISPLACEMENT_SEARCH_MARGIN_PX, levels=DISPLACEMENT_PYRAMID_LEVELS):
+    """
+    Coarse-to-fine template search of the origin frame center inside the post move frame.
+    Only a window of +-search_margin pixels around expected_shift is searched on the coarsest pyramid level,
+    every finer level re-searches +-DISPLACEMENT_REFINE_RADIUS_PX around the upscaled estimate.
+    Returns a sub-pixel Displacement, or None when the expected location is outside the frame.
+    """
+    origin, post = gray_float_frame(frame_origin_point), gray_float_frame(frame_post_move)
+    h, w = origin.shape
+    expected_x, expected_y = int(round(expected_shift[0])), int(round(expected_shift[1]))
+
+    # template - half the frame, placed so that it also fits the frame at the expected location
+    tw, th = w // 2, h // 2
+    tx = int(np.clip((w - tw) // 2 - expected_x // 2, 0, w - tw))
+    ty = int(np.clip((h - th) // 2 - expected_y // 2, 0, h - th))
+
+    origin_pyramid, post_pyramid = [origin], [post]
+    for _ in range(levels - 1):
+        origin_pyramid.append(cv2.pyrDown(origin_pyramid[-1]))
+        post_pyramid.append(cv2.pyrDown(post_pyramid[-1]))
+
+    guess_x, guess_y, radius = None, None, None
+    match = None
+    for level in reversed(range(levels)):
+        scale = 2 ** level
+        level_tx, level_ty, level_tw, level_th = tx // scale, ty // scale, tw // scale, th // scale
+        template = origin_pyramid[level][level_ty:level_ty + level_th, level_tx:level_tx + level_tw]
+
+        if guess_x is None:
+            guess_x, guess_y = (tx + expected_x) // scale, (ty + expected_y) // scale
+            radius = int(np.ceil(search_margin / scale))
+        else:
+            guess_x, guess_y, radius = match[0] * 2, match[1] * 2, DISPLACEMENT_REFINE_RADIUS_PX
+
+        match = match_in_window(post_pyramid[level], template,
+                                guess_x - radius, guess_x + radius, guess_y - radius, guess_y + radius)
+        if match is None:
+            return None
+
+    best_x, best_y, best_score, scores, peak_x, peak_y = match
+    offset_x, offset_y = subpixel_offset(scores, peak_x, peak_y)
+    return Displacement(dx=best_x + offset_x - tx, dy=best_y + offset_y - ty, confidence=float(max(best_score, 0)))
+
+
+def calc_change_in_pixels(frame_origin_point, frame_post_move, direction_vector, pixels_per_degree=None,
+                          min_confidence=DISPLACEMENT_MIN_CONFIDENCE):
+    """
+    Pixels moved along the direction axis, None if the match is not trusted.
+    direction_vector is the commanded move in degrees, several degrees long for coarse calibration steps -
+    the window is at least as wide as the expected shift, so a lens scale up to twice the constants is still found.
+    """
+    expected_x, expected_y = expected_pixel_shift(direction_vector, pixels_per_degree)
+    search_margin = max(DISPLACEMENT_SEARCH_MARGIN_PX, int(np.ceil(max(abs(expected_x), abs(expected_y)))))
+
+    displacement = find_displacement(frame_origin_point, frame_post_move, (expected_x, expected_y), search_margin)
+    if displacement is None or displacement.confidence < min_confidence:
+        return None
+
+    pixels_moved = displacement.dx if direction_vector.x != 0 else displacement.dy
+    return abs(pixels_moved)
+
+
+def calc_pixel_shift_between_frames(frame_origin_point, frame_post_move, direction_vector):
+    # Pixels moved for the commanded direction_vector, the mean of the estimates that worked.
+    # None when no estimate could be made (0 is a measurement)
+    movement_degree_diff = 0
+    diff_formulas_considered = 0
+
+    pixel_diff = calc_change_in_pixels(frame_origin_point, frame_post_move, direction_vector)
+
+    if pixel_diff is not None:
+        movement_degree_diff += pixel_diff
+        diff_formulas_considered += 1
+    try:
+        pixel_diff_2 = find_cam_movement_between_frames(frame_origin_point, frame_post_move)
+        if pixel_diff_2 is not None:
+            movement_degree_diff += pixel_diff_2
+            diff_formulas_considered += 1
+    except:
+        movement_degree_diff += 0
+
+    if not diff_formulas_considered:
+        return None
+
+    return movement_degree_diff / diff_formulas_considered
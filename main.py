@@ -1,25 +1,121 @@
-from controller_ext_socket import DMXSocket
-from file_utills import get_json_from_file_if_exists, PIXEL_DEGREES_MAPPER_FILE_PATH
+import asyncio
+import dataclasses
+import datetime
+import os
+
+from async_runtime import AsyncTowerRuntime
+from camera_pool import CameraPool, CameraSpec, PooledThermalEye
+from controller_ext_socket import DMXSocket, PROTOCOL_JSON, PROTOCOL_AUTO
+from display_sink import create_display, DISPLAY_SCREEN, DISPLAY_MJPEG, DISPLAY_NONE
+from eye_motor_ext import EyeMotorClient, ESP_ADDRESS
+from file_utills import PIXEL_DEGREES_MAPPER_FILE_PATH, CALIBRATION_FILE_PATH, CalibrationStore, \
+    convert_legacy_mapper_file
+from metrics import TrackerMetrics, METRICS_PORT
+from motion import ACTUATION_LATENCY_SEC
+from session_recording import SessionRecorder, RECORDINGS_DIR
+from shm_pipeline import ShmPipeline, PipelineThermalEye
 from state_machine import SauronEyeTowerStateMachine
+from target_tracker import TargetTracker
 from thermal_camera import ThermalEye
 
 if __name__ == '__main__':
-    thermal_eye = ThermalEye(0)
-    dmx_socket = DMXSocket()
+    use_metrics = True  # Prometheus text on http://127.0.0.1:METRICS_PORT/metrics, formatted only when scraped
+    metrics = TrackerMetrics() if use_metrics else None
+    if metrics:
+        metrics.serve(METRICS_PORT)
+
+    use_threaded_capture = False
+    use_ego_motion = True  # camera movement from phase correlation instead of the MOG2 foreground area
+    compensate_ego_motion = True  # background model follows the camera - the eye keeps seeing while it moves
+    eye_kwargs = dict(use_ego_motion=use_ego_motion, compensate_ego_motion=compensate_ego_motion)
+    # several thermal cameras, capture and detection of each one in its own process - e.g. wide + narrow:
+    # [CameraSpec(0, name='wide'), CameraSpec(1, name='narrow', pixels_per_degree=(26, 22))]
+    camera_specs = None
+    # capture and vision in processes of their own, frames over shared memory - this process is the control
+    use_shm_pipeline = False
+    if camera_specs:
+        # the workers detect with the same options as a single camera, a spec's own eye_kwargs win
+        camera_specs = [dataclasses.replace(spec, eye_kwargs={**eye_kwargs, **spec.eye_kwargs})
+                        for spec in camera_specs]
+        thermal_eye = PooledThermalEye(CameraPool(camera_specs).start())
+    elif use_shm_pipeline:
+        thermal_eye = PipelineThermalEye(ShmPipeline(CameraSpec(0, eye_kwargs=eye_kwargs)).start())
+    else:
+        thermal_eye = ThermalEye(0, threaded_capture=use_threaded_capture, use_ego_motion=use_ego_motion,
+                                 compensate_ego_motion=compensate_ego_motion)
+    use_async_dmx = True  # serial I/O on a background thread, the vision loop never waits on the controller
+    # PROTOCOL_AUTO sends a hello and switches to the binary frames if the firmware answers - opt in once the
+    # deployed controller firmware supports it, the JSON lines are what it speaks today
+    dmx_protocol = PROTOCOL_JSON
+    dmx_socket = DMXSocket(async_io=use_async_dmx, protocol=dmx_protocol, metrics=metrics)
+
+    # camera, controller, eye motor and show as asyncio tasks with their own rates - the state machine only decides
+    use_async_runtime = False
+
+    use_eye_motor = False
+    eye_motor = EyeMotorClient() if use_eye_motor and not use_async_runtime else None
+
+    # None keeps cv2.imshow on the main loop, otherwise DISPLAY_SCREEN / DISPLAY_MJPEG / DISPLAY_NONE (headless)
+    debug_display = None
+    display, keyboard = create_display(debug_display) if debug_display else (None, None)
+
+    record_session = False  # frames + controller traffic, replay with session_recording.py
+    recorder = None
+    if record_session:
+        recorder = SessionRecorder(RECORDINGS_DIR / f'{datetime.datetime.now():%Y%m%d_%H%M%S}.rec')
+        dmx_socket.recorder = recorder
+
+    use_non_blocking_moves = True  # the tracker keeps detecting and retargeting while the camera moves
+
+    use_target_tracker = True  # persistent targets with Kalman filters
+    # aim where the target will be after the actuation latency - only helps with fast targets (~5 px per frame),
+    # ordinary walkers lock slower and are locked less with it (benchmark_target_tracking.py)
+    use_lead_aim = False
+    tracker = TargetTracker(lead_time_sec=ACTUATION_LATENCY_SEC if use_lead_aim else 0) if use_target_tracker else None
 
     sauron = SauronEyeTowerStateMachine(
         is_manual=False,
         socket=dmx_socket,
         thermal_eye=thermal_eye,
+        eye_motor=eye_motor,
+        display=display,
+        keyboard=keyboard,
+        non_blocking_moves=use_non_blocking_moves,
+        recorder=recorder,
+        metrics=metrics,
+        tracker=tracker,
     )
 
     use_auto_scale_file = False
+    use_calibration_scheduler = True
     try:
-        if use_auto_scale_file:
-            mapper_dict = get_json_from_file_if_exists(PIXEL_DEGREES_MAPPER_FILE_PATH)
-            sauron.auto_coordinate(mapper_dict)
+        if not os.path.isfile(CALIBRATION_FILE_PATH) and os.path.isfile(PIXEL_DEGREES_MAPPER_FILE_PATH):
+            convert_legacy_mapper_file(PIXEL_DEGREES_MAPPER_FILE_PATH, CALIBRATION_FILE_PATH)
+
+        # calibration updates the store in place, a read-only mapping is enough otherwise
+        calibration_store = CalibrationStore.load_if_exists(CALIBRATION_FILE_PATH, mmap=not use_auto_scale_file)
+        mapper_dict = calibration_store.to_mapper_dict()
+        if use_auto_scale_file and use_calibration_scheduler:
+            sauron.auto_coordinate_scheduled(mapper_dict, calibration_store)
+        elif use_auto_scale_file:
+            sauron.auto_coordinate(mapper_dict, calibration_store)
+        else:
+            sauron.pixel_degrees_mapper = mapper_dict
+            sauron.compile_degree_lut()
 
-        sauron.do_evil()
+        if use_async_runtime:
+            runtime = AsyncTowerRuntime(sauron, eye_motor_address=ESP_ADDRESS if use_eye_motor else None)
+            asyncio.run(runtime.run())
+        else:
+            sauron.do_evil()
     finally:
         dmx_socket.terminate_connection()
+        if eye_motor:
+            eye_motor.close()
+        if display:
+            display.close()
+        if recorder:
+            recorder.close()
+        if metrics:
+            metrics.close()
         thermal_eye.close_eye()
@@ -0,0 +1,289 @@
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+from typing import Dict, Tuple, Optional
+
+METRICS_PORT = 9108
+METRICS_PATH = '/metrics'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(label_names, label_values, extra=None) -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    Base of the exported metrics. Recording is a dict update under an uncontended lock,
+    all the text formatting happens only when the endpoint is scraped.
+    """
+    metric_type = 'untyped'
+
+    def __init__(self, name, help_text, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    @abstractmethod
+    def render_samples(self):
+        # the sample lines of the exposition text - called on every scrape
+        pass
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.metric_type}']
+        lines += self.render_samples()
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def render_samples(self):
+        with self._lock:
+            values = dict(self.values)
+        return [f'{self.name}{format_labels(self.label_names, key)} {format_value(value)}'
+                for key, value in values.items()]
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # per labels - [non cumulative count per bucket + the +Inf bucket, sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket_index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket_index] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        series = self.values.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def render_samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+
+        lines = []
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{format_value(float(upper_bound))}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, key)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, label_names=()) -> Counter:
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, label_names=()) -> Gauge:
+        return self.register(Gauge(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+
+class TrackerMetrics:
+    """
+    The tracking loop metrics. The state machine, DMXSocket and the moves report here,
+    serve() exposes them for Prometheus on http://127.0.0.1:<port>/metrics
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+
+        self.loop_iterations = r.counter('sauron_loop_iterations_total', 'do_evil loop iterations')
+        self.loop_seconds = r.histogram('sauron_loop_duration_seconds', 'do_evil iteration duration')
+
+        self.frames_processed = r.counter('sauron_frames_processed_total', 'frames read and run through MOG2')
+        self.frames_dropped = r.counter('sauron_frames_dropped_total', 'frames dropped by the threaded capture')
+        self.contours_per_frame = r.histogram('sauron_contours_per_frame', 'moving contours found in a frame',
+                                              buckets=COUNT_BUCKETS)
+
+        self.state_seconds = r.counter('sauron_state_seconds_total', 'time spent in each state', ('state',))
+        self.state_entries = r.counter('sauron_state_entries_total', 'times each state was entered', ('state',))
+        self.state_stay_seconds = r.histogram('sauron_state_stay_seconds', 'duration of a single stay in a state',
+                                              ('state',), buckets=DURATION_BUCKETS)
+        self.current_state = r.gauge('sauron_state', '1 for the current state', ('state',))
+
+        self.serial_write_seconds = r.histogram('sauron_serial_write_seconds', 'controller serial write duration')
+        self.serial_read_seconds = r.histogram('sauron_serial_read_seconds', 'controller serial read duration')
+        self.serial_errors = r.counter('sauron_serial_errors_total', 'controller serial I/O errors')
+        self.command_rtt_seconds = r.histogram('sauron_command_rtt_seconds',
+                                               'binary protocol command to ack round trip')
+
+        self.move_seconds = r.histogram('sauron_move_duration_seconds', 'camera move duration, start to settled',
+                                        ('state', 'outcome'), buckets=DURATION_BUCKETS)
+
+        self._state = None
+        self._state_since: Optional[float] = None
+        self._stay_started: Optional[float] = None
+        self._state_lock = threading.Lock()  # a scrape closes the ongoing stay from the server thread
+        self._last_tick: Optional[float] = None
+
+        self.server: Optional[MetricsServer] = None
+
+    def loop_tick(self, now: Optional[float] = None):
+        # called at the top of every loop iteration
+        now = monotonic() if now is None else now
+        if self._last_tick is not None:
+            self.loop_seconds.observe(now - self._last_tick)
+        self._last_tick = now
+        self.loop_iterations.inc()
+
+    def observe_frame(self, contours_count, dropped_frames=0):
+        self.frames_processed.inc()
+        if dropped_frames:
+            self.frames_dropped.inc(dropped_frames)
+        self.contours_per_frame.observe(contours_count)
+
+    def observe_move(self, state, duration_sec, outcome):
+        self.move_seconds.observe(duration_sec, state=state, outcome=outcome)
+
+    def track_state(self, state, now: Optional[float] = None):
+        with self._state_lock:
+            self._track_state(state, monotonic() if now is None else now)
+
+    def _track_state(self, state, now):
+        # time since the previous call is attributed to the previous state
+        previous = self._state
+
+        if previous is not None:
+            self.state_seconds.inc(now - self._state_since, state=previous)
+        self._state_since = now
+
+        if state == previous:
+            return
+
+        if previous is not None:
+            self.state_stay_seconds.observe(now - self._stay_started, state=previous)
+            self.current_state.set(0, state=previous)
+
+        self._state, self._stay_started = state, now
+        if state is not None:
+            self.state_entries.inc(state=state)
+            self.current_state.set(1, state=state)
+
+    def render(self) -> str:
+        with self._state_lock:
+            if self._state is not None:
+                self._track_state(self._state, monotonic())  # the ongoing stay counts up to the scrape
+        return self.registry.render()
+
+    def serve(self, port=METRICS_PORT, host='127.0.0.1'):
+        # a taken port must not keep the tower from starting - metrics are still collected, just not served
+        try:
+            self.server = MetricsServer(self, port, host).start()
+        except OSError as e:
+            print(f'metrics endpoint not served on {host}:{port} - {e}')
+            self.server = None
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, metrics: TrackerMetrics, port=METRICS_PORT, host='127.0.0.1'):
+        super().__init__((host, port), MetricsHandler)
+        self.metrics = metrics
+        self._thread = threading.Thread(target=self.serve_forever, name='MetricsServer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from typing import Optional, Callable
+
+from utills import DegVector
+
+MOVE_DEADLINE_SEC = 5  # same limit the blocking move_to waits for
+MOVE_START_TIMEOUT_SEC = 0.5  # small moves may never be seen as camera movement
+SETTLE_TICKS = 2  # still frames after the movement before the frame is trusted again
+ACTUATION_LATENCY_SEC = 0.25  # instruction sent until the motors move - earlier movement is a previous instruction's
+RETARGET_TOLERANCE_DEG = 1  # a new target this close to the in-flight one updates the move instead of replacing it
+
+
+@dataclass
+class MoveOperation:
+    """
+    An in-flight camera move, advanced once per tick instead of blocking until the camera settles.
+    is_moving_predicate - optional override of the "camera is moving" signal the state machine passes in.
+    """
+    target: DegVector
+    state: str
+    started_at: float
+
+    deadline_sec: float = MOVE_DEADLINE_SEC
+    start_timeout_sec: float = MOVE_START_TIMEOUT_SEC
+    actuation_latency_sec: float = ACTUATION_LATENCY_SEC
+    settle_ticks: int = SETTLE_TICKS
+    is_moving_predicate: Optional[Callable[[], bool]] = None
+
+    saw_movement: bool = False
+    still_ticks: int = 0
+    ticks: int = 0
+
+    is_cancelled: bool = False
+    is_done: bool = False
+    is_timed_out: bool = False
+
+    @property
+    def has_arrived(self):
+        # camera moved and stopped - it is already looking from the target, even while settling
+        return self.saw_movement and self.still_ticks > 0
+
+    @property
+    def outcome(self):
+        if self.is_cancelled:
+            return 'cancelled'
+        if self.is_timed_out:
+            return 'timed_out'
+        return 'arrived' if self.is_done else 'moving'
+
+    def cancel(self):
+        self.is_cancelled = True
+        self.is_done = True
+
+    def advance(self, is_moving: bool, now: float) -> bool:
+        if self.is_done:
+            return True
+
+        if self.is_moving_predicate is not None:
+            is_moving = self.is_moving_predicate()
+
+        self.ticks += 1
+        elapsed = now - self.started_at
+
+        if is_moving:
+            # a retargeted move must not arrive on the movement towards the target it replaced
+            self.saw_movement = self.saw_movement or elapsed >= self.actuation_latency_sec
+            self.still_ticks = 0
+        else:
+            self.still_ticks += 1
+
+        is_settled = self.still_ticks >= self.settle_ticks
+        if self.saw_movement and is_settled:
+            self.is_done = True
+        elif not self.saw_movement and is_settled and elapsed > self.start_timeout_sec:
+            self.is_done = True
+        elif elapsed > self.deadline_sec:
+            self.is_done = self.is_timed_out = True
+
+        return self.is_done
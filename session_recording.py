@@ -0,0 +1,287 @@
+import argparse
+import json
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Iterator, Tuple, List
+
+import cv2
+import numpy as np
+
+from controller_ext_socket import DMXSocket
+from thermal_camera import ThermalEye
+from utills import DegVector
+
+# File: magic + version, then chunks of header (tag, payload length, monotonic timestamp) + payload.
+RECORDING_MAGIC = b'SAURREC\0'
+RECORDING_VERSION = 1
+RECORDING_HEADER_FORMAT = '<8sH'
+CHUNK_HEADER_FORMAT = '<4sId'
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER_FORMAT)
+
+CHUNK_FRAME = b'FRAM'  # '<hh' deg_coordinate + PNG encoded frame (lossless, replay is bit exact)
+CHUNK_SENT = b'SEND'  # bytes written to the controller
+CHUNK_RECEIVED = b'RECV'  # bytes read from the controller
+
+FRAME_DEG_FORMAT = '<hh'
+FRAME_DEG_SIZE = struct.calcsize(FRAME_DEG_FORMAT)
+PNG_COMPRESSION = 1  # fast, still a fraction of raw size
+
+RECORDINGS_DIR = Path('./recordings')
+
+
+class SessionRecorder:
+    """ Appends frames and controller traffic to a chunked recording file, safe to call from several threads """
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._file = open(self.file_path, 'wb')
+        self._file.write(struct.pack(RECORDING_HEADER_FORMAT, RECORDING_MAGIC, RECORDING_VERSION))
+        self._lock = threading.Lock()
+
+    def _write_chunk(self, tag: bytes, payload: bytes, timestamp: Optional[float] = None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(struct.pack(CHUNK_HEADER_FORMAT, tag, len(payload), timestamp))
+            self._file.write(payload)
+
+    def record_frame(self, frame, timestamp: Optional[float], deg_coordinate: DegVector):
+        if frame is None:
+            return
+        is_encoded, png = cv2.imencode('.png', frame, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+        if not is_encoded:
+            return
+        payload = struct.pack(FRAME_DEG_FORMAT, deg_coordinate.x, deg_coordinate.y) + png.tobytes()
+        self._write_chunk(CHUNK_FRAME, payload, timestamp)
+
+    def record_sent(self, data: bytes):
+        self._write_chunk(CHUNK_SENT, data)
+
+    def record_received(self, data: bytes):
+        self._write_chunk(CHUNK_RECEIVED, data)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_chunks(file_path, tags=None) -> Iterator[Tuple[bytes, float, bytes]]:
+    with open(file_path, 'rb') as f:
+        magic, version = struct.unpack(RECORDING_HEADER_FORMAT, f.read(struct.calcsize(RECORDING_HEADER_FORMAT)))
+        if magic != RECORDING_MAGIC:
+            raise ValueError(f'{file_path} is not a session recording')
+        if version != RECORDING_VERSION:
+            raise ValueError(f'unsupported recording version {version}')
+
+        while True:
+            header = f.read(CHUNK_HEADER_SIZE)
+            if len(header) < CHUNK_HEADER_SIZE:
+                return  # end of file, or a chunk cut by a crash
+
+            tag, length, timestamp = struct.unpack(CHUNK_HEADER_FORMAT, header)
+            if tags is not None and tag not in tags:
+                f.seek(length, 1)
+                continue
+
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield tag, timestamp, payload
+
+
+def decode_frame_chunk(payload: bytes):
+    x_degree, y_degree = struct.unpack_from(FRAME_DEG_FORMAT, payload)
+    frame = cv2.imdecode(np.frombuffer(payload, np.uint8, offset=FRAME_DEG_SIZE), cv2.IMREAD_UNCHANGED)
+    return frame, DegVector(x_degree, y_degree)
+
+
+class RecordingCapture:
+    """ cv2.VideoCapture look-alike over the frames of a recording """
+
+    def __init__(self, file_path):
+        self._chunks = read_chunks(file_path, tags={CHUNK_FRAME})
+        self._next = self._decode_next()
+
+        self.timestamp: Optional[float] = None
+        self.deg_coordinate: Optional[DegVector] = None
+
+        first_frame = self._next[0] if self._next else None
+        self.frame_h, self.frame_w = first_frame.shape[:2] if first_frame is not None else (0, 0)
+
+    def _decode_next(self):
+        try:
+            _, timestamp, payload = next(self._chunks)
+        except StopIteration:
+            return None
+        frame, deg_coordinate = decode_frame_chunk(payload)
+        return frame, timestamp, deg_coordinate
+
+    def read(self, image=None):
+        if self._next is None:
+            return False, None
+
+        frame, self.timestamp, self.deg_coordinate = self._next
+        self._next = self._decode_next()
+
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            frame = image
+        return True, frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_w
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_h
+        return 0
+
+    def release(self):
+        self._chunks.close()
+
+
+class ReplayThermalEye(ThermalEye):
+    """ ThermalEye fed from a recording, as fast as frames can be decoded """
+
+    def __init__(self, file_path, use_contour_batch=False, **eye_kwargs):
+        # eye_kwargs - the live ThermalEye options (use_ego_motion, compensate_ego_motion, detection_scale, ...)
+        self.recording_capture = RecordingCapture(file_path)
+        super().__init__(self.recording_capture, use_contour_batch=use_contour_batch, **eye_kwargs)
+
+    @property
+    def recorded_deg_coordinate(self) -> Optional[DegVector]:
+        return self.recording_capture.deg_coordinate
+
+    def read_frame(self):
+        frame = super().read_frame()
+        self.frame_timestamp = self.recording_capture.timestamp
+        return frame
+
+    def close_eye(self):
+        self.cap.release()
+
+
+class ReplayDMXSocket(DMXSocket):
+    """ DMXSocket without a port - keeps what the state machine sends, answers with the recorded replies """
+
+    def __init__(self, file_path=None):
+        self.ser = None
+        self.sent_payloads: List[dict] = []
+        self._replies = (payload for _, _, payload in read_chunks(file_path, tags={CHUNK_RECEIVED})) \
+            if file_path else iter(())
+
+    def terminate_connection(self):
+        pass
+
+    def send_json(self, instruction_payload: Optional[dict] = None, print_return_payload=True):
+        instruction_payload = instruction_payload or self.instruction_payload
+        if instruction_payload is None:
+            return
+
+        self.sent_payloads.append(dict(instruction_payload))
+        return next(self._replies, b'').decode(errors='replace')
+
+
+def replay_session(file_path, use_contour_batch=False, max_frames=None, eye_kwargs: Optional[dict] = None,
+                   tracker=None, pixel_degrees_mapper: Optional[dict] = None):
+    """
+    Runs the recording through SauronEyeTowerStateMachine.calculate_state, with the recorded deg_coordinate
+    for every frame. Returns the per-frame decisions and the replay speed.
+    Decisions reproduce a live session only with its ThermalEye options (eye_kwargs), a TargetTracker like the
+    live one and its calibration mapper - the target is aimed like evil_step aims it.
+    """
+    from display_sink import NullDisplaySink, KeyboardInput
+    from state_machine import SauronEyeTowerStateMachine
+
+    thermal_eye = ReplayThermalEye(file_path, use_contour_batch=use_contour_batch, **(eye_kwargs or {}))
+    socket = ReplayDMXSocket(file_path)
+    sauron = SauronEyeTowerStateMachine(is_manual=False, socket=socket, thermal_eye=thermal_eye,
+                                        display=NullDisplaySink(), keyboard=KeyboardInput(), tracker=tracker,
+                                        pixel_degrees_mapper=pixel_degrees_mapper)
+    sauron.compile_degree_lut()
+
+    decisions = []
+    first_timestamp, last_timestamp = None, None
+    start = time.perf_counter()
+
+    while max_frames is None or len(decisions) < max_frames:
+        frame = sauron.update_frame()
+        if frame is None:
+            break
+
+        # like the live set_deg_coordinate calls - the camera shift starts over when the coordinate changes
+        recorded_deg_coordinate = thermal_eye.recorded_deg_coordinate
+        if recorded_deg_coordinate is not None and recorded_deg_coordinate != sauron.deg_coordinate:
+            sauron.set_deg_coordinate(recorded_deg_coordinate)
+        first_timestamp = thermal_eye.frame_timestamp if first_timestamp is None else first_timestamp
+        last_timestamp = thermal_eye.frame_timestamp
+
+        state = sauron.calculate_state(frame)
+        target_deg_point = sauron.aim_deg_point()
+
+        decisions.append({
+            'state': str(state) if state else None,
+            'target': target_deg_point.as_tuple() if target_deg_point else None,
+            'candidates': len(sauron.all_possible_targets or []),
+        })
+
+        sauron.send_updated_state_signals(print_return_payload=False)
+
+    elapsed = time.perf_counter() - start
+    thermal_eye.close_eye()
+
+    recorded_sec = (last_timestamp - first_timestamp) if decisions else 0
+    stats = {
+        'frames': len(decisions),
+        'replay_sec': elapsed,
+        'replay_fps': len(decisions) / elapsed if elapsed else 0,
+        'speedup': recorded_sec / elapsed if elapsed else 0,
+    }
+    return decisions, stats
+
+
+def compare_decisions(decisions, expected_decisions):
+    # indexes of frames where the decision changed
+    mismatches = [i for i, (a, b) in enumerate(zip(decisions, expected_decisions)) if a != b]
+    if len(decisions) != len(expected_decisions):
+        mismatches.append(min(len(decisions), len(expected_decisions)))
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded session through the state machine')
+    parser.add_argument('recording')
+    parser.add_argument('--save', help='write the per-frame decisions to this json file')
+    parser.add_argument('--compare', help='compare the decisions against a json file written with --save')
+    parser.add_argument('--contour-batch', action='store_true')
+    # main.py's options by default - the decisions are the ones the tower made
+    parser.add_argument('--no-ego-motion', action='store_true', help='contour area movement detection, no compensation')
+    parser.add_argument('--no-tracker', action='store_true', help='the closest of the largest contours every frame')
+    parser.add_argument('--calibration', help='calibration store, pixel_degrees_calibration.bin if it exists')
+    args = parser.parse_args()
+
+    from file_utills import CalibrationStore, CALIBRATION_FILE_PATH
+    from target_tracker import TargetTracker
+
+    replay_eye_kwargs = {} if args.no_ego_motion else dict(use_ego_motion=True, compensate_ego_motion=True)
+    calibration_store = CalibrationStore.load_if_exists(args.calibration or CALIBRATION_FILE_PATH)
+    replay_decisions, replay_stats = replay_session(args.recording, use_contour_batch=args.contour_batch,
+                                                    eye_kwargs=replay_eye_kwargs,
+                                                    tracker=None if args.no_tracker else TargetTracker(),
+                                                    pixel_degrees_mapper=calibration_store.to_mapper_dict())
+    print(f"{replay_stats['frames']} frames in {replay_stats['replay_sec']:.2f} sec - "
+          f"{replay_stats['replay_fps']:.1f} fps, x{replay_stats['speedup']:.1f} real time")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(replay_decisions))
+
+    if args.compare:
+        expected = json.loads(Path(args.compare).read_text())
+        expected = [{**d, 'target': tuple(d['target']) if d['target'] else None} for d in expected]
+        frame_mismatches = compare_decisions(replay_decisions, expected)
+        print(f'{len(frame_mismatches)} frames differ' + (f', first at {frame_mismatches[0]}' if frame_mismatches else ''))
+        raise SystemExit(1 if frame_mismatches else 0)
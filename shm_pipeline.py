@@ -0,0 +1,440 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from time import monotonic, sleep
+from typing import Optional, Tuple, List
+
+import cv2
+import numpy as np
+
+from camera_pool import CameraSpec, LoopingCapture, open_capture, contour_boxes
+from thermal_camera import ThermalEye, MIN_AREA_TO_CONSIDER, MAX_AREA_TO_CONSIDER
+from utills import Contour
+
+FRAME_RING_SLOTS = 6  # latest + writing + held by vision + held by control, and room for a slow reader
+DETECTION_RING_SLOTS = 4
+MAX_DETECTIONS = 256  # candidates per frame, largest first
+WAIT_TIMEOUT_SEC = 1.0
+PROCESS_JOIN_TIMEOUT_SEC = 2.0
+
+CONTOUR_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4'), ('w', '<i4'), ('h', '<i4'), ('area', '<i4')])
+
+# everything the control process needs of an analyzed frame, one fixed size record per frame
+DETECTIONS_DTYPE = np.dtype([
+    ('frame_seq', '<i8'),
+    ('frame_timestamp', '<f8'),  # time.monotonic() of the capture, the same clock in every process
+    ('dropped_frames', '<i4'),  # frames captured but never analyzed before this one
+    ('is_blind', '?'),
+    ('is_moving', '?'),
+    ('camera_shift', '<f8', (2,)),
+    ('count', '<i4'),
+    ('contours', CONTOUR_DTYPE, (MAX_DETECTIONS,)),
+])
+
+# header - latest seq, latest slot, stream ended, then (seq, reader holds) per slot
+_LATEST_SEQ, _LATEST_SLOT, _IS_ENDED, _SLOTS_HEADER = 0, 1, 2, 3
+_ALIGNMENT = 64
+
+
+class SharedRing:
+    """
+    `slots` preallocated arrays of one shape and dtype in a multiprocessing.shared_memory block - one writer
+    process, a few readers in others, nothing is pickled. Every published slot gets the next sequence number.
+    Readers hold the slot they work on and the writer never reuses a held slot or the latest one, so the views
+    stay valid without copies until released (like FrameGrabber, across processes).
+    The bookkeeping lives in a header in the same block, guarded by a process shared Condition.
+    Created in the parent, handed to the processes as an argument - they attach to the same block.
+    """
+
+    def __init__(self, slots, shape, dtype, context=None):
+        context = context or multiprocessing.get_context('spawn')
+        self.slots, self.shape, self.dtype = slots, tuple(shape), np.dtype(dtype)
+        self._cond = context.Condition()
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self._layout()[-1])
+        self._is_owner = True
+        self._map()
+
+        self._header[:] = 0
+        self._header[_LATEST_SLOT] = -1
+
+    @classmethod
+    def _attach(cls, name, slots, shape, dtype, cond):
+        ring = cls.__new__(cls)
+        ring.slots, ring.shape, ring.dtype = slots, tuple(shape), np.dtype(dtype)
+        ring._cond = cond
+
+        # spawned processes share the creator's resource tracker - only the creator unlinks the block
+        ring._shm = shared_memory.SharedMemory(name=name)
+        ring._is_owner = False
+        ring._map()
+        return ring
+
+    def __reduce__(self):
+        return SharedRing._attach, (self._shm.name, self.slots, self.shape, self.dtype, self._cond)
+
+    def _layout(self):
+        header_size = (_SLOTS_HEADER + 2 * self.slots) * 8
+        timestamps_size = self.slots * 8
+        data_offset = -(-(header_size + timestamps_size) // _ALIGNMENT) * _ALIGNMENT
+        slot_size = int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+        return header_size, data_offset, data_offset + max(self.slots * slot_size, 1)
+
+    def _map(self):
+        header_size, data_offset, _ = self._layout()
+        buffer = self._shm.buf
+        self._header = np.ndarray((_SLOTS_HEADER + 2 * self.slots,), np.int64, buffer)
+        self._timestamps = np.ndarray((self.slots,), np.float64, buffer, offset=header_size)
+        self._data = np.ndarray((self.slots,) + self.shape, self.dtype, buffer, offset=data_offset)
+
+    def _seq_index(self, slot):
+        return _SLOTS_HEADER + 2 * slot
+
+    def _holds_index(self, slot):
+        return _SLOTS_HEADER + 2 * slot + 1
+
+    def view(self, slot) -> np.ndarray:
+        return self._data[slot, ...]
+
+    @property
+    def is_ended(self):
+        return bool(self._header[_IS_ENDED])
+
+    def _free_slot(self) -> Optional[int]:
+        header = self._header
+        free = [slot for slot in range(self.slots)
+                if header[self._holds_index(slot)] == 0 and slot != header[_LATEST_SLOT]]
+        # the oldest - views of newer frames stay around the longest for hold(seq)
+        return min(free, key=lambda slot: header[self._seq_index(slot)]) if free else None
+
+    def acquire_write_slot(self, timeout=WAIT_TIMEOUT_SEC) -> Optional[int]:
+        # None when every slot stays held by the readers for `timeout`
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free_slot() is not None, timeout):
+                return None
+            slot = self._free_slot()
+            self._header[self._seq_index(slot)] = -1  # being written, hold(seq) does not find the old frame anymore
+            return slot
+
+    def publish(self, slot, timestamp) -> int:
+        with self._cond:
+            seq = int(self._header[_LATEST_SEQ]) + 1
+            self._header[self._seq_index(slot)] = seq
+            self._timestamps[slot] = timestamp
+            self._header[_LATEST_SEQ], self._header[_LATEST_SLOT] = seq, slot
+            self._cond.notify_all()
+        return seq
+
+    def end_stream(self):
+        with self._cond:
+            self._header[_IS_ENDED] = 1
+            self._cond.notify_all()
+
+    def hold_latest(self, after_seq=0, timeout=WAIT_TIMEOUT_SEC) -> Optional[Tuple[int, int, float]]:
+        """
+        (seq, slot, timestamp) of the newest slot published after after_seq, held until release(slot).
+        None on timeout or when the stream ended.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._header[_LATEST_SEQ] > after_seq or self._header[_IS_ENDED], timeout)
+            if self._header[_LATEST_SEQ] <= after_seq:
+                return None
+
+            slot = int(self._header[_LATEST_SLOT])
+            self._header[self._holds_index(slot)] += 1
+            return int(self._header[_LATEST_SEQ]), slot, float(self._timestamps[slot])
+
+    def hold(self, seq) -> Optional[int]:
+        # slot of `seq` held until release(slot), None when the writer reused it already
+        with self._cond:
+            for slot in range(self.slots):
+                if self._header[self._seq_index(slot)] == seq:
+                    self._header[self._holds_index(slot)] += 1
+                    return slot
+        return None
+
+    def release(self, slot):
+        with self._cond:
+            self._header[self._holds_index(slot)] -= 1
+            self._cond.notify_all()
+
+    def close(self):
+        self._header = self._timestamps = self._data = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # a view is still referenced somewhere - the mapping goes with the process
+        if self._is_owner:
+            self._shm.unlink()
+
+
+class RingCapture:
+    """ cv2.VideoCapture look-alike over a frame SharedRing - read returns a view of the newest frame, no copy """
+
+    def __init__(self, ring: SharedRing):
+        self.ring = ring
+        self.slot: Optional[int] = None  # held until the next read
+        self.seq = 0
+        self.timestamp: Optional[float] = None
+        self.dropped = 0  # frames published but never read since the previous read
+
+    def read(self, image=None):
+        self.release_slot()
+
+        held = None
+        while held is None and not self.ring.is_ended:
+            held = self.ring.hold_latest(self.seq)
+        if held is None:
+            return False, None
+
+        seq, self.slot, self.timestamp = held
+        self.dropped, self.seq = seq - self.seq - 1, seq
+        return True, self.ring.view(self.slot)
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.ring.shape[1]
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.ring.shape[0]
+        return 0
+
+    def release_slot(self):
+        if self.slot is not None:
+            self.ring.release(self.slot)
+            self.slot = None
+
+    def release(self):
+        self.release_slot()
+
+
+class RingThermalEye(ThermalEye):
+    """ ThermalEye of the vision process - frames straight from the ring, stamped with their capture time """
+
+    def __init__(self, ring: SharedRing, **eye_kwargs):
+        self.ring_capture = RingCapture(ring)
+        super().__init__(self.ring_capture, **eye_kwargs)
+
+    def read_frame(self):
+        ret, frame = self.ring_capture.read()
+        self.frame_timestamp = self.ring_capture.timestamp
+        self.dropped_frames = self.ring_capture.dropped
+        return frame
+
+    def close_eye(self):
+        self.ring_capture.release()
+
+
+def write_detections(record: np.ndarray, thermal_eye: RingThermalEye):
+    # the candidates of the current frame into a DETECTIONS_DTYPE record - the area filter of rank_candidates,
+    # largest first
+    is_blind = thermal_eye.is_blind()
+    boxes = contour_boxes(thermal_eye.moving_contours) if not is_blind else np.empty((0, 5), np.int64)
+    area = boxes[:, 4]
+    boxes = boxes[(MIN_AREA_TO_CONSIDER < area) & (area < MAX_AREA_TO_CONSIDER)][:MAX_DETECTIONS]
+
+    record['frame_seq'] = thermal_eye.ring_capture.seq
+    record['frame_timestamp'] = thermal_eye.frame_timestamp
+    record['dropped_frames'] = thermal_eye.dropped_frames
+    record['is_blind'] = is_blind
+    record['is_moving'] = thermal_eye.is_cam_in_movement()
+    record['camera_shift'] = thermal_eye.camera_shift
+    record['count'] = len(boxes)
+
+    contours = record['contours']
+    for name, column in zip(CONTOUR_DTYPE.names, boxes.T):
+        contours[name][:len(boxes)] = column
+
+
+def capture_process(spec: CameraSpec, frame_ring: SharedRing, vision_ready, stop_event, fps=None):
+    """ Reads the camera straight into the ring slots. fps - paces file sources like a live camera """
+    cap = LoopingCapture(spec) if spec.loop else open_capture(spec)
+    next_frame_at = None
+    try:
+        # frames before the vision process is up would only be dropped - a file would be half over
+        while not vision_ready.wait(WAIT_TIMEOUT_SEC) and not stop_event.is_set():
+            pass
+
+        while not stop_event.is_set():
+            slot = frame_ring.acquire_write_slot()
+            if slot is None:
+                continue
+
+            if fps:
+                now = monotonic()
+                if next_frame_at is not None and now < next_frame_at:
+                    sleep(next_frame_at - now)
+                next_frame_at = max(now, next_frame_at or now) + 1 / fps
+
+            view = frame_ring.view(slot)
+            ret, frame = cap.read(view)
+            if not ret or frame is None:
+                break
+            if frame is not view:
+                # the driver allocated its own buffer
+                if frame.shape != view.shape:
+                    raise ValueError(f'{spec.source} frames are {frame.shape}, the ring holds {view.shape}')
+                np.copyto(view, frame)
+
+            frame_ring.publish(slot, monotonic())
+    finally:
+        frame_ring.end_stream()
+        cap.release()
+
+
+def vision_process(spec: CameraSpec, frame_ring: SharedRing, detection_ring: SharedRing, shift_version, vision_ready,
+                   stop_event):
+    """
+    ThermalEye detection of the newest frames, a DETECTIONS_DTYPE record per frame.
+    shift_version - bumped by the control process when a move ended, the camera shift starts over.
+    """
+    thermal_eye = RingThermalEye(frame_ring, **spec.eye_kwargs)
+    vision_ready.set()
+    seen_version = None
+    try:
+        while not stop_event.is_set():
+            if shift_version.value != seen_version:
+                seen_version = shift_version.value
+                thermal_eye.reset_camera_shift()
+
+            thermal_eye.update_frame()
+            if thermal_eye.frame is None:
+                break
+
+            slot = detection_ring.acquire_write_slot()
+            if slot is None:
+                continue
+            write_detections(detection_ring.view(slot), thermal_eye)
+            detection_ring.publish(slot, thermal_eye.frame_timestamp)
+    finally:
+        detection_ring.end_stream()
+        thermal_eye.close_eye()
+
+
+class ShmPipeline:
+    """
+    Capture and vision in processes of their own, the caller is the control process (state machine, DMXSocket) -
+    capture, MOG2 / contours and control no longer share one GIL. Frames move through a shared memory ring,
+    detections through a ring of fixed size structured records.
+    frame_shape - shape of the camera frames, the ring is allocated before the camera is opened.
+    """
+
+    def __init__(self, spec: CameraSpec, frame_shape=(480, 640, 3), fps=None,
+                 frame_slots=FRAME_RING_SLOTS, detection_slots=DETECTION_RING_SLOTS):
+        self.spec = spec
+        self.fps = fps
+        context = multiprocessing.get_context('spawn')
+        self._context = context
+
+        self.frame_ring = SharedRing(frame_slots, frame_shape, np.uint8, context)
+        self.detection_ring = SharedRing(detection_slots, (), DETECTIONS_DTYPE, context)
+        self.shift_version = context.Value('q', 0)
+        self.vision_ready = context.Event()
+        self.stop_event = context.Event()
+        self.processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        self.processes = [
+            self._context.Process(target=capture_process, name='capture', daemon=True,
+                                  args=(self.spec, self.frame_ring, self.vision_ready, self.stop_event, self.fps)),
+            self._context.Process(target=vision_process, name='vision', daemon=True,
+                                  args=(self.spec, self.frame_ring, self.detection_ring, self.shift_version,
+                                        self.vision_ready, self.stop_event)),
+        ]
+        for process in self.processes:
+            process.start()
+        return self
+
+    def reset_camera_shift(self):
+        with self.shift_version.get_lock():
+            self.shift_version.value += 1
+
+    def close(self):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=PROCESS_JOIN_TIMEOUT_SEC)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=PROCESS_JOIN_TIMEOUT_SEC)
+        self.processes = []
+
+        self.frame_ring.close()
+        self.detection_ring.close()
+
+
+class PipelineThermalEye(ThermalEye):
+    """
+    ThermalEye of the control process - the detections of the vision process as Contours, and the analyzed frame
+    as a view of its ring slot (held until the next update_frame), so the state machine runs unchanged.
+    """
+
+    def __init__(self, pipeline: ShmPipeline):
+        self.pipeline = pipeline
+        self.cap = None
+
+        frame_h, frame_w = pipeline.frame_ring.shape[:2]
+        self._init_state(frame_w, frame_h)
+        self.moving_contours = []
+
+        self.detections: Optional[np.ndarray] = None  # DETECTIONS_DTYPE record of the current frame
+        self.detections_seq = 0
+        self.frame_slot: Optional[int] = None
+
+    def reset_camera_shift(self, deg_coordinate=None):
+        self.camera_shift[:] = 0
+        self.pipeline.reset_camera_shift()
+
+    def is_cam_in_movement(self, update_frame=False):
+        if update_frame:
+            self.update_frame()
+        return self.detections is not None and bool(self.detections['is_moving'])
+
+    def is_blind(self):
+        return self.detections is None or bool(self.detections['is_blind'])
+
+    def foreground_area(self):
+        return 0
+
+    def close_eye(self):
+        self.release_frame()
+        self.pipeline.close()
+
+    def release_frame(self):
+        if self.frame_slot is not None:
+            self.pipeline.frame_ring.release(self.frame_slot)
+            self.frame_slot = None
+        self.frame = None
+
+    def update_frame(self):
+        self.contour_grid = None
+        self.contour_arrays = None
+        self.release_frame()
+
+        detection_ring = self.pipeline.detection_ring
+        held = None
+        while held is None and not detection_ring.is_ended:
+            held = detection_ring.hold_latest(self.detections_seq)
+        if held is None:
+            # end of stream
+            self.moving_contours, self.detections = [], None
+            return
+
+        self.detections_seq, slot, _ = held
+        detections = detection_ring.view(slot).copy()
+        detection_ring.release(slot)
+
+        frame_ring = self.pipeline.frame_ring
+        self.frame_slot = frame_ring.hold(int(detections['frame_seq']))
+        if self.frame_slot is not None:
+            self.frame = frame_ring.view(self.frame_slot)
+        else:
+            # the capture already reused the slot - the detections still hold
+            self.frame = np.zeros(frame_ring.shape, frame_ring.dtype)
+
+        previous_seq = int(self.detections['frame_seq']) if self.detections is not None else 0
+        self.detections = detections
+        self.frame_timestamp = float(detections['frame_timestamp'])
+        self.dropped_frames = int(detections['frame_seq']) - previous_seq - 1
+        self.camera_shift[:] = detections['camera_shift']
+
+        contours = detections['contours'][:int(detections['count'])]
+        self.moving_contours = [Contour.from_stats(x, y, w, h, area, frame_middle_point=self.BEAM_CENTER_POINT)
+                                for x, y, w, h, area in contours.tolist()]
@@ -0,0 +1,109 @@
+from typing import Optional
+
+import numpy as np
+
+GRID_CELL_PX = 32  # cell side - a beam radius query touches a handful of cells
+
+
+class CentroidGrid:
+    """
+    Uniform grid over the contour centers of one frame. Points are bucketed by cell in CSR layout - `order` holds
+    the point indices cell after cell, cell_starts[cell] where each cell begins - so the cells of a grid row are
+    one contiguous slice, and radius / nearest queries only visit the cells around the query point.
+    Distances follow PixelVector.distance - whole pixels, truncated.
+    """
+
+    def __init__(self, points, frame_w, frame_h, cell_size=GRID_CELL_PX):
+        self.points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        self.cell_size = cell_size
+        self.columns = max(-(-frame_w // cell_size), 1)
+        self.rows = max(-(-frame_h // cell_size), 1)
+
+        columns, rows = self.cell_coordinates(self.points)
+        cells = rows * self.columns + columns
+
+        # stable - inside a cell the points keep their input order (area order for moving_contours)
+        self.order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=self.columns * self.rows)
+        self.cell_starts = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell_coordinates(self, points):
+        columns = np.clip(points[..., 0] // self.cell_size, 0, self.columns - 1)
+        rows = np.clip(points[..., 1] // self.cell_size, 0, self.rows - 1)
+        return columns, rows
+
+    def _row_span(self, row, first_column, last_column):
+        # point indices in cells first_column..last_column of a grid row
+        first_cell = row * self.columns + first_column
+        return self.order[self.cell_starts[first_cell]:self.cell_starts[first_cell + last_column - first_column + 1]]
+
+    def _distances(self, indices, point):
+        offsets = self.points[indices] - point
+        return np.sqrt((offsets ** 2).sum(axis=1)).astype(np.int64)
+
+    def query_radius(self, point, radius) -> np.ndarray:
+        # Ascending indices of the points closer than radius - same as distance < radius per point
+        point = np.asarray(point, dtype=np.int64)
+        if not len(self.points) or radius <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        (first_column, last_column), (first_row, last_row) = self.cell_coordinates(
+            np.array([point - radius, point + radius]))
+
+        spans = [self._row_span(row, first_column, last_column) for row in range(first_row, last_row + 1)]
+        indices = np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+
+        # int(sqrt(d2)) < radius is d2 < radius^2 for a whole radius, without the square root
+        offsets = self.points[indices] - point
+        inside = (offsets ** 2).sum(axis=1) < radius * radius if float(radius).is_integer() else \
+            np.sqrt((offsets ** 2).sum(axis=1)).astype(np.int64) < radius
+        return np.sort(indices[inside])
+
+    def nearest(self, point, mask: Optional[np.ndarray] = None) -> Optional[int]:
+        """
+        Index of the point closest to `point`, the lowest index among equally distant points (like a linear scan
+        that keeps the first minimum). mask - boolean per point, only True points are considered.
+        Cells are visited in square rings around the query cell until no unvisited cell can hold a closer point.
+        """
+        point = np.asarray(point, dtype=np.int64)
+        if not len(self.points):
+            return None
+
+        column, row = (int(v) for v in self.cell_coordinates(point))
+        max_ring = max(column, self.columns - 1 - column, row, self.rows - 1 - row)
+
+        best_index, best_distance = None, None
+        for ring in range(max_ring + 1):
+            first_column, last_column = max(column - ring, 0), min(column + ring, self.columns - 1)
+            spans = []
+            for ring_row in range(max(row - ring, 0), min(row + ring, self.rows - 1) + 1):
+                if ring_row in (row - ring, row + ring):
+                    spans.append(self._row_span(ring_row, first_column, last_column))
+                    continue
+                for ring_column in {column - ring, column + ring}:
+                    if 0 <= ring_column < self.columns:
+                        spans.append(self._row_span(ring_row, ring_column, ring_column))
+
+            indices = np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+            if mask is not None:
+                indices = indices[mask[indices]]
+
+            if len(indices):
+                distances = self._distances(indices, point)
+                ranked = np.lexsort((indices, distances))[0]
+                if best_distance is None or (distances[ranked], indices[ranked]) < (best_distance, best_index):
+                    best_index, best_distance = int(indices[ranked]), int(distances[ranked])
+
+            if best_distance is not None:
+                # closest any point outside the visited square can be
+                left = point[0] - (column - ring) * self.cell_size
+                right = (column + ring + 1) * self.cell_size - point[0]
+                top = point[1] - (row - ring) * self.cell_size
+                bottom = (row + ring + 1) * self.cell_size - point[1]
+                if max(min(left, right, top, bottom), 0) >= best_distance + 1:
+                    break
+
+        return best_index
@@ -2,22 +2,30 @@ import datetime
 from dataclasses import dataclass, field
 from enum import StrEnum
 from random import randrange
-from time import sleep
+from time import sleep, monotonic
 from typing import Union, Optional, List
 
 import cv2
 import numpy as np
 
 import utills
-from auto_cam_movement_detector import find_cam_movement_between_frames
+from calibration_scheduler import CalibrationScheduler, COARSE_STRIDE
 from controller_ext_socket import DMXSocket
-from eye_motor_ext import send_motor_instruction
-from file_utills import save_json_file, get_json_from_file_if_exists, PIXEL_DEGREES_MAPPER_FILE_PATH
-from frame_utills import calc_change_in_pixels
-from thermal_camera import ThermalEye, MIN_AREA_TO_CONSIDER, MAX_AREA_TO_CONSIDER, BEAM_RADIUS
-from utills import Contour, DegVector, draw_cam_direction_on_frame, get_value_within_limits
+from degree_lut import PixelDegreeLUT
+from display_sink import DisplaySink, KeyboardInput, NO_KEY
+from eye_motor_ext import send_motor_instruction, EyeMotorClient
+from file_utills import save_json_file, get_json_from_file_if_exists, PIXEL_DEGREES_MAPPER_FILE_PATH, \
+    CalibrationStore
+from frame_utills import calc_pixel_shift_between_frames
+from metrics import TrackerMetrics
+from motion import MoveOperation, MOVE_START_TIMEOUT_SEC, RETARGET_TOLERANCE_DEG
+from session_recording import SessionRecorder
+from target_tracker import TargetTracker, Track, degree_locations
+from thermal_camera import ThermalEye, BEAM_RADIUS
+from utills import Contour, DegVector, PixelVector, draw_cam_direction_on_frame, get_value_within_limits
 
 from utills import DEGREES_X_MIN, DEGREES_X_MAX, DEGREES_Y_MIN, DEGREES_Y_MAX
+from utills import X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
 
 SHOW_EVERY_TIMEDELTA = datetime.timedelta(minutes=5)
 AUTO_SHOW_TRANSITION = datetime.timedelta(seconds=1)
@@ -64,11 +72,20 @@ class SauronEyeTowerStateMachine:
     target: Union[None, Contour] = None
 
     pixel_degrees_mapper: Optional[dict] = None
+    degree_lut: Optional[PixelDegreeLUT] = None  # compiled from pixel_degrees_mapper
 
     deg_coordinate: DegVector = field(default_factory=DegVector)
     goal_deg_coordinate: DegVector = field(default_factory=DegVector)
 
     socket: Optional[DMXSocket] = None
+    eye_motor: Optional[EyeMotorClient] = None
+
+    # None - legacy cv2.imshow/cv2.waitKeyEx on every frame
+    display: Optional[DisplaySink] = None
+    keyboard: Optional[KeyboardInput] = None
+
+    recorder: Optional[SessionRecorder] = None
+    metrics: Optional[TrackerMetrics] = None
 
     thermal_eye: Optional[ThermalEye] = None
 
@@ -81,11 +98,20 @@ class SauronEyeTowerStateMachine:
     closest_target: Union[None, Contour] = None
     all_possible_targets: Optional[List[Contour]] = None
 
+    # None - the target is picked again every frame, the closest of the largest contours
+    tracker: Optional[TargetTracker] = None
+    target_track: Optional[Track] = None
+
     beam: int = 0  # 0 - 255
     motor_on: bool = True
 
     search_radius: Optional[int] = None
 
+    # moves advance once per do_evil tick instead of blocking inside move_to
+    non_blocking_moves: bool = False
+    move_op: Optional[MoveOperation] = None
+    automated_show_ends_at: Optional[datetime.datetime] = None
+
     _beam_speed = 1
 
     def calculate_state(self, frame=None):
@@ -107,21 +133,26 @@ class SauronEyeTowerStateMachine:
         self.closest_target = None
         self.all_possible_targets = None
 
-        # Moving Camera States
-        is_moving = self.thermal_eye.is_cam_in_movement()
-        if is_moving:
+        # Moving Camera States - frames taken mid move are analyzed when the background model follows the camera
+        if self.thermal_eye.is_blind():
             return self.state
 
-        # filter small movements
-        filtered_contours = [c for c in self.thermal_eye.moving_contours
-                             if c.get_abs_degree_location(self.deg_coordinate).is_inside_border
-                             and (MIN_AREA_TO_CONSIDER < c.area < MAX_AREA_TO_CONSIDER)
-                             and c.distance_from_center < self.search_radius]
+        frame_deg_coordinate = self.frame_deg_coordinate()
+
+        # filter small movements, rank by area and distance from the beam - array operations over all the contours
+        candidate_indices, largest_index, closest_index = self.thermal_eye.rank_candidates(
+            frame_deg_coordinate, self.search_radius, self.degree_lut)
+        moving_contours = self.thermal_eye.moving_contours
+        filtered_contours = [moving_contours[i] for i in candidate_indices]
 
         top_x = min(3, len(filtered_contours))
         self.all_possible_targets = filtered_contours[:top_x]
 
-        if not self.all_possible_targets:
+        if self.tracker is not None:
+            # a target missed for a few frames keeps its track, the filter predicts where it went
+            self.target_track = self.update_tracks(filtered_contours, frame_deg_coordinate)
+
+        if not self.all_possible_targets and self.target_track is None:
             if not is_locked:
                 self.state = States.SEARCH
             elif is_locked and now - self.latest_locked_state > FORGET_TARGET_TIMEOUT:
@@ -131,12 +162,19 @@ class SauronEyeTowerStateMachine:
 
             return self.state
 
-        self.largest_target = self.all_possible_targets[0]
-        self.closest_target = self.thermal_eye.find_closest_target(self.all_possible_targets)
+        self.largest_target = moving_contours[largest_index] if largest_index is not None else None
+        if self.target_track is not None:
+            self.closest_target = self.target_track.contour
+        else:
+            self.closest_target = moving_contours[closest_index]
 
         if self.closest_target:
             self.target = self.closest_target
 
+        if self.target_track is not None and self.target_track.is_coasting:
+            # not detected in this frame - nothing to confirm in the beam, the state holds until the track is dropped
+            return self.state
+
         is_target_in_beam = utills.is_target_in_circle(frame, self.closest_target)
         # is_target_in_frame = self.thermal_eye.is_contour_in_frame(self.target)
 
@@ -181,85 +219,137 @@ class SauronEyeTowerStateMachine:
         # beam speed range is 0-255
         self._beam_speed = get_value_within_limits(value + speed_delta, 0, 255)
 
-    def send_updated_state_signals(self, print_return_payload=True):
-        instruction_payload = {
+    def instruction_payload(self) -> dict:
+        return {
             "b": 10 if self.beam else 0,  # for safety
             "x": self.beam_x,
             "y": self.beam_y,
             "v": self.beam_speed
         }
 
+    def send_updated_state_signals(self, print_return_payload=True):
+        instruction_payload = self.instruction_payload()
+
         if self.socket:
             self.socket.instruction_payload = instruction_payload
             self.socket.send_json(print_return_payload=print_return_payload)
 
-        # send_motor_instruction(self.motor_on, self.deg_coordinate.x)
+        if self.eye_motor:
+            self.eye_motor.update(self.motor_on, self.deg_coordinate.x)
 
         return instruction_payload
 
     def do_evil(self):
         self.set_beam_speed(1)
         while True:
-            self.send_updated_state_signals()
+            if self.metrics:
+                self.metrics.loop_tick()
 
-            if (self.state != States.LOCKED and self.last_automated_show and
-                    self.last_automated_show > datetime.datetime.now() - SHOW_EVERY_TIMEDELTA):
-                self.run_automated_led_show(min_to_run=1)
+            self.send_updated_state_signals()
+            self.maybe_start_automated_show()
 
             # present frame
             frame = self.update_frame()
 
-            # Calculates target inside of state
-            self.state = self.calculate_state(frame)
-
-            frame, key_pressed = self.present_debug_frame(frame)
-
-            target_deg_point = None
-            if self.target:
-                target_deg_point = self.target.get_abs_degree_location(self.deg_coordinate)
-
-            if self.is_manual:
-                self.update_dmx_directions(key_pressed)
-            elif self.state in [States.FOUND_POSSIBLE_TARGET, States.SEARCHING_EXISTING_TARGET,
-                                States.LOCKED, States.RE_LOCKING] and target_deg_point:
-                is_locked = self.state in [States.LOCKED, States.RE_LOCKING]
+            key_pressed = self.evil_step(frame)
+            if key_pressed == ord('q'):
+                break
 
-                if self.target.distance_from_center < BEAM_RADIUS:
-                    speed = 1
-                elif self.target.distance_from_center < self.search_radius:
-                    speed = 50
-                else:
-                    speed = 99
+    def maybe_start_automated_show(self):
+        if (self.state != States.LOCKED and self.last_automated_show and
+                self.last_automated_show > datetime.datetime.now() - SHOW_EVERY_TIMEDELTA and
+                self.automated_show_ends_at is None):
+            if self.non_blocking_moves:
+                self.start_automated_led_show(min_to_run=1)
+            else:
+                self.run_automated_led_show(min_to_run=1)
 
-                self.set_beam_speed(speed)
+    def evil_step(self, frame, advance_show=True):
+        # One do_evil tick after the frame update - state, targeting and the debug frame. Returns the key pressed.
+        # advance_show=False - the automated show is advanced elsewhere (see AsyncTowerRuntime)
+        if self.non_blocking_moves:
+            self.advance_move()
+
+        if self.automated_show_ends_at is not None:
+            if advance_show:
+                self.advance_automated_led_show()
+            self.track_state_metrics()
+            frame, key_pressed = self.present_debug_frame(frame, state=States.MOVING_TO_RANDOM_POINT)
+            return key_pressed
+
+        # Calculates target inside of state
+        self.state = self.calculate_state(frame)
+        self.track_state_metrics()
+
+        frame, key_pressed = self.present_debug_frame(frame)
+
+        target_deg_point = self.aim_deg_point()
+
+        if self.is_manual:
+            self.update_dmx_directions(key_pressed)
+        elif self.state in [States.FOUND_POSSIBLE_TARGET, States.SEARCHING_EXISTING_TARGET,
+                            States.LOCKED, States.RE_LOCKING] and target_deg_point:
+            is_locked = self.state in [States.LOCKED, States.RE_LOCKING]
+
+            if self.target.distance_from_center < BEAM_RADIUS:
+                speed = 1
+            elif self.target.distance_from_center < self.search_radius:
+                speed = 50
+            else:
+                speed = 99
+
+            self.set_beam_speed(speed)
+            if self.non_blocking_moves:
+                # a target seen mid-move retargets right away
+                self.start_move(target_deg_point)
+            else:
                 self.move_to(target_deg_point)
-                if is_locked:
-                    self.latest_locked_state = datetime.datetime.now()
-            elif self.state == States.LOST_TARGET:
-                self.set_beam_speed(1)
-                self.go_to_random_spot_in_view()
-                self.state = States.SEARCH
+            if is_locked:
+                self.latest_locked_state = datetime.datetime.now()
+        elif self.state == States.LOST_TARGET:
+            self.set_beam_speed(1)
+            self.go_to_random_spot_in_view()
+            self.state = States.SEARCH
 
-            # if key_pressed == ord('p'):
-            #     self.programmer_mode(key_pressed)
+        # if key_pressed == ord('p'):
+        #     self.programmer_mode(key_pressed)
 
-            if key_pressed == ord('m'):
-                self.set_manual_control(key_pressed, force_change=True)
+        if key_pressed == ord('m'):
+            self.set_manual_control(key_pressed, force_change=True)
 
-            if key_pressed == ord('q'):
-                break
+        return key_pressed
 
     def present_debug_frame(self, frame=None, state=None):
         if frame is None:
             frame = self.get_frame()
 
-        frame = self.draw_debugging_refs_on_frame(frame, state)
-        cv2.imshow('frame', frame)
-        key_pressed = cv2.waitKeyEx(1)
+        if self.display is None:
+            frame = self.draw_debugging_refs_on_frame(frame, state)
+            cv2.imshow('frame', frame)
+            key_pressed = cv2.waitKeyEx(1)
+
+            return frame, key_pressed
+
+        # overlays are drawn only on frames the sink is actually going to show
+        if frame is not None and self.display.wants_frame():
+            frame = self.draw_debugging_refs_on_frame(frame.copy(), state)
+            self.display.show(frame)
 
-        return frame, key_pressed
+        return frame, self.read_key()
 
-    def auto_coordinate(self, mapper_dict):
+    def read_key(self):
+        if self.display is None and self.keyboard is None:
+            return cv2.waitKeyEx(1)
+
+        return self.keyboard.read_key() if self.keyboard else NO_KEY
+
+    def show_frame(self, frame):
+        if self.display is None:
+            cv2.imshow('frame', frame)
+        elif self.display.wants_frame():
+            self.display.show(frame.copy())
+
+    def auto_coordinate(self, mapper_dict, calibration_store: Optional[CalibrationStore] = None):
         try:
             for y_degree in range(DEGREES_Y_MIN, DEGREES_Y_MAX):
                 for x_degree in range(DEGREES_X_MIN, DEGREES_X_MAX):
@@ -267,16 +357,52 @@ class SauronEyeTowerStateMachine:
                     point_mapping_dict = mapper_dict.get(point_key, {})
                     point_calculated = DegVector(x_degree, y_degree)
                     mapper_dict[point_key] = self.map_pixel_degree_for_point(mapper_dict, point_calculated, point_mapping_dict)
+
+                    if calibration_store is not None:
+                        self.save_calibrated_point(calibration_store, mapper_dict, point_calculated)
         finally:
-            save_json_file(PIXEL_DEGREES_MAPPER_FILE_PATH, mapper_dict)
+            if calibration_store is None:
+                save_json_file(PIXEL_DEGREES_MAPPER_FILE_PATH, mapper_dict)
 
         self.pixel_degrees_mapper = mapper_dict
+        self.compile_degree_lut()
 
         return mapper_dict
 
+    def auto_coordinate_scheduled(self, mapper_dict, calibration_store: Optional[CalibrationStore] = None,
+                                  stride: int = COARSE_STRIDE):
+        scheduler = CalibrationScheduler(self, mapper_dict, calibration_store, stride=stride)
+        try:
+            scheduler.run()
+        finally:
+            if calibration_store is None:
+                save_json_file(PIXEL_DEGREES_MAPPER_FILE_PATH, mapper_dict)
+
+        self.pixel_degrees_mapper = mapper_dict
+        self.compile_degree_lut()
+
+        return mapper_dict
+
+    def save_calibrated_point(self, calibration_store: CalibrationStore, mapper_dict, point_calculated: DegVector):
+        # The point and the opposite points that got its measurements - atomic write so a resume starts right here.
+        updated_points = [point_calculated] + [point_calculated - v for v in MOVEMENT_VECTORS]
+        for point in updated_points:
+            calibration_store.set_point(point.as_tuple(), mapper_dict.get(point.as_tuple(), {}))
+
+        calibration_store.save()
+
+    def compile_degree_lut(self):
+        if not self.thermal_eye or not self.pixel_degrees_mapper or not self.thermal_eye.uses_degree_lut:
+            self.degree_lut = None
+            return
+
+        self.degree_lut = PixelDegreeLUT.from_mapper(self.pixel_degrees_mapper,
+                                                     frame_w=self.thermal_eye.FRAME_W,
+                                                     frame_h=self.thermal_eye.FRAME_H)
+
     def programmer_mode(self, key_pressed):
         while key_pressed != ord('f'):
-            key_pressed = cv2.waitKeyEx(1)
+            key_pressed = self.read_key()
 
             frame = self.get_frame(update_frame=True)
             utills.plant_state_name_in_frame(frame, 'programmer_mode')
@@ -295,15 +421,33 @@ class SauronEyeTowerStateMachine:
 
             utills.plant_text_bottom(frame, setup_state_text)
 
-            cv2.imshow('frame', frame)
+            self.show_frame(frame)
 
     def update_frame(self):
         if not self.thermal_eye:
             return
 
         self.thermal_eye.update_frame()
+        if self.recorder:
+            # deg_coordinate, not frame_deg_coordinate() - the replayed eye re-runs the ego-motion on the same frames
+            # and rebuilds the sub-pixel camera_shift, the whole degree frame coordinate would lose it
+            self.recorder.record_frame(self.thermal_eye.frame, self.thermal_eye.frame_timestamp, self.deg_coordinate)
+        if self.metrics and self.thermal_eye.frame is not None:
+            self.metrics.observe_frame(len(self.thermal_eye.moving_contours), self.thermal_eye.dropped_frames)
         return self.thermal_eye.frame
 
+    def current_activity_state(self):
+        # what the tower is busy with - a move in flight or a frame smeared by camera movement count as moving
+        if self.move_op is not None and not self.move_op.has_arrived:
+            return self.move_op.state
+        if self.thermal_eye and self.thermal_eye.frame is not None and self.thermal_eye.is_cam_in_movement():
+            return States.MOVING_FRAME
+        return self.state
+
+    def track_state_metrics(self, state=None):
+        if self.metrics:
+            self.metrics.track_state(state or self.current_activity_state())
+
     def get_frame(self):
         if not self.thermal_eye:
             return np.ones((255, 255))
@@ -362,10 +506,8 @@ class SauronEyeTowerStateMachine:
         x_delta *= self.beam_speed
         y_delta *= self.beam_speed
 
-        self.goal_deg_coordinate.x = get_value_within_limits(self.goal_deg_coordinate.x + x_delta,
-                                                             bottom=DEGREES_X_MIN, top=DEGREES_X_MAX)
-        self.goal_deg_coordinate.y = get_value_within_limits(self.goal_deg_coordinate.y + y_delta,
-                                                             bottom=DEGREES_Y_MIN, top=DEGREES_Y_MAX)
+        self.goal_deg_coordinate = DegVector(x=self.goal_deg_coordinate.x + x_delta,
+                                             y=self.goal_deg_coordinate.y + y_delta).within_limits()
 
     def set_beam_with_keyboard(self, key_pressed):
         delta_beam = 0
@@ -401,7 +543,10 @@ class SauronEyeTowerStateMachine:
         # move to origin point
         print(f'calcualting {point_calculated} calibration')
         self.move_to(point_calculated, state=States.CALIBRATING)
+        # a copy - with threaded_capture the grabber reuses the frame buffer during the moves below
         frame_origin_point = self.update_frame()
+        if frame_origin_point is not None:
+            frame_origin_point = frame_origin_point.copy()
 
         for direction_vector in MOVEMENT_VECTORS:
             if point_mapping_dict.get(direction_vector.as_tuple(), {}):
@@ -416,34 +561,17 @@ class SauronEyeTowerStateMachine:
 
             frame_post_move = self.update_frame()
 
-            movement_degree_diff = 0
-            calc_factor = 2  # normalizing 2 degree vectors
-
-            diff_formulas_considered = 0
-
             # Calculate and Save pixel_diff
-            pixel_diff = calc_change_in_pixels(frame_origin_point, frame_post_move, direction_vector)
-
-            if pixel_diff is not None:
-                movement_degree_diff += pixel_diff
-                diff_formulas_considered += 1
-            try:
-                pixel_diff_2 = find_cam_movement_between_frames(frame_origin_point, frame_post_move)
-                movement_degree_diff += pixel_diff_2
-                diff_formulas_considered += 1
-            except:
-                movement_degree_diff += 0
-
-            calc_factor *= diff_formulas_considered
-            calc_factor = calc_factor or 1
-
-            smoothed_distance = movement_degree_diff // calc_factor
+            smoothed_distance = calc_pixel_shift_between_frames(frame_origin_point, frame_post_move, direction_vector)
             print(f'calculated {point_calculated.as_tuple()} -> {direction_vector.as_tuple()} = {smoothed_distance} Pixels')
+            if smoothed_distance is None:
+                # no trusted match - left missing so a resumed run measures it again
+                continue
 
             point_mapping_dict[direction_vector.as_tuple()] = smoothed_distance
 
             opposite_point = point_calculated - direction_vector
-            opposite_dict = mapper_dict.get(opposite_point.as_tuple(), {})
+            opposite_dict = mapper_dict.setdefault(opposite_point.as_tuple(), {})
             opposite_dict[(-direction_vector.x, -direction_vector.y)] = smoothed_distance
             print(f'calculated opposite Point {opposite_point.as_tuple()} -> {(-direction_vector.x, -direction_vector.y)} = {smoothed_distance} Pixels')
             print(f'--------------------------------------------')
@@ -452,31 +580,28 @@ class SauronEyeTowerStateMachine:
         return point_mapping_dict
 
     def move_to(self, point_calculated: DegVector, state: States = States.MOVING_FRAME):
-        # limit coordinates to MIN MAX values
-        point_calculated.x = get_value_within_limits(point_calculated.x, bottom=DEGREES_X_MIN, top=DEGREES_X_MAX)
-        point_calculated.y = get_value_within_limits(point_calculated.y, bottom=DEGREES_Y_MIN, top=DEGREES_Y_MAX)
+        # limit coordinates to MIN MAX values - a new vector, the caller's point is left as it was
+        point_calculated = point_calculated.within_limits()
 
         self.goal_deg_coordinate = point_calculated
+        self.track_state_metrics(state)
+        move_started_at = monotonic()
 
         wait_for_move = datetime.timedelta(seconds=5)
-        beginning = datetime.datetime.now()
+        reached_timeout = False
 
-        reached_timeout = datetime.datetime.now() - beginning > wait_for_move
-
-        cam_in_movement = self.thermal_eye.is_cam_in_movement
-        while not cam_in_movement and not reached_timeout:
+        # The contour area signal misses small moves - without ego-motion go straight to waiting for the stop.
+        # Ego-motion sees the first moving frame, wait for it unless the move is too small to show.
+        has_ego_motion = self.thermal_eye.ego_motion_estimator is not None
+        cam_in_movement = not has_ego_motion
+        while not cam_in_movement and monotonic() - move_started_at < MOVE_START_TIMEOUT_SEC:
             print('Waiting movement')
-            cam_in_movement, is_manual_break = self.send_instruction_and_check_if_cam_is_moving(state)
+            cam_in_movement = self.send_instruction_and_check_if_cam_is_moving(state)
 
             frame, key_pressed = self.present_debug_frame(state=state)
-            is_manual_break = key_pressed == ord('q')
-
-            reached_timeout = datetime.datetime.now() - beginning > wait_for_move
-            if is_manual_break or reached_timeout:
+            if key_pressed == ord('q'):
                 break
 
-            reached_timeout = datetime.datetime.now() - beginning > wait_for_move
-
         beginning = datetime.datetime.now()
         while cam_in_movement:
             print('Camera Moving')
@@ -489,15 +614,133 @@ class SauronEyeTowerStateMachine:
             if is_manual_break or reached_timeout:
                 break
 
-        self.deg_coordinate = point_calculated
+        self.set_deg_coordinate(point_calculated)
 
         if state == States.APPROACHING_TARGET:
             self.state = States.SEARCHING_EXISTING_TARGET
 
-        sleep(0.5)
+        if not has_ego_motion:
+            sleep(0.5)  # the contour area drops before the camera fully settles
+
+        if self.metrics:
+            self.metrics.observe_move(state, monotonic() - move_started_at, 'timed_out' if reached_timeout else 'arrived')
 
         print(f'Camera reached {self.goal_deg_coordinate}')
 
+    def update_tracks(self, contours, frame_deg_coordinate: DegVector) -> Optional[Track]:
+        positions = degree_locations(contours, self.deg_coordinate, self.thermal_eye.BEAM_CENTER_POINT,
+                                     self.thermal_eye.camera_shift, self.degree_lut)
+        timestamp = self.thermal_eye.frame_timestamp or monotonic()
+
+        self.tracker.update(contours, positions, timestamp)
+        return self.tracker.select_target(self.target_track, frame_deg_coordinate)
+
+    def aim_deg_point(self) -> Optional[DegVector]:
+        # where the beam is sent for the current target - the track when there is one, otherwise the contour
+        # seen from where the frame was taken
+        if self.target and self.target_track is not None:
+            return self.target_track_deg_point()
+        if self.target:
+            return self.target.get_abs_degree_location(self.frame_deg_coordinate(), self.degree_lut)
+        return None
+
+    def target_track_deg_point(self) -> DegVector:
+        # the track's filtered position - lead_time_sec ahead of it when the tracker leads (0 by default)
+        x, y = self.tracker.lead_position(self.target_track)
+        return DegVector(x=int(round(x)), y=int(round(y)))
+
+    def set_deg_coordinate(self, point: DegVector):
+        self.deg_coordinate = point
+        if self.thermal_eye:
+            self.thermal_eye.reset_camera_shift(point)
+
+    def frame_deg_coordinate(self) -> DegVector:
+        # Where the current frame looks from. Mid move - the last known coordinate moved by the camera shift
+        # seen since, the old frame pixel that is now at the center.
+        camera_shift = self.thermal_eye.camera_shift if self.thermal_eye else None
+        if camera_shift is None or not camera_shift.any():
+            return self.deg_coordinate
+
+        center = self.thermal_eye.BEAM_CENTER_POINT
+        old_center_point = PixelVector(x=int(round(center.x - camera_shift[0])),
+                                       y=int(round(center.y - camera_shift[1])))
+        if self.degree_lut is not None:
+            return self.degree_lut.get_abs_degree_location(self.deg_coordinate, old_center_point)
+
+        return DegVector(x=int(self.deg_coordinate.x + (center.x - old_center_point.x) / X_PIXEL_TO_DEGREE_NORM_CONST),
+                         y=int(self.deg_coordinate.y + (center.y - old_center_point.y) / Y_PIXEL_TO_DEGREE_NORM_CONST))
+
+    def start_move(self, point_calculated: DegVector, state: States = States.MOVING_FRAME) -> MoveOperation:
+        point = point_calculated.within_limits()
+
+        move_op = self.move_op
+        if move_op and not move_op.is_done:
+            if move_op.target == point:
+                return move_op
+
+            if (abs(point.x - move_op.target.x) <= RETARGET_TOLERANCE_DEG and
+                    abs(point.y - move_op.target.y) <= RETARGET_TOLERANCE_DEG):
+                # the target moved a degree - the camera keeps travelling, only the goal is corrected
+                self.goal_deg_coordinate = move_op.target = point
+                return move_op
+
+        if move_op:
+            if not move_op.is_done:
+                self.set_deg_coordinate(self.cancelled_move_deg_coordinate(move_op))
+            move_op.cancel()
+            self.observe_move_metrics(move_op)
+
+        self.goal_deg_coordinate = point
+        self.move_op = MoveOperation(target=point, state=state, started_at=monotonic())
+        return self.move_op
+
+    def cancelled_move_deg_coordinate(self, move_op: MoveOperation) -> DegVector:
+        # Best guess of where the camera looks from when its move is replaced mid way - the ego-motion shift when
+        # there is one, the cancelled target once the camera was seen moving towards it, otherwise still the origin
+        camera_shift = self.thermal_eye.camera_shift if self.thermal_eye else None
+        if camera_shift is not None and camera_shift.any():
+            return self.frame_deg_coordinate()
+        if move_op.saw_movement:
+            return move_op.target
+        return self.deg_coordinate
+
+    def advance_move(self):
+        # called once per tick after update_frame - the current frame tells if the camera still moves
+        move_op = self.move_op
+        if move_op is None:
+            return None
+
+        is_done = move_op.advance(self.thermal_eye.is_cam_in_movement(), monotonic())
+
+        if move_op.has_arrived and not move_op.is_cancelled:
+            self.set_deg_coordinate(move_op.target)
+
+        if is_done:
+            self.finish_move()
+
+        return move_op
+
+    def finish_move(self):
+        move_op, self.move_op = self.move_op, None
+        if move_op is None:
+            return
+
+        self.observe_move_metrics(move_op)
+        if move_op.is_cancelled:
+            return
+
+        self.set_deg_coordinate(move_op.target)
+
+        if move_op.state == States.APPROACHING_TARGET:
+            self.state = States.SEARCHING_EXISTING_TARGET
+
+        timed_out = ' (timed out)' if move_op.is_timed_out else ''
+        print(f'Camera reached {move_op.target} after {move_op.ticks} ticks{timed_out}')
+
+    def observe_move_metrics(self, move_op: MoveOperation):
+        if self.metrics:
+            self.metrics.observe_move(move_op.state, monotonic() - move_op.started_at, move_op.outcome)
+
     def send_instruction_and_check_if_cam_is_moving(self, state):
         self.send_updated_state_signals(print_return_payload=False)
 
@@ -525,6 +768,31 @@ class SauronEyeTowerStateMachine:
         self.motor_on = False
         self.send_updated_state_signals()
 
+    def start_automated_led_show(self, min_to_run: int = 1):
+        print('starting automated show.')
+
+        self.last_automated_show = datetime.datetime.now()
+        self.automated_show_ends_at = self.last_automated_show + datetime.timedelta(minutes=min_to_run)
+
+        self.motor_on = True
+        self.set_beam_speed(99)
+
+    def advance_automated_led_show(self):
+        now = datetime.datetime.now()
+        if now >= self.automated_show_ends_at:
+            self.automated_show_ends_at = None
+            self.motor_on = False
+            self.send_updated_state_signals()
+            return
+
+        # Light beam in second 10.
+        time_passed = now - self.last_automated_show
+        beam_on = int(time_passed.total_seconds()) % 60 > 10
+        self.beam = 42 if beam_on else 0
+
+        if self.move_op is None:
+            self.go_to_random_spot_in_view()
+
     def keep_state_and_present_frames_for_timedelta(self, timedelta: datetime.timedelta, state: States):
         start = datetime.datetime.now()
         time_passed = datetime.datetime.now() - start
@@ -540,7 +808,10 @@ class SauronEyeTowerStateMachine:
         rand_y = randrange(DEGREES_Y_MIN, DEGREES_Y_MAX)
         random_spot = DegVector(rand_x, rand_y)
 
-        self.move_to(random_spot, States.MOVING_TO_RANDOM_POINT)
+        if self.non_blocking_moves:
+            self.start_move(random_spot, States.MOVING_TO_RANDOM_POINT)
+        else:
+            self.move_to(random_spot, States.MOVING_TO_RANDOM_POINT)
 
 
 
@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+BACKGROUND_LEVEL = 60  # cold scene gray level
+BLOB_HEAT = 150  # gray levels above the background at the center of a blob
+
+
+@dataclass
+class SyntheticThermalClip:
+    """
+    Procedural thermal-like footage - smooth cold background, sensor noise and hot blobs (people) walking around.
+    Deterministic for a given seed.
+    scene_margin - the scene is larger than the frame by this many pixels on every side, pan() moves the camera.
+    """
+    width: int = 640
+    height: int = 480
+    blobs: int = 5
+    noise: float = 1.0  # gaussian sensor noise sigma in gray levels
+    blob_radius: int = 6
+    max_speed: float = 3.0  # pixels per frame
+    seed: int = 0
+    scene_margin: int = 0
+    warm_areas: int = 3
+    background_blur: float = 25  # sigma - lower keeps sharp edges for the registration of camera moves
+
+    def __post_init__(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.scene_w, self.scene_h = self.width + 2 * self.scene_margin, self.height + 2 * self.scene_margin
+
+        # vertical gradient + a few large warm areas, like ground and buildings
+        y = np.linspace(0, 1, self.scene_h, dtype=np.float32)[:, None]
+        background = np.full((self.scene_h, self.scene_w), BACKGROUND_LEVEL, np.float32) + 20 * y
+        for _ in range(self.warm_areas):
+            center = (int(self.rng.integers(self.scene_w)), int(self.rng.integers(self.scene_h)))
+            cv2.circle(background, center, int(self.rng.integers(40, 120)), BACKGROUND_LEVEL + 25, -1)
+        self.background = cv2.GaussianBlur(background, (0, 0), self.background_blur)
+
+        # camera - top left corner of the frame in the scene
+        self.camera_x, self.camera_y = self.scene_margin, self.scene_margin
+
+        self.positions = self.rng.uniform([0, 0], [self.scene_w, self.scene_h], (self.blobs, 2))
+        self.velocities = self.rng.uniform(-self.max_speed, self.max_speed, (self.blobs, 2))
+        self.radii = self.rng.integers(max(self.blob_radius // 2, 1), self.blob_radius * 2, self.blobs)
+
+        self.frame_index = 0
+
+    def next_frame(self):
+        # only the camera window is rendered - blobs outside it are clipped by cv2.circle
+        frame = self.background[self.camera_y:self.camera_y + self.height,
+                                self.camera_x:self.camera_x + self.width].copy()
+
+        for (x, y), radius in zip(self.positions, self.radii):
+            center = (int(x) - self.camera_x, int(y) - self.camera_y)
+            cv2.circle(frame, center, int(radius), BACKGROUND_LEVEL + BLOB_HEAT, -1, cv2.LINE_AA)
+
+        if self.noise:
+            frame += self.rng.normal(0, self.noise, frame.shape).astype(np.float32)
+
+        # bounce off the borders
+        self.positions += self.velocities
+        for axis, limit in enumerate([self.scene_w, self.scene_h]):
+            out = (self.positions[:, axis] < 0) | (self.positions[:, axis] >= limit)
+            self.velocities[out, axis] *= -1
+            self.positions[:, axis] = np.clip(self.positions[:, axis], 0, limit - 1)
+
+        self.frame_index += 1
+        gray = np.clip(frame, 0, 255).astype(np.uint8)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+    def pan(self, dx, dy):
+        # moves the camera, the scene content moves the opposite way in the frame
+        self.camera_x = int(np.clip(self.camera_x + dx, 0, 2 * self.scene_margin))
+        self.camera_y = int(np.clip(self.camera_y + dy, 0, 2 * self.scene_margin))
+
+    def visible_blobs(self):
+        # frame coordinates of the blob centers inside the frame
+        positions = self.positions - (self.camera_x, self.camera_y)
+        is_visible = (positions[:, 0] >= 0) & (positions[:, 0] < self.width) & \
+                     (positions[:, 1] >= 0) & (positions[:, 1] < self.height)
+        return positions[is_visible]
+
+    def frames(self, count):
+        for _ in range(count):
+            yield self.next_frame()
+
+
+class SyntheticCapture:
+    """ cv2.VideoCapture look-alike over a synthetic clip, `frames_count` None - endless """
+
+    def __init__(self, clip: SyntheticThermalClip, frames_count: Optional[int] = None):
+        self.clip = clip
+        self.frames_count = frames_count
+
+    def read(self, image=None):
+        if self.frames_count is not None and self.clip.frame_index >= self.frames_count:
+            return False, None
+
+        frame = self.clip.next_frame()
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            frame = image
+        return True, frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.clip.width
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.clip.height
+        return 0
+
+    def release(self):
+        pass
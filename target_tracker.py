@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+from typing import Optional, List, Sequence
+
+import cv2
+import numpy as np
+
+from utills import Contour, DegVector, PixelVector, X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST
+
+MAX_ASSIGN_DISTANCE_DEG = 3.0  # a detection further than this from every track prediction starts a new track
+CONFIRM_HITS = 3  # detections before a track velocity is trusted for lead aim
+MAX_COAST_SEC = 1.0  # a track without detections is dropped after this long
+MAX_LEAD_DEG = 5.0  # lead aim never goes further than this from the track position
+
+POSITION_NOISE_DEG = 0.2  # measurement sigma - blob center jitter
+ACCELERATION_NOISE_DEG = 4.0  # process sigma in degrees / sec^2 - people change pace and direction
+INITIAL_VELOCITY_SIGMA_DEG = 5.0  # degrees / sec, a new track may be moving in any direction
+
+
+def degree_locations(contours: Sequence[Contour], deg_coordinate: DegVector, frame_middle_point: PixelVector,
+                     camera_shift=None, degree_lut=None) -> np.ndarray:
+    """
+    (N, 2) float absolute degrees of the contour centers, without the truncation of get_abs_degree_location -
+    the filters need sub degree motion.
+    camera_shift - content shift (pixels) since the camera reached deg_coordinate, the frame is mid move.
+    """
+    centers = np.array([c.center_point.as_tuple() for c in contours], dtype=np.float64).reshape(-1, 2)
+    if camera_shift is not None:
+        centers -= camera_shift
+
+    if degree_lut is not None:
+        pixels = np.rint(centers).astype(np.int64)
+        return degree_lut.get_abs_degree_locations(deg_coordinate, pixels[:, 0], pixels[:, 1], truncate=False)
+
+    # direction vector is frame middle - pixel, positive direction means a larger degree
+    direction = np.array(frame_middle_point.as_tuple(), dtype=np.float64) - centers
+    return np.array(deg_coordinate.as_tuple(), dtype=np.float64) + \
+        direction / (X_PIXEL_TO_DEGREE_NORM_CONST, Y_PIXEL_TO_DEGREE_NORM_CONST)
+
+
+def constant_velocity_kalman(position, position_noise=POSITION_NOISE_DEG,
+                             initial_velocity_sigma=INITIAL_VELOCITY_SIGMA_DEG) -> cv2.KalmanFilter:
+    # state (x, y, vx, vy) in degrees and degrees / sec, measurement (x, y)
+    kalman = cv2.KalmanFilter(4, 2)
+    kalman.measurementMatrix = np.eye(2, 4, dtype=np.float32)
+    kalman.measurementNoiseCov = np.eye(2, dtype=np.float32) * position_noise ** 2
+    kalman.statePost = np.float32([[position[0]], [position[1]], [0], [0]])
+    kalman.errorCovPost = np.diag([position_noise ** 2] * 2 + [initial_velocity_sigma ** 2] * 2).astype(np.float32)
+    return kalman
+
+
+def set_time_step(kalman: cv2.KalmanFilter, dt, acceleration_noise=ACCELERATION_NOISE_DEG):
+    transition = np.eye(4, dtype=np.float32)
+    transition[0, 2] = transition[1, 3] = dt
+    kalman.transitionMatrix = transition
+
+    # white noise acceleration - per axis [[dt^4/4, dt^3/2], [dt^3/2, dt^2]]
+    process = np.zeros((4, 4), dtype=np.float32)
+    for position, velocity in [(0, 2), (1, 3)]:
+        process[position, position] = dt ** 4 / 4
+        process[position, velocity] = process[velocity, position] = dt ** 3 / 2
+        process[velocity, velocity] = dt ** 2
+    kalman.processNoiseCov = process * acceleration_noise ** 2
+
+
+def assign_nearest(predicted: np.ndarray, detected: np.ndarray, max_distance=MAX_ASSIGN_DISTANCE_DEG):
+    """
+    (track index, detection index) pairs, nearest pairs first and every track and detection used once.
+    Greedy over the sorted pair distances - with a few well separated people it makes the optimal assignment's
+    choices without its cost.
+    """
+    if not len(predicted) or not len(detected):
+        return []
+
+    distances = np.linalg.norm(predicted[:, None, :] - detected[None, :, :], axis=-1)
+    used_tracks = np.zeros(len(predicted), dtype=bool)
+    used_detections = np.zeros(len(detected), dtype=bool)
+
+    pairs = []
+    for flat_index in np.argsort(distances, axis=None):
+        if distances.flat[flat_index] > max_distance:
+            break
+
+        track_index, detection_index = divmod(int(flat_index), len(detected))
+        if used_tracks[track_index] or used_detections[detection_index]:
+            continue
+
+        used_tracks[track_index] = used_detections[detection_index] = True
+        pairs.append((track_index, detection_index))
+        if len(pairs) == min(len(predicted), len(detected)):
+            break
+
+    return pairs
+
+
+@dataclass(eq=False)
+class Track:
+    track_id: int
+    kalman: cv2.KalmanFilter
+    contour: Contour  # latest detection
+    state_at: float  # time of the frame the filter state is for
+    detected_at: float
+
+    hits: int = 1
+    misses: int = 0  # frames since the last detection
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.kalman.statePost[:2, 0].astype(np.float64)
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.kalman.statePost[2:, 0].astype(np.float64)
+
+    @property
+    def is_confirmed(self):
+        return self.hits >= CONFIRM_HITS
+
+    @property
+    def is_coasting(self):
+        # not detected in the latest frame, the position is the filter prediction
+        return self.misses > 0
+
+    def predict(self, timestamp, acceleration_noise=ACCELERATION_NOISE_DEG):
+        set_time_step(self.kalman, max(timestamp - self.state_at, 1e-3), acceleration_noise)
+        self.kalman.predict()
+        self.state_at = timestamp
+
+    def correct(self, position, contour: Contour):
+        self.kalman.correct(np.float32(position).reshape(2, 1))
+        self.contour = contour
+        self.detected_at = self.state_at
+        self.hits += 1
+        self.misses = 0
+
+    def position_at(self, timestamp) -> np.ndarray:
+        # constant velocity extrapolation, the filter itself is not advanced
+        return self.position + self.velocity * (timestamp - self.state_at)
+
+
+class TargetTracker:
+    """
+    Targets that keep their identity across frames - a constant velocity Kalman filter per track, in absolute
+    degrees so tracks survive camera moves, and a gated nearest-prediction assignment of detections to tracks.
+    lead_time_sec - lead_position aims where the target will be that much later. 0 (default) aims at the filtered
+    position - leading by ACTUATION_LATENCY_SEC only pays off for fast targets, ordinary walkers lock slower with it.
+    """
+
+    def __init__(self, lead_time_sec=0, max_assign_distance=MAX_ASSIGN_DISTANCE_DEG,
+                 max_coast_sec=MAX_COAST_SEC, acceleration_noise=ACCELERATION_NOISE_DEG):
+        self.lead_time_sec = lead_time_sec
+        self.max_assign_distance = max_assign_distance
+        self.max_coast_sec = max_coast_sec
+        self.acceleration_noise = acceleration_noise
+
+        self.tracks: List[Track] = []
+        self.next_track_id = 1
+        self.updated_at: Optional[float] = None
+
+    def reset(self):
+        self.tracks = []
+        self.updated_at = None
+
+    def update(self, contours: Sequence[Contour], positions: np.ndarray, timestamp: float) -> List[Track]:
+        # positions - (N, 2) absolute degrees of the contours, see degree_locations
+        for track in self.tracks:
+            track.predict(timestamp, self.acceleration_noise)
+
+        predicted = np.array([track.position for track in self.tracks]).reshape(-1, 2)
+        pairs = assign_nearest(predicted, positions, self.max_assign_distance)
+
+        detected_tracks, assigned_detections = set(), set()
+        for track_index, detection_index in pairs:
+            self.tracks[track_index].correct(positions[detection_index], contours[detection_index])
+            detected_tracks.add(track_index)
+            assigned_detections.add(detection_index)
+
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in detected_tracks:
+                track.misses += 1
+
+        self.tracks = [track for track in self.tracks if timestamp - track.detected_at <= self.max_coast_sec]
+
+        for detection_index, position in enumerate(positions):
+            if detection_index not in assigned_detections:
+                self.tracks.append(Track(track_id=self.next_track_id, kalman=constant_velocity_kalman(position),
+                                         contour=contours[detection_index], state_at=timestamp,
+                                         detected_at=timestamp))
+                self.next_track_id += 1
+
+        self.updated_at = timestamp
+        return self.tracks
+
+    def select_target(self, current: Optional[Track], aim_point: DegVector) -> Optional[Track]:
+        # The current target while its track lives - identity does not flip to whoever is closest this frame.
+        # Otherwise the detected track closest to the aim point, confirmed tracks first.
+        if current is not None and current in self.tracks:
+            return current
+
+        candidates = [track for track in self.tracks if not track.is_coasting]
+        candidates = [track for track in candidates if track.is_confirmed] or candidates
+        if not candidates:
+            return None
+
+        aim = np.array(aim_point.as_tuple(), dtype=np.float64)
+        return min(candidates, key=lambda track: float(np.hypot(*(track.position - aim))))
+
+    def lead_position(self, track: Track, lead_time_sec=None) -> np.ndarray:
+        # where the track will be once an instruction sent now has moved the beam
+        if not track.is_confirmed:
+            return track.position
+
+        lead_time_sec = self.lead_time_sec if lead_time_sec is None else lead_time_sec
+        lead = track.position_at(track.state_at + lead_time_sec) - track.position
+        lead_distance = float(np.hypot(*lead))
+        if lead_distance > MAX_LEAD_DEG:
+            lead *= MAX_LEAD_DEG / lead_distance
+
+        return track.position + lead
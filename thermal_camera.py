@@ -1,17 +1,28 @@
 from dataclasses import dataclass
 from enum import Enum, StrEnum
-from time import sleep
+from time import sleep, monotonic
 from typing import Union, Iterable, List, Optional
 
 import cv2
+import numpy as np
 
+from contour_batch import ContourBatch, abs_degree_locations, degrees_inside_border
+from ego_motion import EgoMotionEstimator, EgoMotion
+from frame_grabber import FrameGrabber
+from spatial_index import CentroidGrid
 from utills import draw_moving_contours, mark_target_contour, \
-    is_target_in_circle, plant_state_name_in_frame, draw_light_beam, DegVector, Contour, PixelVector
+    is_target_in_circle, plant_state_name_in_frame, draw_light_beam, DegVector, Contour, PixelVector, \
+    PixelVectorArray
 
 BEAM_RADIUS = 42
 MIN_AREA_TO_CONSIDER = 16
 MAX_AREA_TO_CONSIDER = 300
 
+DETECTION_SCALES = (1, 2, 4)  # background subtraction runs on a frame downscaled by this factor
+COARSE_AREA_SLACK = 2  # downscaling blurs small blobs, coarse candidates are kept within a wider area range
+REFINE_DIFF_TH = 16  # gray levels from the previous frame for a full resolution pixel to count as moving
+SPATIAL_INDEX_MIN_CONTOURS = 32  # fewer contours are cheaper to scan than to index
+
 COLOR_RED = (0, 0, 255)
 COLOR_WHITE = (255, 255, 255)
 COLOR_BLACK = (0, 0, 0)
@@ -27,6 +38,12 @@ def is_frame_in_movement(frame_contours: Iterable[Contour], moving_are_th: float
     return area_in_movement > moving_are_th
 
 
+def scaled_area_limits(scale: int):
+    # MIN_AREA_TO_CONSIDER / MAX_AREA_TO_CONSIDER in the pixels of a frame downscaled by `scale`
+    scale_area = scale * scale
+    return MIN_AREA_TO_CONSIDER / scale_area / COARSE_AREA_SLACK, MAX_AREA_TO_CONSIDER / scale_area * COARSE_AREA_SLACK
+
+
 @dataclass
 class ThermalEye:
     cap: cv2.VideoCapture
@@ -39,12 +56,37 @@ class ThermalEye:
     fg_backgorund: cv2.BackgroundSubtractorMOG2
 
     frame: Union[None, cv2.typing.MatLike] = None
-    moving_contours: Optional[List[Contour]] = None
+    moving_contours: Union[None, List[Contour], ContourBatch] = None
+    contour_batch: Optional[ContourBatch] = None
+    moving_area: Optional[int] = None  # foreground pixels in full resolution units, when known without the contours
+    contour_grid: Optional[CentroidGrid] = None  # spatial index of the moving contour centers, built on first query
+    contour_arrays: Optional[tuple] = None  # (centers, areas) of the moving contours, built on first query
+
+    ego_motion_estimator: Optional[EgoMotionEstimator] = None
+    ego_motion: Optional[EgoMotion] = None  # camera shift since the previous frame
+
+    frame_grabber: Optional[FrameGrabber] = None
+    frame_timestamp: Optional[float] = None  # time.monotonic() of the capture
+    dropped_frames: int = 0  # frames dropped by the grabber before the current frame
+
+    # False - the contours are projected from degrees the eye already knows, the calibrated LUT must not map them back
+    uses_degree_lut: bool = True
 
-    def __init__(self, video_input):
-        self.cap = cv2.VideoCapture(video_input)
-        self.FRAME_W = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.FRAME_H = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    def __init__(self, video_input, threaded_capture=False, use_contour_batch=False, detection_scale=1,
+                 use_ego_motion=False, compensate_ego_motion=False):
+        # anything with the VideoCapture read/get/release interface can stand in for a camera (see RecordingCapture)
+        self.cap = video_input if hasattr(video_input, 'read') else cv2.VideoCapture(video_input)
+        self._init_state(int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         use_contour_batch=use_contour_batch, detection_scale=detection_scale,
+                         use_ego_motion=use_ego_motion, compensate_ego_motion=compensate_ego_motion)
+
+        self.frame_grabber = FrameGrabber(self.cap).start() if threaded_capture else None
+
+    def _init_state(self, frame_w, frame_h, use_contour_batch=False, detection_scale=1, use_ego_motion=False,
+                    compensate_ego_motion=False):
+        # Frame geometry and detection state without a capture - eyes fed by other processes call it instead of
+        # __init__ (see PooledThermalEye, PipelineThermalEye)
+        self.FRAME_W, self.FRAME_H = frame_w, frame_h
 
         self.BEAM_CENTER_POINT = PixelVector(x=self.FRAME_W // 2, y=self.FRAME_H // 2)
 
@@ -53,6 +95,26 @@ class ThermalEye:
 
         self.fg_backgorund = cv2.createBackgroundSubtractorMOG2(history=2)
 
+        self.use_contour_batch = use_contour_batch
+
+        # detection_scale > 1 - MOG2 and contour extraction on a downscaled gray frame,
+        # candidate boxes are refined at full resolution inside their ROI
+        if detection_scale not in DETECTION_SCALES:
+            raise ValueError(f'detection_scale must be one of {DETECTION_SCALES}')
+        self.detection_scale = detection_scale
+        self.refined_mask = np.zeros((self.FRAME_H, self.FRAME_W), np.uint8) if detection_scale > 1 else None
+        self.previous_gray = None
+
+        # camera movement from the global frame shift instead of the MOG2 foreground area
+        self.ego_motion_estimator = EgoMotionEstimator() if use_ego_motion or compensate_ego_motion else None
+
+        # the background model follows the camera - no dead frames while MOG2 re-learns after a move
+        self.compensate_ego_motion = compensate_ego_motion
+        self.previous_model_input = None
+
+        # content shift (pixels) summed over the moving frames since reset_camera_shift - mid move dead reckoning
+        self.camera_shift = np.zeros(2)
+
     def find_closest_target(self, contours):
         if not contours:
             return None
@@ -70,6 +132,60 @@ class ThermalEye:
 
         return closest
 
+    def get_contour_arrays(self):
+        # integer centers (same as Contour.center_point) and (N,) areas of the moving contours, largest first
+        if self.contour_arrays is None:
+            if isinstance(self.moving_contours, ContourBatch):
+                centers, areas = self.moving_contours.center_points, self.moving_contours.area
+            else:
+                boxes = np.array([(c.x, c.y, c.w, c.h, c.area) for c in self.moving_contours or []],
+                                 dtype=np.int64).reshape(-1, 5)
+                x, y, w, h, areas = boxes.T
+                centers = np.stack([x + w // 2, y + h // 2], axis=1)
+            self.contour_arrays = PixelVectorArray(centers), areas
+        return self.contour_arrays
+
+    def get_contour_grid(self) -> CentroidGrid:
+        if self.contour_grid is None:
+            centers, _ = self.get_contour_arrays()
+            self.contour_grid = CentroidGrid(centers.xy, self.FRAME_W, self.FRAME_H)
+        return self.contour_grid
+
+    def indices_within(self, radius) -> np.ndarray:
+        # indices of the moving contours closer than radius to the beam center, largest first
+        centers, _ = self.get_contour_arrays()
+        if radius > self.BEAM_CENTER_POINT.distance(PixelVector(0, 0)) + 1:
+            return np.arange(len(centers))
+        if len(centers) < SPATIAL_INDEX_MIN_CONTOURS:
+            return np.flatnonzero(centers.distances(self.BEAM_CENTER_POINT) < radius)
+
+        return self.get_contour_grid().query_radius(self.BEAM_CENTER_POINT.as_tuple(), radius)
+
+    def contours_within(self, radius) -> List[Contour]:
+        # moving contours closer than radius to the beam center, largest first
+        return [self.moving_contours[i] for i in self.indices_within(radius)]
+
+    def rank_candidates(self, frame_deg_coordinate: DegVector, search_radius, degree_lut=None, top_x=3):
+        """
+        Target candidates in a few array operations instead of Contour by Contour - the moving contours inside the
+        beam limits, the area range and the search radius, largest first. Same results as the per contour filter
+        followed by find_closest_target on the top_x.
+        Returns (candidate indices, largest index, closest index) into moving_contours, None indices when empty.
+        """
+        indices = self.indices_within(search_radius)
+        centers, areas = self.get_contour_arrays()
+        centers, areas = centers[indices], areas[indices]
+
+        degrees = abs_degree_locations(centers.xy, self.BEAM_CENTER_POINT, frame_deg_coordinate, degree_lut)
+        is_candidate = degrees_inside_border(degrees) & (MIN_AREA_TO_CONSIDER < areas) & (areas < MAX_AREA_TO_CONSIDER)
+        indices, centers = indices[is_candidate], centers[is_candidate]
+        if not len(indices):
+            return indices, None, None
+
+        # first minimum of the truncated distances, like the find_closest_target scan
+        closest = int(np.argmin(centers[:top_x].distances(self.BEAM_CENTER_POINT)))
+        return indices, int(indices[0]), int(indices[closest])
+
     def is_contour_in_frame(self, contour: Contour) -> bool:
         # TODO - add to determine logic.
         is_contour_in_frame = self.frame
@@ -79,18 +195,163 @@ class ThermalEye:
     def is_cam_in_movement(self, update_frame=False):
         if update_frame:
             self.update_frame()
+        if self.ego_motion_estimator is not None:
+            return self.ego_motion_estimator.is_moving
+        if self.moving_area is not None:
+            return self.moving_area > self.IN_MOVEMENT_TH
         return is_frame_in_movement(self.moving_contours, self.IN_MOVEMENT_TH)
 
+    def reset_camera_shift(self, deg_coordinate: Optional[DegVector] = None):
+        # the camera position is known again (a move ended) - deg_coordinate is for eyes that project into
+        # degrees themselves (see PooledThermalEye)
+        self.camera_shift[:] = 0
+
+    def foreground_area(self):
+        if self.moving_area is not None:
+            return self.moving_area
+        return sum(c.area for c in self.moving_contours or [])
+
+    def is_blind(self):
+        # The frame cannot be analyzed. A moving camera blinds the tower, unless the background model follows it.
+        if not self.compensate_ego_motion or self.ego_motion is None or not self.ego_motion.is_reliable:
+            return self.is_cam_in_movement()
+        return self.foreground_area() > self.IN_MOVEMENT_TH
+
     def close_eye(self):
+        if self.frame_grabber:
+            self.frame_grabber.stop()
         self.cap.release()
         cv2.destroyAllWindows()
 
+    def read_frame(self):
+        if not self.frame_grabber:
+            ret, frame = self.cap.read()
+            self.frame_timestamp = monotonic()
+            self.dropped_frames = 0
+            return frame
+
+        grabbed = self.frame_grabber.read_latest()
+        if grabbed is None:
+            return None
+
+        self.frame_timestamp = grabbed.timestamp
+        self.dropped_frames = grabbed.dropped
+        return grabbed.frame
+
     def update_frame(self):
-        ret, frame = self.cap.read()
+        frame = self.read_frame()
         self.frame = frame
+        self.contour_grid = None
+        self.contour_arrays = None
+
+        if frame is None:
+            # end of stream / camera disconnected
+            self.moving_contours = []
+            self.contour_batch = None
+            self.moving_area = None
+            self.ego_motion = None
+            return
+
+        if self.ego_motion_estimator is not None:
+            self.ego_motion = self.ego_motion_estimator.update(frame)
+            if self.ego_motion is not None and self.ego_motion.is_reliable and self.ego_motion_estimator.is_moving:
+                self.camera_shift += self.ego_motion.as_tuple()
 
-        fg_mask = self.fg_backgorund.apply(frame)
-        th = cv2.threshold(fg_mask, 0, 100, cv2.THRESH_BINARY)[1]
+        if self.detection_scale > 1:
+            th = self.downscaled_foreground_mask(frame)
+        else:
+            fg_mask = self.apply_background_model(frame)
+            th = cv2.threshold(fg_mask, 0, 100, cv2.THRESH_BINARY)[1]
+            self.moving_area = None
+
+        if self.use_contour_batch:
+            # moving_contours yields lazy Contour views of the batch
+            self.contour_batch = ContourBatch.from_mask(th, self.BEAM_CENTER_POINT)
+            self.moving_contours = self.contour_batch
+            if self.detection_scale == 1:
+                self.moving_area = self.contour_batch.total_area
+            return
 
         contours, hierarchy = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
         self.moving_contours = sorted([Contour(c, self.BEAM_CENTER_POINT) for c in contours], key=lambda c: -c.area)
+
+    def motion_compensated(self, previous_image, image):
+        # previous_image moved by the camera shift onto image, the uncovered border is taken from image.
+        # None when the camera did not move - sub pixel jitter is left to the background model.
+        ego_motion = self.ego_motion
+        if (not self.compensate_ego_motion or ego_motion is None or not ego_motion.is_reliable
+                or not self.ego_motion_estimator.is_moving
+                or previous_image is None or previous_image.shape != image.shape):
+            return None
+
+        scale = image.shape[1] / self.FRAME_W
+        shift = np.float32([[1, 0, ego_motion.dx * scale], [0, 1, ego_motion.dy * scale]])
+        return cv2.warpAffine(previous_image, shift, (image.shape[1], image.shape[0]), dst=image.copy(),
+                              flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_TRANSPARENT)
+
+    def apply_background_model(self, image):
+        """
+        MOG2 foreground of image (the frame, or the downscaled gray frame).
+        With compensate_ego_motion, after a camera shift the model is re-seeded from the previous input
+        aligned to the current view, so only what moved in the scene is foreground - during and right after moves.
+        """
+        if not self.compensate_ego_motion:
+            return self.fg_backgorund.apply(image)
+
+        aligned_previous = self.motion_compensated(self.previous_model_input, image)
+        if aligned_previous is not None:
+            self.fg_backgorund.apply(aligned_previous, learningRate=1)  # 1 - the model restarts from this image
+
+        self.previous_model_input = image.copy()
+        return self.fg_backgorund.apply(image)
+
+    def downscaled_foreground_mask(self, frame):
+        """
+        Full resolution foreground mask holding only the refined candidates.
+        MOG2 runs on the gray frame downscaled by detection_scale, blobs within the scaled target area limits
+        are re-thresholded at full resolution inside their ROI. With history=2 MOG2 is close to a difference
+        from the last frame, so the ROI is compared with the previous full resolution frame.
+        """
+        scale = self.detection_scale
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame.copy()
+        previous_gray, self.previous_gray = self.previous_gray, gray
+        small = cv2.resize(gray, (self.FRAME_W // scale, self.FRAME_H // scale), interpolation=cv2.INTER_AREA)
+
+        small_fg_mask = self.apply_background_model(small)
+        small_th = cv2.threshold(small_fg_mask, 0, 100, cv2.THRESH_BINARY)[1]
+        coarse = ContourBatch.from_mask(small_th, self.BEAM_CENTER_POINT)
+
+        refined_mask = self.refined_mask
+        refined_mask.fill(0)
+
+        self.moving_area = coarse.total_area * scale * scale
+        if self.moving_area > self.IN_MOVEMENT_TH:
+            return refined_mask  # camera movement - the frame is not analyzed anyway
+
+        min_area, max_area = scaled_area_limits(scale)
+        candidates = np.flatnonzero((coarse.area >= min_area) & (coarse.area <= max_area))
+        if not len(candidates) or previous_gray is None or previous_gray.shape != gray.shape:
+            return refined_mask
+
+        compensated_gray = self.motion_compensated(previous_gray, gray)
+        previous_gray = previous_gray if compensated_gray is None else compensated_gray
+
+        for i in candidates:
+            x, y, w, h = int(coarse.x[i]), int(coarse.y[i]), int(coarse.w[i]), int(coarse.h[i])
+
+            # one coarse pixel of margin around the box
+            x0, y0 = max((x - 1) * scale, 0), max((y - 1) * scale, 0)
+            x1, y1 = min((x + w + 1) * scale, self.FRAME_W), min((y + h + 1) * scale, self.FRAME_H)
+
+            diff = cv2.absdiff(gray[y0:y1, x0:x1], previous_gray[y0:y1, x0:x1])
+            roi_th = cv2.threshold(diff, REFINE_DIFF_TH, 100, cv2.THRESH_BINARY)[1]
+            if not roi_th.any():
+                # nothing stands out at full resolution - keep the coarse blob
+                x0, y0 = x * scale, y * scale
+                x1, y1 = min((x + w) * scale, self.FRAME_W), min((y + h) * scale, self.FRAME_H)
+                roi_th = cv2.resize(small_th[y:y + h, x:x + w], (w * scale, h * scale),
+                                    interpolation=cv2.INTER_NEAREST)[:y1 - y0, :x1 - x0]
+
+            np.maximum(refined_mask[y0:y1, x0:x1], roi_th, out=refined_mask[y0:y1, x0:x1])
+
+        return refined_mask
@@ -1,6 +1,6 @@
 import math
 from dataclasses import dataclass
-from functools import cached_property
+from functools import cached_property, lru_cache
 from typing import Sequence, Self, Optional
 
 import numpy as np
@@ -13,8 +13,9 @@ Y_PIXEL_TO_DEGREE_NORM_CONST = 11
 X_PIXEL_TO_DEGREE_NORM_CONST = 13
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DegVector:
+    # immutable - a coordinate handed to move_to or stored as a goal can be shared without copies
     x: int = 90
     y: int = 0
 
@@ -29,6 +30,9 @@ class DegVector:
     def __eq__(self, other):
         return self.x == other.x and self.y == other.y
 
+    def __hash__(self):
+        return hash((self.x, self.y))
+
     def __sub__(self, other):
         return DegVector(self.x - other.x, self.y - other.y)
 
@@ -42,8 +46,12 @@ class DegVector:
     def is_inside_border(self):
         return DEGREES_X_MIN < self.x < DEGREES_X_MAX and DEGREES_Y_MIN < self.y < DEGREES_Y_MAX
 
+    def within_limits(self) -> Self:
+        return DegVector(x=get_value_within_limits(self.x, bottom=DEGREES_X_MIN, top=DEGREES_X_MAX),
+                         y=get_value_within_limits(self.y, bottom=DEGREES_Y_MIN, top=DEGREES_Y_MAX))
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class PixelVector:
     x: int
     y: int
@@ -61,6 +69,9 @@ class PixelVector:
     def __eq__(self, other):
         return self.x == other.x and self.y == other.y
 
+    def __hash__(self):
+        return hash((self.x, self.y))
+
     def __sub__(self, other):
         return PixelVector(self.x - other.x, self.y - other.y)
 
@@ -71,6 +82,87 @@ class PixelVector:
         return self.as_tuple().__str__()
 
 
+class _VectorArray:
+    """
+    (N, 2) int64 array of (x, y) - the batch counterpart of a vector type, one object per frame instead of
+    one per contour. Arithmetic takes another array of the same length, a single vector or a (x, y) tuple.
+    """
+    __slots__ = ('xy',)
+    vector_type = None
+
+    def __init__(self, xy):
+        self.xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        return cls([v.as_tuple() for v in vectors])
+
+    @staticmethod
+    def _as_xy(other):
+        if isinstance(other, _VectorArray):
+            return other.xy
+        if hasattr(other, 'as_tuple'):
+            return np.array(other.as_tuple(), dtype=np.int64)
+        return np.asarray(other, dtype=np.int64)
+
+    @property
+    def x(self):
+        return self.xy[:, 0]
+
+    @property
+    def y(self):
+        return self.xy[:, 1]
+
+    def __len__(self):
+        return len(self.xy)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return self.vector_type(int(self.xy[i, 0]), int(self.xy[i, 1]))
+        return type(self)(self.xy[i])
+
+    def __iter__(self):
+        for x, y in self.xy.tolist():
+            yield self.vector_type(x, y)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.xy if dtype is None else self.xy.astype(dtype)
+
+    def __eq__(self, other):
+        return np.array_equal(self.xy, self._as_xy(other))
+
+    __hash__ = None
+
+    def __sub__(self, other):
+        return type(self)(self.xy - self._as_xy(other))
+
+    def __add__(self, other):
+        return type(self)(self.xy + self._as_xy(other))
+
+    def distances(self, other):
+        # Vectorized distance - whole units, truncated
+        offsets = self.xy - self._as_xy(other)
+        return np.sqrt((offsets ** 2).sum(axis=1)).astype(np.int64)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.xy.tolist()})'
+
+
+class DegVectorArray(_VectorArray):
+    __slots__ = ()
+    vector_type = DegVector
+
+    @property
+    def is_inside_border(self):
+        x, y = self.x, self.y
+        return (DEGREES_X_MIN < x) & (x < DEGREES_X_MAX) & (DEGREES_Y_MIN < y) & (y < DEGREES_Y_MAX)
+
+
+class PixelVectorArray(_VectorArray):
+    __slots__ = ()
+    vector_type = PixelVector
+
+
 @dataclass
 class Contour:
     frame_middle_point: PixelVector  # Beam center
@@ -94,6 +186,16 @@ class Contour:
         self.x, self.y, self.w, self.h = cv2.boundingRect(c)
         self.frame_middle_point = frame_middle_point
 
+    @classmethod
+    def from_stats(cls, x, y, w, h, area, frame_middle_point=None):
+        # Contour without the points object - bounding rect and area are already known (see ContourBatch)
+        contour = cls.__new__(cls)
+        contour.obj = None
+        contour.x, contour.y, contour.w, contour.h = x, y, w, h
+        contour.area = area
+        contour.frame_middle_point = frame_middle_point
+        return contour
+
     @cached_property
     def center_point(self):
         return PixelVector(x=int(self.x + self.w // 2), y=int(self.y + self.h // 2))
@@ -115,7 +217,9 @@ class Contour:
         return PixelVector(x=self.frame_middle_point.x - self.center_point.x,
                            y=self.frame_middle_point.y - self.center_point.y)
 
-    def get_abs_degree_location(self, frame_degree):
+    def get_abs_degree_location(self, frame_degree, degree_lut=None):
+        if degree_lut is not None:
+            return degree_lut.get_abs_degree_location(frame_degree, self.center_point)
 
         y_degree_delta = self.direction_vector.y / Y_PIXEL_TO_DEGREE_NORM_CONST
         x_degree_delta = self.direction_vector.x / X_PIXEL_TO_DEGREE_NORM_CONST
@@ -191,7 +295,7 @@ def draw_moving_contours(frame, contours):
         return frame
 
     for contour in contours:
-        x, y, w, h = cv2.boundingRect(contour.obj)
+        x, y, w, h = contour.x, contour.y, contour.w, contour.h
         cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
 
     return frame
@@ -201,23 +305,58 @@ def is_target_in_circle(frame, target_c: Contour):
     if not target_c:
         return False
 
-    mask_frame = np.zeros(frame.shape)
     center_of_circle = (frame.shape[1] // 2, frame.shape[0] // 2)
+    target_rect = (target_c.x, target_c.y, target_c.w, target_c.h)
+
+    return bool(rects_circle_overlap(target_rect, center_of_circle, BEAM_RADIUS, frame.shape)[0])
+
+
+@lru_cache(maxsize=8)
+def _circle_rows_half_width(radius):
+    # Half width of every pixel row of a filled cv2.circle - matches its rasterization (dx^2 + dy^2 <= r^2).
+    dy = np.arange(-radius, radius + 1)
+    half_width = np.array([math.isqrt(radius * radius - int(d) * int(d)) for d in dy])
+    return dy, half_width
+
+
+def rects_circle_overlap(rects, center, radius, frame_shape=None, return_area=False):
+    """
+    Geometric replacement for drawing a filled circle and filled rectangles on a mask and comparing sums.
+    rects - (x, y, w, h) or an (N, 4) array of bounding rects, drawn inclusive like cv2.rectangle.
+    Returns a bool array of rects touching the circle, and the overlapping pixels count per rect if return_area.
+    """
+    rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+    cx, cy = center
+
+    x0, y0 = rects[:, 0], rects[:, 1]
+    x1, y1 = x0 + rects[:, 2], y0 + rects[:, 3]
+
+    if frame_shape is not None:
+        frame_h, frame_w = frame_shape[0], frame_shape[1]
+        x0, x1 = np.maximum(x0, 0), np.minimum(x1, frame_w - 1)
+        y0, y1 = np.maximum(y0, 0), np.minimum(y1, frame_h - 1)
 
-    cv2.circle(mask_frame, center_of_circle, BEAM_RADIUS, COLOR_WHITE, FULL_SHAPE_THICKNESS)
+    is_rect_valid = (x0 <= x1) & (y0 <= y1)
 
-    beam_mask_frame_sum = mask_frame.sum()
+    # closest rect pixel to the circle center
+    dx = np.clip(cx, x0, x1) - cx
+    dy = np.clip(cy, y0, y1) - cy
+    is_overlapping = is_rect_valid & (dx * dx + dy * dy <= radius * radius)
 
-    cv2.rectangle(mask_frame,
-                  target_c.top_left_point.as_tuple(),
-                  target_c.bottom_right_point.as_tuple(),
-                  COLOR_BLACK, FULL_SHAPE_THICKNESS)
+    if not return_area:
+        return is_overlapping
 
-    beam_and_target_frame_sum = mask_frame.sum()
+    rows_dy, rows_half_width = _circle_rows_half_width(radius)
+    rows_y = cy + rows_dy
 
-    return beam_mask_frame_sum != beam_and_target_frame_sum
+    is_row_in_rect = (rows_y >= y0[:, None]) & (rows_y <= y1[:, None])
+    row_start = np.maximum(cx - rows_half_width, x0[:, None])
+    row_end = np.minimum(cx + rows_half_width, x1[:, None])
 
+    row_overlap = np.clip(row_end - row_start + 1, 0, None) * is_row_in_rect
+    overlap_area = np.where(is_rect_valid, row_overlap.sum(axis=1), 0)
 
+    return is_overlapping, overlap_area
 
 
 def mark_target_contour(frame, center_point: DegVector, target_c: Contour):